@@ -1,34 +1,571 @@
 """Tools to load and save cached ukechords data"""
 
+import json
+import mmap
 import os
-import pickle
-from math import ceil
+import re
+import struct
+from array import array
+from collections.abc import Callable, Sequence
+from itertools import chain
 from pathlib import Path
+from typing import NamedTuple
 
 from .config import UkeConfig
-from .theory_basic import ChordCollection
+from .profiling import memory_checkpoint
+from .stats import add_count
+from .theory_basic import (
+    ChordCollection,
+    PackedShapes,
+    PitchClassSet,
+    ShapeList,
+    ShapeScores,
+    normalize_tuning,
+    transpose_chord,
+    transpose_mask,
+)
+from .types import CacheEntry, ChordTable
 
+# Scanned chord caches are laid out as:
+#  - a header (see _HEADER)
+#  - a JSON index of [chord, first shape, shape count] entries
+#  - every shape, as one signed byte per string, grouped by chord
+#  - each shape's ShapeScores, as three native doubles, 8-byte aligned
+#
+# Caches are stored for the tuning transposed to start on C (see
+# normalize_tuning), with chord names and sets of notes transposed to
+# match, so that tunings which are transpositions of each other share
+# them. Loading a cache for a tuning transposes chord names back.
+_MAGIC = b"UKECHRDS"
+_FORMAT_VERSION = 3
+_HEADER = struct.Struct("<8sHHIQ")  # magic, version, strings, index length, shape count
+_SCORES_SIZE = 3 * 8
 
-def _cached_filename(config: UkeConfig, max_fret: int, max_difficulty: float) -> str:
-    tn_string = "".join(config.tuning)
-    filename = f"cache_m{config.mute}_{max_fret}_{tn_string}_{int(max_difficulty)}.pcl"
+# The most caches of scans limited to notes to keep: one is saved for
+# each set of notes scanned for, so the oldest are removed beyond this
+MAX_NOTES_CACHES = 32
+
+
+def _cached_filename(
+    config: UkeConfig, max_fret: int, max_difficulty: float, notes: PitchClassSet | None = None
+) -> str:
+    tn_string = "".join(normalize_tuning(config.tuning)[0])
+    # The exact difficulty, so that scans to fractionally different ones
+    # don't share a file, keeping the names of whole difficulties as they were
+    difficulty = repr(float(max_difficulty)).removesuffix(".0")
+    filename = f"cache_m{config.mute}_{max_fret}_{tn_string}_{difficulty}"
+    if (stored_notes := _stored_notes(config, notes)) is not None:
+        filename += f"_n{stored_notes:03x}"
+    return os.path.join(config.cache_dir, f"{filename}.ukc")
+
+
+def _stored_notes(config: UkeConfig, notes: PitchClassSet | None) -> PitchClassSet | None:
+    """Return a set of notes for the configured tuning, as stored in caches"""
+    return None if notes is None else transpose_mask(notes, -normalize_tuning(config.tuning)[1])
+
+
+class MappedShapes(PackedShapes):
+    """The shapes for one chord in a memory-mapped cache file, decoded only when accessed"""
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self, buffer: mmap.mmap, strings: int, offset: int, count: int, scores_offset: int
+    ) -> None:
+        super().__init__(strings)
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+        self._scores_offset = scores_offset
+
+    @property
+    def scores(self) -> Sequence[float]:
+        """The precomputed ShapeScores of each shape"""
+        start = self._scores_offset
+        add_count("cache_bytes_read", self._count * _SCORES_SIZE)
+        return memoryview(self._buffer)[start : start + self._count * _SCORES_SIZE].cast("d")
+
+    def frets(self, start: int = 0, stop: int | None = None) -> memoryview:
+        stop = self._count if stop is None else stop
+        base = self._offset + start * self.strings
+        add_count("cache_bytes_read", (stop - start) * self.strings)
+        return memoryview(self._buffer)[base : base + (stop - start) * self.strings]
+
+    def __len__(self) -> int:
+        return self._count
+
+
+# Identifies the version of a file on disk: its inode, size, and modification time
+_FileKey = tuple[int, int, int]
+
+# Cache files and manifests already read by this process, along with
+# the version of the file they were read from, so that a long-running
+# process only rereads them once they change. Mappings of cache files
+# which have since been removed or replaced are dropped whenever a
+# manifest changes, so that they don't hold on to the old files.
+_mapped_caches: dict[str, tuple[_FileKey, dict[str, MappedShapes] | None]] = {}
+_manifests: dict[str, tuple[_FileKey, list[CacheEntry]]] = {}
+
+
+def _get_file_key(filename: str) -> _FileKey | None:
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _map_cache(filename: str) -> dict[str, MappedShapes] | None:
+    """
+    Memory map a scanned chords cache file, returning its shapes by
+    chord. The mapping is reused until the file changes.
+    """
+    if (key := _get_file_key(filename)) is None:
+        _mapped_caches.pop(filename, None)
+        return None
+    if (mapped := _mapped_caches.get(filename)) is not None and mapped[0] == key:
+        return mapped[1]
+    cached = _read_mapped_cache(filename)
+    _mapped_caches[filename] = key, cached
+    return cached
+
+
+def _drop_stale_mappings() -> None:
+    """Drop the mappings of cache files which have been removed or replaced since being mapped"""
+    for filename, (key, _) in list(_mapped_caches.items()):
+        if _get_file_key(filename) != key:
+            del _mapped_caches[filename]
+
+
+def _read_mapped_cache(filename: str) -> dict[str, MappedShapes] | None:
+    """
+    Memory map a scanned chords cache file and read its index,
+    returning its shapes by chord, or None if it can't be read (or is
+    corrupt, or shorter than its header says).
+    """
+    try:
+        with open(filename, "rb") as cache:
+            buffer = mmap.mmap(cache.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, strings, index_length, shape_count = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            return None
+        shapes_offset = _HEADER.size + index_length
+        scores_offset = shapes_offset + shape_count * strings
+        scores_offset += -scores_offset % 8
+        if len(buffer) < scores_offset + shape_count * _SCORES_SIZE:
+            return None
+        add_count("cache_bytes_read", shapes_offset)
+        index = [
+            (str(chord), int(first), int(count))
+            for chord, first, count in json.loads(buffer[_HEADER.size : shapes_offset])
+        ]
+    except (OSError, ValueError, TypeError, struct.error):
+        return None
+    if not all(
+        first >= 0 and count >= 0 and first + count <= shape_count for _, first, count in index
+    ):
+        return None
+    return {
+        chord: MappedShapes(
+            buffer,
+            strings,
+            shapes_offset + first * strings,
+            count,
+            scores_offset + first * _SCORES_SIZE,
+        )
+        for chord, first, count in index
+    }
+
+
+def _write_cache(
+    filename: str,
+    strings: int,
+    chord_shapes: ChordCollection,
+    shape_scores: Callable[[tuple[int, ...]], ShapeScores] | None,
+) -> None:
+    """
+    Write chord/shapes (and each shape's ShapeScores) to a cache file.
+    Packed shapes are written as they are, along with their scores if
+    known. shape_scores is only needed for shapes whose scores aren't.
+    """
+    index = []
+    count = 0
+    frets, scores = array("b"), array("d")
+    for chord, shapes in chord_shapes.items():
+        index.append((chord, count, len(shapes)))
+        count += len(shapes)
+        if isinstance(shapes, PackedShapes) and shapes.strings == strings:
+            frets.frombytes(shapes.frets())
+        else:
+            frets.extend(chain.from_iterable(shapes))
+        if isinstance(shapes, PackedShapes) and shapes.scores is not None:
+            scores.extend(shapes.scores)
+        elif shape_scores is None:
+            raise ValueError(f"The scores of the shapes for {chord} aren't known")
+        else:
+            scores.extend(chain.from_iterable(map(shape_scores, shapes)))
+    index_bytes = json.dumps(index, separators=(",", ":")).encode()
+    header = _HEADER.pack(_MAGIC, _FORMAT_VERSION, strings, len(index_bytes), count)
+    padding = bytes(-(len(header) + len(index_bytes) + len(frets)) % 8)
+    memory_checkpoint()
+    with open(f"{filename}.tmp", "wb") as cache:
+        cache.writelines((header, index_bytes, frets, padding, scores))
+    os.replace(f"{filename}.tmp", filename)
+
+
+def _manifest_filename(config: UkeConfig) -> str:
+    return os.path.join(config.cache_dir, "manifest.json")
+
+
+def _load_manifest(config: UkeConfig) -> list[CacheEntry]:
+    """Return the entries of the cache manifest which list a cache file that still exists"""
+    filename = _manifest_filename(config)
+    if (key := _get_file_key(filename)) is None:
+        return []
+    if (manifest := _manifests.get(filename)) is not None and manifest[0] == key:
+        entries = manifest[1]
+    else:
+        entries = _read_manifest(filename)
+        _manifests[filename] = key, entries
+        _drop_stale_mappings()
+    return [e for e in entries if os.path.exists(os.path.join(config.cache_dir, e["file"]))]
+
+
+def _read_manifest(filename: str) -> list[CacheEntry]:
+    try:
+        with open(filename, encoding="utf-8") as manifest:
+            add_count("cache_bytes_read", os.fstat(manifest.fileno()).st_size)
+            entries: list[CacheEntry] = json.load(manifest)["caches"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return []
+    return entries
+
+
+def _save_manifest(config: UkeConfig, entries: list[CacheEntry]) -> None:
+    filename = _manifest_filename(config)
+    with open(f"{filename}.tmp", "w", encoding="utf-8") as manifest:
+        json.dump({"caches": entries}, manifest, indent=1)
+    os.replace(f"{filename}.tmp", filename)
+
+
+def _get_tuning_entries(config: UkeConfig) -> list[CacheEntry]:
+    """
+    Return the manifest entries of current-format caches for the
+    configured tuning, or any transposition of it
+    """
+    tuning = normalize_tuning(config.tuning)[0]
+    return [
+        entry
+        for entry in _load_manifest(config)
+        if entry["format"] == _FORMAT_VERSION and tuple(entry["tuning"]) == tuning
+    ]
+
+
+def _find_cache(
+    config: UkeConfig, max_fret: int, notes: PitchClassSet | None = None
+) -> CacheEntry | None:
+    """
+    Return the manifest entry of the smallest cache holding every shape
+    a scan with the given configuration would find: one for the same
+    tuning, scanned at least as far up the neck, to at least the same
+    difficulty, and with muting if this scan uses it.
+
+    If notes (as stored in caches) is specified, the scan is limited to
+    shapes playing no other notes, so caches of scans limited to any
+    superset of those notes are suitable too.
+    """
+    candidates = [
+        entry
+        for entry in _get_tuning_entries(config)
+        if (entry["notes"] is None or (notes is not None and notes & ~entry["notes"] == 0))
+        and (entry["mute"] or not config.mute)
+        and entry["max_fret"] >= max_fret
+        and entry["max_difficulty"] >= config.max_difficulty
+    ]
+    return min(candidates, key=lambda entry: entry["shapes"], default=None)
+
+
+def _filter_cached_shapes(
+    config: UkeConfig,
+    shapes: MappedShapes,
+    max_fret: int,
+    shape_filter: Callable[[tuple[int, ...]], bool] | None,
+) -> dict[tuple[int, ...], ShapeScores]:
+    """Return the cached shapes a scan with the given configuration
+    would find, along with their scores"""
+    return {
+        shape: scores
+        for shape, scores in zip(shapes, shapes.iter_scores() or ())
+        if scores[0] <= config.max_difficulty
+        and max(shape) <= max_fret
+        and (config.mute or min(shape) >= 0)
+        and (shape_filter is None or shape_filter(shape))
+    }
+
+
+def _is_exact(
+    config: UkeConfig, entry: CacheEntry, max_fret: int, notes: PitchClassSet | None
+) -> bool:
+    """
+    Identify if a cache was built for exactly the scan the given
+    configuration would do, limited to notes (as stored in caches)
+    """
+    return (
+        entry["mute"] == config.mute
+        and entry["max_fret"] == max_fret
+        and entry["max_difficulty"] == config.max_difficulty
+        and entry["notes"] == notes
+    )
+
+
+def load_scanned_chords(
+    config: UkeConfig,
+    chord_shapes: ChordCollection,
+    max_fret: int,
+    notes: PitchClassSet | None = None,
+    shape_filter: Callable[[tuple[int, ...]], bool] | None = None,
+) -> bool:
+    """
+    Load cached chords/shapes from disk, from the smallest cache listed
+    in the cache manifest which covers the requested scan. If notes is
+    specified, the scan is limited to shapes which play no other notes,
+    as identified by shape_filter.
+
+    The cache file is memory mapped. When it was built for exactly
+    this scan, the shapes for each chord are only read from it when
+    that chord is looked up. Otherwise, its shapes are filtered down
+    to those this scan would have found. If config.save_derived is
+    set, a filtered scan is saved as its own cache.
+    """
+    stored_notes = _stored_notes(config, notes)
+    if (entry := _find_cache(config, max_fret, stored_notes)) is None:
+        add_count("cache_misses")
+        return False
+    if (cached := _map_cache(os.path.join(config.cache_dir, entry["file"]))) is None:
+        add_count("cache_misses")
+        return False
+    add_count("cache_hits")
+    exact = _is_exact(config, entry, max_fret, stored_notes)
+    if entry["notes"] == stored_notes:
+        shape_filter = None
+    offset = normalize_tuning(config.tuning)[1]
+    for chord, shapes in cached.items():
+        if exact:
+            chord_shapes[transpose_chord(chord, offset)] = shapes
+        elif filtered := _filter_cached_shapes(config, shapes, max_fret, shape_filter):
+            filtered_shapes = ShapeList(shapes.strings, filtered, filtered.values())
+            chord_shapes[transpose_chord(chord, offset)] = filtered_shapes
+    if not exact and config.save_derived:
+        save_scanned_chords(config, chord_shapes, max_fret, notes=notes)
+    return True
+
+
+def load_cached_chord(
+    config: UkeConfig, chord: str, max_fret: int, notes: PitchClassSet
+) -> ShapeList | None:
+    """
+    Load the cached shapes for a single chord (made of the specified
+    notes) from disk, from the smallest cache listed in the cache
+    manifest which covers a scan for it. Only that chord's shapes are
+    read from the cache file.
+
+    Return None if there's no such cache.
+    """
+    if (entry := _find_cache(config, max_fret, _stored_notes(config, notes))) is None:
+        add_count("cache_misses")
+        return None
+    if (cached := _map_cache(os.path.join(config.cache_dir, entry["file"]))) is None:
+        add_count("cache_misses")
+        return None
+    add_count("cache_hits")
+    stored_chord = transpose_chord(chord, -normalize_tuning(config.tuning)[1])
+    if (shapes := cached.get(stored_chord)) is None:
+        return ShapeList(len(config.tuning), scores=())
+    if _is_exact(config, entry, max_fret, entry["notes"]):
+        return ShapeList.from_packed(shapes)
+    filtered = _filter_cached_shapes(config, shapes, max_fret, None)
+    return ShapeList(shapes.strings, filtered, filtered.values())
+
+
+def load_extendable_chords(
+    config: UkeConfig, chord_shapes: ChordCollection, max_fret: int
+) -> tuple[int, float] | None:
+    """
+    Load cached chords/shapes from disk, from the largest cache listed
+    in the cache manifest that the requested scan extends: one for the
+    same tuning (or a transposition of it) and muting, scanned no
+    further up the neck and to no higher difficulty.
+
+    Return the max_fret and max_difficulty that cache was scanned
+    with, or None if there's no such cache.
+    """
+    candidates = [
+        entry
+        for entry in _get_tuning_entries(config)
+        if entry["notes"] is None
+        and entry["mute"] == config.mute
+        and entry["max_fret"] <= max_fret
+        and entry["max_difficulty"] <= config.max_difficulty
+    ]
+    if (entry := max(candidates, key=lambda entry: entry["shapes"], default=None)) is None:
+        return None
+    if (cached := _map_cache(os.path.join(config.cache_dir, entry["file"]))) is None:
+        return None
+    offset = normalize_tuning(config.tuning)[1]
+    for chord, shapes in cached.items():
+        chord_shapes[transpose_chord(chord, offset)] = ShapeList.from_packed(shapes)
+    return entry["max_fret"], entry["max_difficulty"]
+
+
+def _list_cache(config: UkeConfig, entry: CacheEntry, replaces: tuple[int, float] | None) -> None:
+    """
+    List a cache in the cache manifest, removing the cache it replaces
+    (as for save_scanned_chords) and any caches of scans limited to
+    notes beyond the MAX_NOTES_CACHES most recently saved.
+    """
+    entries = []
+    for other in _load_manifest(config):
+        replaced = (
+            replaces is not None
+            and other["format"] == _FORMAT_VERSION
+            and other["tuning"] == entry["tuning"]
+            and other["mute"] == config.mute
+            and other["notes"] == entry["notes"]
+            and (other["max_fret"], other["max_difficulty"]) == replaces
+        )
+        if replaced and other["file"] != entry["file"]:
+            os.remove(os.path.join(config.cache_dir, other["file"]))
+        if not replaced and other["file"] != entry["file"]:
+            entries.append(other)
+    entries.append(entry)
+    notes_entries = [other for other in entries if other["notes"] is not None]
+    for other in notes_entries[: max(len(notes_entries) - MAX_NOTES_CACHES, 0)]:
+        os.remove(os.path.join(config.cache_dir, other["file"]))
+        entries.remove(other)
+    _save_manifest(config, entries)
+
+
+def save_scanned_chords(
+    config: UkeConfig,
+    chord_shapes: ChordCollection,
+    max_fret: int,
+    shape_scores: Callable[[tuple[int, ...]], ShapeScores] | None = None,
+    replaces: tuple[int, float] | None = None,
+    notes: PitchClassSet | None = None,
+) -> None:
+    """
+    Save chord/shapes (and each shape's ShapeScores) to cache on disk,
+    and list the cache in the cache manifest. If notes is specified,
+    the shapes are from a scan limited to those notes. shape_scores is
+    needed unless the shapes are all held in ShapeLists keeping their
+    scores.
+
+    If replaces is specified, the cache (for the same tuning, or a
+    transposition of it, and muting) scanned with that max_fret and
+    max_difficulty is removed, as the new cache is an extension of it.
+    Only the MAX_NOTES_CACHES most recently saved caches of scans
+    limited to notes are kept, removing older ones.
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    filename = _cached_filename(config, max_fret, config.max_difficulty, notes)
+    Path(config.cache_dir).mkdir(parents=True, exist_ok=True)
+    tuning, offset = normalize_tuning(config.tuning)
+    stored_shapes = ChordCollection(
+        {transpose_chord(chord, -offset): shapes for chord, shapes in chord_shapes.items()}
+    )
+    _write_cache(filename, len(config.tuning), stored_shapes, shape_scores)
+    legacy_filename = f"{os.path.splitext(filename)[0]}.pcl"
+    if os.path.exists(legacy_filename):
+        os.remove(legacy_filename)
+    entry: CacheEntry = {
+        "file": os.path.basename(filename),
+        "tuning": list(tuning),
+        "mute": config.mute,
+        "max_fret": max_fret,
+        "max_difficulty": config.max_difficulty,
+        "notes": _stored_notes(config, notes),
+        "format": _FORMAT_VERSION,
+        "shapes": sum(map(len, chord_shapes.values())),
+    }
+    _list_cache(config, entry, replaces)
+
+
+def _chord_table_filename(config: UkeConfig) -> str:
+    return os.path.join(config.cache_dir, "chord_table.json")
+
+
+def load_chord_table(config: UkeConfig, fingerprint: str) -> ChordTable | None:
+    """Load the cached chord table from disk, if it matches the given qualities fingerprint"""
+    try:
+        with open(_chord_table_filename(config), encoding="utf-8") as cache:
+            add_count("cache_bytes_read", os.fstat(cache.fileno()).st_size)
+            table: ChordTable = json.load(cache)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(table, dict) or table.get("qualities") != fingerprint:
+        return None
+    return table
+
+
+def save_chord_table(config: UkeConfig, table: ChordTable) -> None:
+    """Save a chord table to disk"""
+    Path(config.cache_dir).mkdir(parents=True, exist_ok=True)
+    filename = _chord_table_filename(config)
+    with open(f"{filename}.tmp", "w", encoding="utf-8") as cache:
+        json.dump(table, cache, separators=(",", ":"))
+    os.replace(f"{filename}.tmp", filename)
+
+
+class DifficultyTable(NamedTuple):
+    """
+    A table on disk of the difficulty (without barring) of every shape
+    for a number of strings, up to max_fret and with muted strings if
+    mute, or NaN for shapes no scan has worked it out for yet.
+    Difficulties don't depend on tuning, so every tuning with that many
+    strings shares the table.
+    """
+
+    filename: str
+    strings: int
+    mute: bool
+    max_fret: int
+
+    @property
+    def size(self) -> int:
+        """How many shapes the table holds"""
+        size: int = (self.max_fret + 1 + self.mute) ** self.strings
+        return size
+
+
+def _difficulty_table_filename(config: UkeConfig, mute: bool, max_fret: int) -> str:
+    filename = f"difficulties_s{len(config.tuning)}_m{mute}_{max_fret}.npy"
     return os.path.join(config.cache_dir, filename)
 
 
-def load_scanned_chords(config: UkeConfig, chord_shapes: ChordCollection, max_fret: int) -> bool:
-    """Load cached chords/shapes from disk"""
-    for imax_difficulty in range(ceil(config.max_difficulty), 100 + 1):
-        filename = _cached_filename(config, max_fret, imax_difficulty)
-        if os.path.exists(filename):
-            with open(filename, "rb") as cache:
-                chord_shapes |= pickle.load(cache)
-                return True
-    return False
+def find_difficulty_table(config: UkeConfig, max_fret: int) -> DifficultyTable | None:
+    """
+    Return the smallest difficulty table in the cache directory holding
+    every shape for the configured number of strings, up to max_fret
+    and with muted strings if configured.
+    """
+    strings = len(config.tuning)
+    pattern = re.compile(rf"difficulties_s{strings}_m(True|False)_(\d+)\.npy")
+    try:
+        filenames = os.listdir(config.cache_dir)
+    except OSError:
+        return None
+    tables = []
+    for filename in filenames:
+        if not (match := pattern.fullmatch(filename)):
+            continue
+        mute, fret = match[1] == "True", int(match[2])
+        if (mute or not config.mute) and fret >= max_fret:
+            filename = os.path.join(config.cache_dir, filename)
+            tables.append(DifficultyTable(filename, strings, mute, fret))
+    return min(tables, key=lambda table: table.size, default=None)
 
 
-def save_scanned_chords(config: UkeConfig, chord_shapes: ChordCollection, max_fret: int) -> None:
-    """Save chord/shapes to cache on disk"""
-    filename = _cached_filename(config, max_fret, config.max_difficulty)
+def new_difficulty_table(config: UkeConfig, max_fret: int) -> DifficultyTable:
+    """Return a new difficulty table for the configured strings and muting, up to max_fret"""
     Path(config.cache_dir).mkdir(parents=True, exist_ok=True)
-    with open(filename, "wb") as cache:
-        pickle.dump(chord_shapes, cache)
+    filename = _difficulty_table_filename(config, config.mute, max_fret)
+    return DifficultyTable(filename, len(config.tuning), config.mute, max_fret)
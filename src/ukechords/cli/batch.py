@@ -0,0 +1,121 @@
+"""Batch mode for the ident cli client, answering a stream of JSON requests"""
+
+import json
+from collections.abc import Callable, Iterable
+from dataclasses import replace
+from typing import IO, Any
+
+from ukechords.config import UkeConfig
+from ukechords.errors import (
+    ChordNotFoundException,
+    InvalidCommandException,
+    UnknownKeyException,
+    UnknownTuningException,
+    UnslidableEmptyShapeException,
+)
+from ukechords.theory import (
+    lookup_tuning,
+    rank_shape_by_difficulty,
+    rank_shape_by_high_fret,
+    show_chord,
+    show_chords_by_notes,
+    show_chords_by_shape,
+    show_key,
+)
+
+
+def _split(value: str | list[Any]) -> list[str]:
+    """Split a comma-separated string (as on the command line) or JSON list into strings"""
+    return value.split(",") if isinstance(value, str) else list(map(str, value))
+
+
+def _get_key(key: str | list[str]) -> str | tuple[str, ...]:
+    return key if isinstance(key, str) and "," not in key else tuple(_split(key))
+
+
+def _get_tuning(tuning: str | list[str]) -> tuple[str, ...]:
+    if isinstance(tuning, str) and "," not in tuning:
+        return lookup_tuning(tuning)
+    return tuple(_split(tuning))
+
+
+_commands: dict[str, Callable[[UkeConfig, Any], Any]] = {
+    "chord": show_chord,
+    "shape": lambda config, shape: show_chords_by_shape(config, tuple(_split(shape))),
+    "notes": lambda config, notes: show_chords_by_notes(config, set(_split(notes))),
+    "show_key": lambda config, key: show_key(config, _get_key(key)),
+}
+
+# How each setting a request can override maps onto UkeConfig fields
+_overrides: dict[str, Callable[[Any], dict[str, Any]]] = {
+    "tuning": lambda tuning: {"tuning": _get_tuning(tuning)},
+    "mute": lambda mute: {"mute": bool(mute)},
+    "num": lambda num: {"num": int(num) if num is not None else None},
+    "max_difficulty": lambda difficulty: {"max_difficulty": float(difficulty)},
+    "qualities": lambda qualities: {"qualities": _split(qualities)},
+    "force_flat": lambda force_flat: {"force_flat": bool(force_flat)},
+    "show_notes": lambda show_notes: {"show_notes": bool(show_notes)},
+    "slide": lambda slide: {"slide": bool(slide)},
+    "sort_by_position": lambda by_position: {
+        "shape_ranker": rank_shape_by_high_fret if by_position else rank_shape_by_difficulty
+    },
+}
+
+
+def _answer(config: UkeConfig, request: Any) -> Any:
+    """Return the result of a single request"""
+    if not isinstance(request, dict):
+        raise InvalidCommandException("Each request must be a JSON object")
+    if unknown := set(request) - set(_commands) - set(_overrides):
+        raise InvalidCommandException(f"Unknown request fields: {", ".join(sorted(unknown))}")
+    commands = [command for command in _commands if command in request]
+    if len(commands) != 1:
+        raise InvalidCommandException(f"Provide exactly one of {", ".join(_commands)}")
+    overrides: dict[str, Any] = {}
+    for name, value in request.items():
+        if name in _overrides:
+            overrides |= _overrides[name](value)
+    return _commands[commands[0]](replace(config, **overrides), request[commands[0]])
+
+
+def _respond(config: UkeConfig, request: Any) -> dict[str, Any]:
+    try:
+        return {"request": request, "result": _answer(config, request)}
+    except (
+        ChordNotFoundException,
+        InvalidCommandException,
+        UnknownKeyException,
+        UnknownTuningException,
+        UnslidableEmptyShapeException,
+        ValueError,
+        KeyError,
+        TypeError,
+    ) as exc:
+        return {"request": request, "error": str(exc)}
+
+
+def run_batch(config: UkeConfig, requests: Iterable[str], output: IO[str]) -> None:
+    """
+    Answer each line of requests (a JSON object naming one of chord,
+    shape, notes or show_key, plus optional overrides of the settings
+    in config), writing a line of JSON holding the request and either
+    its result or an error to output as each is answered.
+
+    Repeated requests are only answered once, with the same response
+    written again for each repeat.
+    """
+    responses: dict[str, dict[str, Any]] = {}
+    for line in requests:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as exc:
+            response = {"request": line.strip(), "error": f"Invalid JSON request: {exc}"}
+        else:
+            key = json.dumps(request, sort_keys=True)
+            if key not in responses:
+                responses[key] = _respond(config, request)
+            response = responses[key]
+        output.write(json.dumps(response) + "\n")
+        output.flush()
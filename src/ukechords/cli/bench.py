@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""Benchmarks of scanning for, looking up and caching shapes, reported as JSON"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import ExitStack
+from dataclasses import replace
+from importlib.util import find_spec
+from itertools import product
+from typing import Any
+
+from ukechords import __version__
+from ukechords.cache import load_scanned_chords, save_scanned_chords
+from ukechords.config import UkeConfig
+from ukechords.pool import EXECUTORS
+from ukechords.theory import (
+    add_7sus2_quality,
+    add_no5_quality,
+    prepare_chord_table,
+    scan_chords,
+    show_all,
+    show_chord,
+    show_chords_by_notes,
+    show_chords_by_shape,
+)
+from ukechords.theory_basic import ChordCollection, ShapeScores
+from ukechords.types import BenchCase, BenchResult
+
+TUNINGS = {
+    "ukulele": tuple("GCEA"),
+    "baritone": tuple("DGBE"),
+    "guitar": tuple("EADGBE"),
+    "7-string": tuple("BEADGBE"),
+}
+
+DEFAULT_MAX_DIFFICULTIES = (10.0, 20.0, 29.0)
+
+# Chords and sets of notes looked up by the chord and notes benchmarks
+_CHORDS = ("C", "Am7", "Ebmaj7", "F#m7b5")
+_NOTES = (("C", "E", "G"), ("A", "C", "E", "G"), ("D", "F#", "A", "C"))
+
+# ru_maxrss is in bytes on macOS, and kilobytes elsewhere
+_RSS_SCALE = 1 if sys.platform == "darwin" else 1024
+
+
+def _count_shapes(chord_shapes: ChordCollection) -> int:
+    return sum(map(len, chord_shapes.values()))
+
+
+def _bench_scan(config: UkeConfig) -> int:
+    chord_shapes = ChordCollection()
+    scan_chords(config, chord_shapes, config.max_fret)
+    return _count_shapes(chord_shapes)
+
+
+def _bench_chord(config: UkeConfig) -> int:
+    return sum(len(show_chord(config, chord)["shapes"]) for chord in _CHORDS)
+
+
+def _bench_all(config: UkeConfig) -> int:
+    return len(show_all(replace(config, num=1))["shapes"])
+
+
+def _bench_slide(config: UkeConfig) -> int:
+    shape = ("2",) * len(config.tuning)
+    return len(show_chords_by_shape(replace(config, slide=True), shape)["shapes"])
+
+
+def _bench_notes(config: UkeConfig) -> int:
+    return sum(len(show_chords_by_notes(config, set(notes))["shapes"]) for notes in _NOTES)
+
+
+def _bench_cache_load(config: UkeConfig) -> int:
+    chord_shapes = ChordCollection()
+    load_scanned_chords(config, chord_shapes, config.max_fret)
+    return sum(len(list(shapes)) for shapes in chord_shapes.values())
+
+
+def _load_shapes_to_save(
+    config: UkeConfig,
+) -> tuple[ChordCollection, dict[tuple[int, ...], ShapeScores]]:
+    """Read every shape (and its scores) from the cache, for saving again"""
+    chord_shapes = ChordCollection()
+    load_scanned_chords(config, chord_shapes, config.max_fret)
+    scores: dict[tuple[int, ...], ShapeScores] = {}
+    for chord, shapes in chord_shapes.items():
+        scores |= zip(shapes, shapes.iter_scores() or ())
+        chord_shapes[chord] = list(shapes)
+    return chord_shapes, scores
+
+
+def _bench_cache_save(
+    config: UkeConfig, chord_shapes: ChordCollection, scores: dict[tuple[int, ...], ShapeScores]
+) -> int:
+    saved = replace(config, cache_dir=os.path.join(config.cache_dir, "saved"))
+    save_scanned_chords(saved, chord_shapes, config.max_fret, scores.__getitem__)
+    return _count_shapes(chord_shapes)
+
+
+# What each benchmark times, and which cache states it's run in: cold
+# (an empty cache directory), warm (one holding a cache from a full
+# scan, which cache_save saves a copy of) or None (for benchmarks not
+# using the cache)
+_benchmarks: dict[str, tuple[Callable[..., int], tuple[str | None, ...]]] = {
+    "scan": (_bench_scan, ("cold", "warm")),
+    "chord": (_bench_chord, ("cold", "warm")),
+    "all": (_bench_all, ("cold", "warm")),
+    "slide": (_bench_slide, (None,)),
+    "notes": (_bench_notes, ("cold", "warm")),
+    "cache_load": (_bench_cache_load, ("warm",)),
+    "cache_save": (_bench_cache_save, ("warm",)),
+}
+
+# Untimed setup for benchmarks, returning extra arguments to pass them
+_setups: dict[str, Callable[[UkeConfig], tuple[Any, ...]]] = {
+    "cache_save": _load_shapes_to_save,
+}
+
+
+def _get_config(case: BenchCase, cache_dir: str, executor: str) -> UkeConfig:
+    return UkeConfig(
+        tuning=TUNINGS[case["tuning"]],
+        mute=case["mute"],
+        max_difficulty=case["max_difficulty"],
+        cache_dir=cache_dir,
+        executor=executor,
+    )
+
+
+def run_case(case: BenchCase, cache_dir: str, executor: str = "auto") -> BenchResult:
+    """
+    Run one benchmark in this process, with the specified cache
+    directory (already holding a cache from a full scan, for warm
+    cases), and return its measurements.
+
+    Peak RSS is that of this process (and of any worker processes)
+    over its whole life, so cases should each be run in a new process.
+    """
+    config = _get_config(case, cache_dir, executor)
+    prepare_chord_table(config)
+    benchmark = _benchmarks[case["operation"]][0]
+    setup = _setups.get(case["operation"])
+    args = setup(config) if setup else ()
+    start = time.perf_counter()
+    shapes = benchmark(config, *args)
+    wall_time = time.perf_counter() - start
+    return {
+        **case,
+        "wall_time": wall_time,
+        "shapes": shapes,
+        "shapes_per_second": shapes / wall_time if wall_time else 0.0,
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_SCALE,
+        "peak_rss_workers": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * _RSS_SCALE,
+    }
+
+
+def _run_case_process(case: BenchCase, cache_dir: str, executor: str) -> BenchResult:
+    """Run one benchmark in a new python process"""
+    command = [sys.executable, "-m", "ukechords.cli.bench", "--run-case", json.dumps(case)]
+    command += ["--cache-dir", cache_dir, "--executor", executor]
+    output = subprocess.run(command, capture_output=True, check=True, text=True).stdout
+    result: BenchResult = json.loads(output)
+    return result
+
+
+def get_cases(
+    operations: Iterable[str],
+    tunings: Iterable[str],
+    mutes: Iterable[bool],
+    max_difficulties: Iterable[float],
+) -> Iterator[BenchCase]:
+    """Return every combination of the specified benchmark settings, in each of its cache states"""
+    for tuning, mute, max_difficulty, operation in product(
+        tunings, mutes, max_difficulties, operations
+    ):
+        for cache in _benchmarks[operation][1]:
+            yield {
+                "operation": operation,
+                "tuning": tuning,
+                "mute": mute,
+                "max_difficulty": max_difficulty,
+                "cache": cache,
+            }
+
+
+def run_cases(
+    cases: Iterable[BenchCase], executor: str = "auto", in_process: bool = False
+) -> Iterator[BenchResult]:
+    """
+    Run benchmarks, each in a new python process (unless in_process)
+    with a new cache directory, which is warmed first (untimed, and
+    shared between cases with the same settings) if needed.
+    """
+    with ExitStack() as stack:
+        warm_dirs: dict[tuple[str, bool, float], str] = {}
+        for case in cases:
+            settings = case["tuning"], case["mute"], case["max_difficulty"]
+            if case["cache"] == "warm" and settings in warm_dirs:
+                cache_dir = warm_dirs[settings]
+            else:
+                cache_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="ukechords-"))
+            if case["cache"] == "warm" and settings not in warm_dirs:
+                config = _get_config(case, cache_dir, executor)
+                prepare_chord_table(config)
+                scan_chords(config, ChordCollection(), config.max_fret)
+                warm_dirs[settings] = cache_dir
+            if in_process:
+                yield run_case(case, cache_dir, executor)
+            else:
+                yield _run_case_process(case, cache_dir, executor)
+
+
+def _get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Benchmark ukechords, reporting the results as JSON"
+    )
+    pa = parser.add_argument
+    pa(
+        "-o",
+        "--operation",
+        action="append",
+        choices=_benchmarks,
+        help="Benchmark <OPERATION> (can be specified multiple times)",
+    )
+    pa(
+        "-t",
+        "--tuning",
+        action="append",
+        choices=TUNINGS,
+        help="Benchmark with <TUNING> (can be specified multiple times)",
+    )
+    pa(
+        "-m",
+        "--mute",
+        action=argparse.BooleanOptionalAction,
+        help="Only benchmark with(out) muting",
+    )
+    pa(
+        "-d",
+        "--max-difficulty",
+        action="append",
+        type=float,
+        help="Scan to <MAX_DIFFICULTY> (can be specified multiple times)",
+    )
+    pa("--executor", choices=EXECUTORS, default="auto", help="How to run shape scans")
+    pa("--in-process", action="store_true", help="Run every benchmark in this process")
+    pa("--output", help="Write the results to <OUTPUT> rather than stdout")
+    pa("--run-case", help=argparse.SUPPRESS)
+    pa("--cache-dir", help=argparse.SUPPRESS)
+    return parser
+
+
+def run(args: list[str]) -> int:
+    """Run benchmarks as specified by command-line arguments"""
+    parsed_args = _get_parser().parse_args(args)
+    add_no5_quality()
+    add_7sus2_quality()
+    if parsed_args.run_case:
+        case = json.loads(parsed_args.run_case)
+        print(json.dumps(run_case(case, parsed_args.cache_dir, parsed_args.executor)))
+        return 0
+    cases = get_cases(
+        parsed_args.operation or _benchmarks,
+        parsed_args.tuning or TUNINGS,
+        (True, False) if parsed_args.mute is None else (parsed_args.mute,),
+        parsed_args.max_difficulty or DEFAULT_MAX_DIFFICULTIES,
+    )
+    report = {
+        "version": __version__,
+        "python": platform.python_version(),
+        "numpy": find_spec("numpy") is not None,
+        "cpus": os.cpu_count(),
+        "executor": parsed_args.executor,
+        "results": list(run_cases(cases, parsed_args.executor, parsed_args.in_process)),
+    }
+    if parsed_args.output:
+        with open(parsed_args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+    return 0
+
+
+def main() -> int:
+    """Main function for the "bench" ukechords benchmark tool"""
+    return run(sys.argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
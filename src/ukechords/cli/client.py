@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""Thin command-line client for ukechords, which uses a running ident daemon when possible"""
+
+import argparse
+import sys
+
+from ukechords.cli.daemon import forward, get_socket_path
+
+
+def main() -> int:
+    """
+    Main function for the "ident" command. Requests are forwarded to
+    a running ident daemon if there is one, and otherwise run by the
+    ident cli client in this process.
+    """
+    parser = argparse.ArgumentParser(add_help=False, allow_abbrev=False)
+    parser.add_argument("--daemon", action="store_true")
+    parser.add_argument("--no-daemon", action="store_true")
+    parser.add_argument("--socket")
+    args, _ = parser.parse_known_args(sys.argv[1:])
+    use_daemon = not (args.daemon or args.no_daemon)
+    if use_daemon and (code := forward(args.socket or get_socket_path(), sys.argv[1:])) is not None:
+        return code
+
+    from ukechords.cli import ident  # pylint: disable=import-outside-toplevel
+
+    return ident.main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
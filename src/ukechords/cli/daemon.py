@@ -0,0 +1,149 @@
+"""A long-running ident daemon, and the client side of talking to it over a Unix socket
+
+Each connection carries a single request: one line of JSON holding the
+client's command line arguments, working directory, and whether its
+output is a terminal. The daemon replies with JSON holding the output
+and exit status of running those arguments, or asks the client to run
+them itself if they need to read standard input.
+"""
+
+import contextlib
+import io
+import json
+import os
+import socket
+import sys
+import traceback
+from collections.abc import Callable
+from typing import Any, NoReturn
+
+from xdg import BaseDirectory
+
+from ukechords.errors import InvalidCommandException
+
+DEFAULT_IDLE_TIMEOUT = 600.0
+
+
+def get_socket_path() -> str:
+    """Return the default path of the ident daemon's socket"""
+    return os.path.join(BaseDirectory.get_runtime_dir(strict=False), "ukechords-ident.sock")
+
+
+class _Output(io.StringIO):
+    """Captured output, which claims to be a terminal if the client's output is one"""
+
+    def __init__(self, tty: bool) -> None:
+        super().__init__()
+        self._tty = tty
+
+    def isatty(self) -> bool:
+        return self._tty
+
+
+class _StdinRequired(Exception):
+    """Raised when a request tries to read the daemon's standard input"""
+
+
+class _NoInput(io.StringIO):
+    """Standard input for requests, which must be run by the client if they read it"""
+
+    def read(self, size: int | None = -1, /) -> NoReturn:
+        raise _StdinRequired()
+
+    def readline(self, size: int | None = -1, /) -> NoReturn:
+        raise _StdinRequired()
+
+    def readlines(self, hint: int | None = -1, /) -> NoReturn:
+        raise _StdinRequired()
+
+    def __iter__(self) -> NoReturn:
+        raise _StdinRequired()
+
+    def __next__(self) -> NoReturn:
+        raise _StdinRequired()
+
+
+def _handle(run: Callable[[list[str]], int], request: dict[str, Any]) -> dict[str, Any]:
+    """
+    Run a request, returning the response to send to the client. As
+    when ident is run by itself, an unexpected exception fails the
+    request with its traceback (rather than stopping the daemon).
+    """
+    stdout, stderr = _Output(request["tty"]), _Output(False)
+    stdin, sys.stdin = sys.stdin, _NoInput()
+    cwd = os.getcwd()
+    try:
+        os.chdir(request["cwd"])
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            code = run(request["argv"])
+    except SystemExit as exc:
+        code = exc.code if isinstance(exc.code, int) else 1
+    except _StdinRequired:
+        return {"local": True}
+    except Exception:  # noqa: BLE001  # pylint: disable=broad-exception-caught
+        stderr.write(traceback.format_exc())
+        code = 1
+    finally:
+        sys.stdin = stdin
+        os.chdir(cwd)
+    return {"stdout": stdout.getvalue(), "stderr": stderr.getvalue(), "code": code}
+
+
+def serve(run: Callable[[list[str]], int], socket_path: str, idle_timeout: float) -> None:
+    """
+    Listen on a Unix socket at socket_path, running the command line
+    arguments of each request with run, until no request has arrived
+    for idle_timeout seconds.
+
+    Requests are run one at a time, so anything run keeps loaded (such
+    as mapped caches) is reused by later requests.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        if probe.connect_ex(socket_path) == 0:
+            raise InvalidCommandException(f"An ident daemon is already listening on {socket_path}")
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(socket_path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        try:
+            os.chmod(socket_path, 0o600)
+            server.listen()
+            server.settimeout(idle_timeout)
+            while True:
+                try:
+                    connection, _ = server.accept()
+                except TimeoutError:
+                    return
+                with connection:
+                    try:
+                        request = json.loads(connection.makefile("rb").readline())
+                        response = _handle(run, request)
+                        connection.sendall(json.dumps(response).encode())
+                    except (OSError, ValueError, KeyError, TypeError):
+                        continue
+        finally:
+            os.remove(socket_path)
+
+
+def forward(socket_path: str, argv: list[str]) -> int | None:
+    """
+    Run the given command line arguments on the ident daemon listening
+    at socket_path, writing its output to stdout and stderr.
+
+    Return the exit status, or None if no daemon is listening or the
+    arguments must be run locally.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+            request = {"argv": argv, "tty": sys.stdout.isatty(), "cwd": os.getcwd()}
+            client.sendall(json.dumps(request).encode() + b"\n")
+            response = json.loads(client.makefile("rb").read())
+        except (OSError, ValueError):
+            return None
+    if response.get("local"):
+        return None
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    code: int = response["code"]
+    return code
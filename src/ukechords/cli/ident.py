@@ -7,15 +7,19 @@ import json
 import os
 import sys
 from collections.abc import Callable, Iterable
+from contextlib import nullcontext
 from typing import Any
 
 from xdg import BaseDirectory
 
+from ukechords.cli.batch import run_batch
+from ukechords.cli.daemon import DEFAULT_IDLE_TIMEOUT, get_socket_path, serve
 from ukechords.cli.render import (
     render_chord_list,
     render_chords_from_shape,
     render_json,
     render_key,
+    render_tuning_comparison,
 )
 from ukechords.config import UkeConfig
 from ukechords.errors import (
@@ -25,10 +29,15 @@ from ukechords.errors import (
     UnknownTuningException,
     error,
 )
+from ukechords.pool import EXECUTORS, shared_pool
+from ukechords.profiling import profile
+from ukechords.stats import collect_stats, phase
 from ukechords.theory import (
     add_7sus2_quality,
     add_no5_quality,
+    compare_tunings,
     lookup_tuning,
+    prepare_chord_table,
     rank_shape_by_difficulty,
     rank_shape_by_high_fret,
     show_all,
@@ -37,7 +46,7 @@ from ukechords.theory import (
     show_chords_by_shape,
     show_key,
 )
-from ukechords.types import ChordsByShape, ChordShapes, KeyInfo
+from ukechords.types import ChordsByShape, ChordShapes, KeyInfo, Stats, TuningComparison
 
 
 def _get_config_from_preferences() -> UkeConfig:
@@ -78,6 +87,54 @@ def _get_tuning(tuning_spec: str) -> tuple[str, ...]:
     return lookup_tuning(tuning_spec)
 
 
+def _add_scan_options(pa: Callable[..., None]) -> None:
+    """Add the options controlling how shapes are scanned for and cached, using pa"""
+    nocache_help = "Ignore any available cached chord/shape information"
+    pa("--no-cache", action="store_true", help=nocache_help)
+    pa("--cache-dir", help="Specify directory to use for cached shapes")
+    derived_help = "Save shapes filtered from a broader cache as their own cache"
+    pa("--save-derived-cache", action="store_true", help=derived_help)
+    full_scan_help = "Keep (and cache) every shape scanned for, even when fewer are shown"
+    pa("--full-scan", action="store_true", help=full_scan_help)
+    difficulty_help = "Limit shape-scanning to the given <MAX_DIFFICULTY> or less"
+    pa("-d", "--max-difficulty", type=float, help=difficulty_help)
+    pa(
+        "--executor",
+        choices=EXECUTORS,
+        help="How to run shape scans (by default, chosen from the size of each scan)",
+    )
+
+
+def _add_command_options(pa: Callable[..., None]) -> None:
+    """Add the options for batches, tuning comparisons, reporting and the daemon, using pa"""
+    pa("--batch", action="store_true", help="Answer JSON requests (one per line) from stdin")
+    compare_help = "Compare how easily each tuning plays these comma-separated <CHORDS>"
+    pa("--compare", metavar="CHORDS", help=compare_help, type=lambda chords: chords.split(","))
+    compare_tuning_help = "Compare <TUNING> with --compare, as well as -t (specify multiple times)"
+    pa(
+        "--compare-tuning",
+        action="append",
+        metavar="TUNING",
+        help=compare_tuning_help,
+        type=_get_tuning,
+    )
+    pa(
+        "--stats",
+        action="store_true",
+        help="Write timings and counts of the work to stderr as JSON",
+    )
+    pa("--profile", metavar="DIR", help="Write profiles (including of scan workers) to <DIR>")
+    pa("--daemon", action="store_true", help="Keep running to serve other ident commands")
+    pa("--no-daemon", action="store_true", help="Don't use a running ident daemon")
+    pa("--socket", help="Specify the socket used to reach the ident daemon")
+    pa(
+        "--idle-timeout",
+        type=float,
+        default=DEFAULT_IDLE_TIMEOUT,
+        help="Stop the ident daemon after <IDLE_TIMEOUT> seconds without requests",
+    )
+
+
 def _get_parser() -> argparse.ArgumentParser:
     """Construct and return an argparse parser for use with ukechords on the command line"""
     parser = argparse.ArgumentParser()
@@ -111,8 +168,6 @@ def _get_parser() -> argparse.ArgumentParser:
     pa("-q", "--qualities", help=qualities_help, type=lambda qs: set(qs.split(",")))
     simple_help = "Limit to chords with major, minor, and dim qualities"
     pa("-p", "--simple", action="store_true", help=simple_help)
-    nocache_help = "Ignore any available cached chord/shape information"
-    pa("--no-cache", action="store_true", help=nocache_help)
     pa(
         "--show-key",
         help="Show the notes in the specified <KEY>",
@@ -125,11 +180,10 @@ def _get_parser() -> argparse.ArgumentParser:
     pa("-b", "--sort-by-position", action="store_true", help=sort_by_pos_help)
     pa("-j", "--json", action="store_true", help="Output in json format if possible")
     pa("-r", "--render-cmd", help="Read stdin into a rendering command")
-    pa("--cache-dir", help="Specify directory to use for cached shapes")
-    difficulty_help = "Limit shape-scanning to the given <MAX_DIFFICULTY> or less"
-    pa("-d", "--max-difficulty", type=float, help=difficulty_help)
+    _add_scan_options(pa)
     ac_help = "Limit to chords playable by the notes in <ALLOWED_CHORD> (specify multiple times)"
     pa("-o", "--allowed-chords", action="append", help=ac_help)
+    _add_command_options(pa)
     return parser
 
 
@@ -144,10 +198,12 @@ def _check_argument_errors(args: argparse.Namespace) -> None:
         args.shape,
         (args.all_chords or args.keys or args.allowed_chords),
         args.show_key,
+        args.batch,
+        args.compare,
     ]
     if not exactly_one(mutually_exclusive_groups):
-        msg = "Provide exactly one of "
-        msg += "--all-chords, --chord, --shape, --notes, --render-cmd, or --show-key"
+        msg = "Provide exactly one of --all-chords, --chord, --shape, --notes, "
+        msg += "--render-cmd, --show-key, --batch, or --compare"
         raise InvalidCommandException(msg)
 
     if args.qualities and args.simple:
@@ -156,6 +212,9 @@ def _check_argument_errors(args: argparse.Namespace) -> None:
     if args.slide and not args.shape:
         raise InvalidCommandException("--slide requries a --shape")
 
+    if args.compare_tuning and not args.compare:
+        raise InvalidCommandException("--compare-tuning requires --compare")
+
 
 def _get_config(args: argparse.Namespace) -> UkeConfig:
     """Unpack argparse options into a new UkeConfig"""
@@ -182,12 +241,16 @@ def _get_config(args: argparse.Namespace) -> UkeConfig:
             config.num = 1
     config.show_notes = args.show_notes
     config.no_cache = args.no_cache
+    config.save_derived = args.save_derived_cache
+    config.full_scan = args.full_scan
     config.visualize = args.visualize
     config.force_flat = args.force_flat
     config.keys = args.keys
     config.allowed_chords = args.allowed_chords
     if args.cache_dir:
         config.cache_dir = args.cache_dir
+    if args.executor:
+        config.executor = args.executor
     return config
 
 
@@ -196,6 +259,7 @@ def _get_renderfunc_from_name(name: str) -> Callable[[UkeConfig, Any], None]:
         render_chord_list,
         render_chords_from_shape,
         render_key,
+        render_tuning_comparison,
     ]
     render_func_map = {f.__name__: f for f in render_funcs}
     if name in render_func_map:
@@ -209,7 +273,7 @@ def _get_renderfunc_from_name(name: str) -> Callable[[UkeConfig, Any], None]:
 def run_command(config: UkeConfig, args: argparse.Namespace) -> None:
     """Run a command specified by the argparsed options provided"""
     renderer: Callable[[UkeConfig, Any], None]
-    data: ChordShapes | ChordsByShape | KeyInfo
+    data: ChordShapes | ChordsByShape | KeyInfo | TuningComparison
     if args.chord:
         renderer = render_chord_list
         data = show_chord(config, args.chord)
@@ -225,6 +289,9 @@ def run_command(config: UkeConfig, args: argparse.Namespace) -> None:
     elif args.show_key:
         renderer = render_key
         data = show_key(config, args.show_key)
+    elif args.compare:
+        renderer = render_tuning_comparison
+        data = compare_tunings(config, [config.tuning, *(args.compare_tuning or [])], args.compare)
     elif args.render_cmd:
         renderer = _get_renderfunc_from_name(args.render_cmd)
         data = json.load(sys.stdin)
@@ -232,17 +299,44 @@ def run_command(config: UkeConfig, args: argparse.Namespace) -> None:
         assert not "No command configuration found"
     if args.json:
         renderer = render_json
-    renderer(config, data)
+    with phase("render"):
+        renderer(config, data)
 
 
-def main() -> int:
-    """Main function for the "ident" ukechords cli client"""
-    add_no5_quality()
-    add_7sus2_quality()
+def _run_daemon(args: argparse.Namespace) -> None:
+    """Serve requests from other ident commands, with chord tables and a worker pool ready"""
+    config = _get_config_from_preferences()
+    if args.cache_dir:
+        config.cache_dir = args.cache_dir
+    if args.executor:
+        config.executor = args.executor
+    prepare_chord_table(config)
+    with shared_pool(config.executor):
+        serve(run, args.socket or get_socket_path(), args.idle_timeout)
+
+
+def _print_stats(stats: Stats) -> None:
+    print(json.dumps(stats), file=sys.stderr)
+
+
+def run(argv: list[str]) -> int:
+    """Run the ident cli client with the given command line arguments"""
     try:
-        args = _get_parser().parse_args(sys.argv[1:])
+        args = _get_parser().parse_args(argv)
+        if args.daemon:
+            _run_daemon(args)
+            return 0
         config = _get_config(args)
-        run_command(config, args)
+        with (
+            profile(args.profile) if args.profile else nullcontext(),
+            collect_stats(_print_stats) if args.stats else nullcontext(),
+        ):
+            prepare_chord_table(config)
+            if args.batch:
+                with shared_pool(config.executor):
+                    run_batch(config, sys.stdin, sys.stdout)
+                return 0
+            run_command(config, args)
     except UnknownKeyException as exc:
         error(10, exc)
     except UnknownTuningException as exc:
@@ -258,5 +352,12 @@ def main() -> int:
     return 0
 
 
+def main() -> int:
+    """Main function for the "ident" ukechords cli client"""
+    add_no5_quality()
+    add_7sus2_quality()
+    return run(sys.argv[1:])
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -6,7 +6,7 @@ from collections.abc import Iterable
 from typing import Any
 
 from ukechords.config import UkeConfig
-from ukechords.types import BarreData, ChordsByShape, ChordShapes, KeyInfo
+from ukechords.types import BarreData, ChordsByShape, ChordShapes, KeyInfo, TuningComparison
 
 
 def _csv(lst: Iterable[Any], sep: str = ",") -> str:
@@ -130,6 +130,22 @@ def render_key(_: UkeConfig | None, data: KeyInfo) -> None:
         print(f"Partial match for: {_csv(data["partial_keys"])}")
 
 
+def render_tuning_comparison(_: UkeConfig | None, data: TuningComparison) -> None:
+    """Render a table of how easily each tuning plays a list of chords, best tuning first"""
+    rows = [["Tuning", *data["chords"], "Total"]]
+    for summary in data["tunings"]:
+        difficulties = [
+            f"{shape["difficulty"]:.1f}" if shape else "-" for shape in summary["shapes"]
+        ]
+        total = f"{summary["difficulty"]:.1f}"
+        if summary["playable"] < len(data["chords"]):
+            total = f"{total} ({summary["playable"]}/{len(data["chords"])} playable)"
+        rows.append([_csv(summary["tuning"]), *difficulties, total])
+    widths = [max(map(len, column)) for column in zip(*rows)]
+    for row in rows:
+        print("  ".join(f"{cell:{width}}" for cell, width in zip(row, widths)).rstrip())
+
+
 def render_json(_: UkeConfig | None, data: Any) -> None:
     """Render arbitrary input data as json"""
     json.dump(data, sys.stdout, indent=2 if sys.stdout.isatty() else None)
@@ -21,7 +21,11 @@ class UkeConfig:
     force_flat: bool = False  # Whether to report chords in their flat versions rather than sharp
     max_difficulty: float = 100.0  # A maximum difficulty of shapes to scan and report
     cache_dir: str = ""  # Directory in which to store cached chord->shape maps
+    save_derived: bool = False  # Whether to cache chord->shape maps filtered from broader caches
+    full_scan: bool = False  # Whether to keep (and cache) every shape, even if fewer are shown
     tuning: tuple[str, ...] = ()  # Notes that individual strings are tuned to
     mute: bool = False  # Whether to consider muted shapes
+    executor: str = "auto"  # How to run scans: auto, fork, forkserver, thread or serial
+    max_fret: int = 12  # The highest fret to scan for shapes up to
     # Function to use to sort discovered shapes with
     shape_ranker: Callable[[tuple[int, ...]], Any] = sum
@@ -0,0 +1,81 @@
+"""A reusable interface to ukechords, for programs answering many questions about one instrument"""
+
+from dataclasses import replace
+from typing import Any
+
+from ukechords.config import UkeConfig
+from ukechords.errors import InvalidCommandException
+from ukechords.theory import (
+    prepare_chord_table,
+    scan_chords,
+    show_all,
+    show_chord,
+    show_chords_by_notes,
+    show_chords_by_shape,
+)
+from ukechords.theory_basic import ChordCollection
+from ukechords.types import ChordsByShape, ChordShapes
+
+# UkeConfig settings which describe the instrument (and the shapes
+# scanned for on it), and so can't be changed for a single question
+_instrument_settings = frozenset(
+    ("tuning", "mute", "max_fret", "max_difficulty", "cache_dir", "no_cache", "save_derived")
+)
+
+
+class Instrument:
+    """
+    An instrument, described by the tuning, mute, max_fret and
+    max_difficulty settings of a UkeConfig, which answers the same
+    questions as the show_* functions in ukechords.theory.
+
+    The work those functions repeat for each call (preparing the chord
+    table, and loading or scanning for shapes) is done once, and kept
+    for later calls. Any custom chord qualities should be added before
+    creating an Instrument.
+
+    Each question uses the rest of the config's settings (such as num
+    or qualities), unless overridden by keyword arguments named after
+    UkeConfig fields.
+    """
+
+    def __init__(self, config: UkeConfig) -> None:
+        self._config = replace(config)
+        prepare_chord_table(config)
+        self._chord_shapes: ChordCollection | None = None
+
+    @property
+    def config(self) -> UkeConfig:
+        """A copy of the configuration this instrument was created with"""
+        return replace(self._config)
+
+    def _get_config(self, settings: dict[str, Any]) -> UkeConfig:
+        if fixed := _instrument_settings & settings.keys():
+            raise InvalidCommandException(
+                f"Settings fixed for this instrument: {", ".join(sorted(fixed))}"
+            )
+        return replace(self._config, **settings)
+
+    def _get_chord_shapes(self) -> ChordCollection:
+        """Return the shapes playable on this instrument, loading or scanning for them if needed"""
+        if self._chord_shapes is None:
+            chord_shapes = ChordCollection()
+            scan_chords(self._config, chord_shapes, self._config.max_fret)
+            self._chord_shapes = chord_shapes
+        return self._chord_shapes
+
+    def chord(self, chord: str, **settings: Any) -> ChordShapes:
+        """Return information on how to play a given chord, as with theory.show_chord"""
+        return show_chord(self._get_config(settings), chord, self._get_chord_shapes())
+
+    def shape(self, shape: tuple[str, ...], **settings: Any) -> ChordsByShape:
+        """Return information on what chords a shape plays, as with theory.show_chords_by_shape"""
+        return show_chords_by_shape(self._get_config(settings), shape)
+
+    def notes(self, notes: set[str], **settings: Any) -> ChordShapes:
+        """Return information on what chords notes play, as with theory.show_chords_by_notes"""
+        return show_chords_by_notes(self._get_config(settings), notes, self._get_chord_shapes())
+
+    def all(self, **settings: Any) -> ChordShapes:
+        """Return one way to play each known/specified chord, as with theory.show_all"""
+        return show_all(self._get_config(settings), self._get_chord_shapes())
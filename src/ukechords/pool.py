@@ -0,0 +1,107 @@
+"""Running chunks of a scan, in worker processes or threads, or serially"""
+
+import multiprocessing as mp
+import sys
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import contextmanager
+from functools import partial
+from multiprocessing.pool import Pool, ThreadPool
+from typing import Any
+
+from ukechords.errors import InvalidCommandException
+from ukechords.profiling import get_profile_dir, profiled
+from ukechords.stats import phase
+
+# Ways scans can be run, as chosen by UkeConfig.executor
+EXECUTORS = ("auto", "fork", "forkserver", "thread", "serial")
+
+# Scans of up to this many combinations of string positions run
+# quicker serially than it takes to start up a pool of workers
+_SERIAL_SCAN_SIZE = 1 << 16
+
+# Worker pools kept running between scans by shared_pool(), by executor
+_shared_pools: dict[str, Pool] = {}
+
+
+def _is_free_threaded() -> bool:
+    """Return whether python is running without the GIL, so threads can scan in parallel"""
+    is_gil_enabled: Callable[[], bool] = getattr(sys, "_is_gil_enabled", lambda: True)
+    return not is_gil_enabled()
+
+
+def resolve_executor(executor: str, scan_size: int | None = None) -> str:
+    """
+    Return the executor to run a scan with, resolving "auto" to the one
+    best suited to scanning scan_size combinations of string positions
+    (or a large scan if not specified).
+    """
+    if executor not in EXECUTORS:
+        raise InvalidCommandException(
+            f"Unknown executor: {executor} (choose from {", ".join(EXECUTORS)})"
+        )
+    if executor != "auto":
+        return executor
+    if scan_size is not None and scan_size <= _SERIAL_SCAN_SIZE:
+        return "serial"
+    return "thread" if _is_free_threaded() else "fork"
+
+
+def _create_pool(executor: str) -> Pool:
+    with phase("pool_startup"):
+        if executor == "thread":
+            return ThreadPool()
+        context = mp.get_context(executor)
+        if executor == "forkserver":
+            # Workers are forked from a server process which has already
+            # imported (and so built the module-level tables of) ukechords
+            context.set_forkserver_preload(["ukechords.theory"])
+        return context.Pool()
+
+
+@contextmanager
+def shared_pool(executor: str = "auto") -> Iterator[None]:
+    """
+    Within this context, run scans using the specified executor on a
+    single pool of workers, rather than starting a new pool for each
+    scan. This suits long-running processes making many scans.
+    """
+    if (executor := resolve_executor(executor)) == "serial":
+        yield
+        return
+    with _create_pool(executor) as pool:
+        _shared_pools[executor] = pool
+        try:
+            yield
+        finally:
+            del _shared_pools[executor]
+
+
+def map_chunks(
+    executor: str,
+    scan: Callable[..., Any],
+    args: tuple[Any, ...],
+    chunks: Sequence[Any],
+    callback: Callable[[Any], None],
+) -> None:
+    """
+    Call scan with args and each of chunks using the specified (already
+    resolved) executor, handing chunks out to workers as they become
+    free, and calling callback with each result (in the order of the
+    chunks).
+
+    When profiling, scans run by worker processes are profiled too.
+    """
+    if executor in ("fork", "forkserver") and (directory := get_profile_dir()) is not None:
+        scan = partial(profiled, directory, scan)
+    scan_chunk = partial(scan, *args)
+    if executor == "serial":
+        for chunk in chunks:
+            callback(scan_chunk(chunk))
+        return
+    if (shared := _shared_pools.get(executor)) is not None:
+        for result in shared.imap(scan_chunk, chunks):
+            callback(result)
+        return
+    with _create_pool(executor) as pool:
+        for result in pool.imap(scan_chunk, chunks):
+            callback(result)
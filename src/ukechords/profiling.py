@@ -0,0 +1,104 @@
+"""Profiling of ukechords' work, including that done in worker processes, for diagnosing it"""
+
+import cProfile
+import os
+import tracemalloc
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+# How many frames of each allocation's traceback tracemalloc keeps
+_TRACEBACK_FRAMES = 10
+
+# How many of the top allocation sites to list in the peak memory report
+_TOP_ALLOCATIONS = 25
+
+# The profile being written by profile(): its "dir", the "pid" of the
+# process profiled and its "profiler", and the largest "peak" of memory
+# traced at a memory_checkpoint() along with a "snapshot" of it. Empty
+# when not profiling.
+_profiling: dict[str, Any] = {}
+
+# Profilers of the scans run by this (worker) process, by the directory
+# the profile is written to, each kept (and written out) across every
+# chunk of work the worker is given for that profile
+_worker_profilers: dict[str, cProfile.Profile] = {}
+
+
+def get_profile_dir() -> str | None:
+    """Return the directory a profile is being written to, if profiling"""
+    return _profiling.get("dir")
+
+
+@contextmanager
+def profile(directory: str) -> Iterator[None]:
+    """
+    Within this context, profile the work done, writing pstats files
+    for this process (ident.pstats) and for each worker process
+    running scans (worker-<pid>.pstats) to directory. Scans running in
+    worker threads are included in this process's profile.
+
+    Memory allocations are traced too, and the top allocation sites at
+    the peak of memory use during scans for shapes are written to
+    scan-peak.txt (with the full snapshot in scan-peak.tracemalloc, for
+    loading with tracemalloc.Snapshot.load).
+    """
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    profiler = cProfile.Profile()
+    _profiling.update(dir=directory, pid=os.getpid(), profiler=profiler, peak=0)
+    tracemalloc.start(_TRACEBACK_FRAMES)
+    try:
+        with profiler:
+            yield
+    finally:
+        tracemalloc.stop()
+        profiler.dump_stats(os.path.join(directory, "ident.pstats"))
+        if (snapshot := _profiling.get("snapshot")) is not None:
+            _write_snapshot(directory, snapshot)
+        _profiling.clear()
+
+
+def _write_snapshot(directory: str, snapshot: tracemalloc.Snapshot) -> None:
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    snapshot.dump(os.path.join(directory, "scan-peak.tracemalloc"))
+    top = snapshot.statistics("lineno")[:_TOP_ALLOCATIONS]
+    total = sum(stat.size for stat in snapshot.statistics("filename"))
+    with open(os.path.join(directory, "scan-peak.txt"), "w", encoding="utf-8") as report:
+        print(f"Peak memory traced during scans: {total / 1024:.1f} KiB", file=report)
+        print(f"Top {len(top)} allocation sites:", file=report)
+        for stat in top:
+            print(stat, file=report)
+
+
+def memory_checkpoint() -> None:
+    """
+    Note a point during a scan where memory use may peak, taking a
+    snapshot of allocations if more memory is in use than at any
+    earlier checkpoint. This does nothing unless profiling (and isn't
+    meant for worker processes).
+    """
+    if not tracemalloc.is_tracing() or _profiling.get("pid") != os.getpid():
+        return
+    if (current := tracemalloc.get_traced_memory()[0]) > _profiling["peak"]:
+        _profiling["peak"] = current
+        _profiling["snapshot"] = tracemalloc.take_snapshot()
+
+
+def profiled(directory: str, function: Callable[..., Any], *args: Any) -> Any:
+    """
+    Call function with args in a worker process, adding its profile
+    to the one written to directory for this worker.
+    """
+    if _profiling and _profiling["pid"] != os.getpid():
+        # Forked from the profiled process, which only profiles (and
+        # traces the allocations of) itself
+        _profiling["profiler"].disable()
+        tracemalloc.stop()
+        _profiling.clear()
+    if (profiler := _worker_profilers.get(directory)) is None:
+        profiler = _worker_profilers[directory] = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        profiler.dump_stats(os.path.join(directory, f"worker-{os.getpid()}.pstats"))
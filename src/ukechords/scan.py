@@ -0,0 +1,725 @@
+"""Enumerating, scoring and ranking the shapes playable on an instrument, to scan for chords"""
+
+import heapq
+import math
+from array import array
+from collections.abc import Callable, Iterable, Sequence
+from functools import cache
+from itertools import pairwise
+from typing import Any, NamedTuple
+
+from . import theory_basic
+from .cache import DifficultyTable, find_difficulty_table, new_difficulty_table
+from .config import UkeConfig
+from .stats import add_count, collect_stats, phase
+from .theory_basic import PitchClassSet, notes_to_mask
+
+try:
+    from . import theory_numpy
+except ImportError:  # pragma: no cover
+    theory_numpy = None  # type: ignore[assignment]
+
+
+def _barreless_shape_difficulty(shape: tuple[int, ...]) -> float:
+    difficulty: float = 0.0 + max(shape) / 10.0
+    last_fretted_position = None
+    for string, position in enumerate(shape):
+        if position > 0:
+            if last_fretted_position:
+                difficulty += (position - last_fretted_position - 1) ** 2 / 1.5
+            last_fretted_position = position
+        elif last_fretted_position:
+            difficulty += 1
+        if position < 0:
+            if string in [0, len(shape) - 1]:
+                difficulty += 5
+            else:
+                difficulty += 7
+        else:
+            difficulty += position
+    return difficulty
+
+
+def _get_barre_difficulty(shape: tuple[int, ...]) -> float:
+    """Return how hard a shape is to play using a barre, or NaN if it can't be barred"""
+    barre_level = min(shape)
+    barrable = len([1 for pos in shape if pos == barre_level])
+    if not (barrable > 1 and barre_level > 0):
+        return math.nan
+
+    barre_shape = tuple(x - barre_level for x in shape)
+    barre_difficulty = _barreless_shape_difficulty(barre_shape) * 2.2
+    barre_difficulty += barre_level * 3.0
+    barre_difficulty += max(barre_shape) ** 3 / 50
+    return barre_difficulty
+
+
+def get_shape_scores(shape: tuple[int, ...]) -> theory_basic.ShapeScores:
+    """
+    Return a heuristic for how hard a shape is to play, along with how
+    hard it is to play without and with a barre (NaN if it can't be
+    barred). Whichever is easier gives the shape's difficulty.
+    """
+    unbarred_difficulty = _barreless_shape_difficulty(shape)
+    barre_difficulty = _get_barre_difficulty(shape)
+    barred = barre_difficulty < unbarred_difficulty
+    difficulty = barre_difficulty if barred else unbarred_difficulty
+    return difficulty, unbarred_difficulty, barre_difficulty
+
+
+@cache
+def _get_string_masks(tuning: tuple[str, ...]) -> tuple[tuple[PitchClassSet, ...], ...]:
+    """
+    For each string in a tuning, return the pitch class played by
+    each fret (modulo 12).
+    """
+    scale_length = len(theory_basic.chromatic_scale)
+    return tuple(
+        tuple(1 << (theory_basic.note_intervals[note] + fret) % scale_length for fret in range(12))
+        for note in tuning
+    )
+
+
+def get_shape_mask(shape: tuple[int, ...], tuning: tuple[str, ...]) -> PitchClassSet:
+    """For a given shape in a specified tuning, return the set of pitch classes it plays"""
+    mask = 0
+    for string_masks, position in zip(_get_string_masks(tuning), shape):
+        if position >= 0:
+            mask |= string_masks[position % 12]
+    return mask
+
+
+# Slack allowed for floating-point rounding when comparing difficulty
+# lower bounds (which sum terms in a different order) to a limit
+_BOUND_TOLERANCE = 1e-9
+
+
+def _barre_difficulty_lower_bound(prefix: tuple[int, ...]) -> float:
+    """
+    Return a lower bound on the barred difficulty of any shape
+    starting with the given frets, or infinity if they can't be
+    barred.
+
+    Every barred shape's difficulty includes 2.2 times its barre
+    shape's fret sum and max()/10 term, 3 per barre fret, and the cube
+    term of the barre shape's highest fret. The barre can be at any
+    fret up to the lowest fret so far, so take the lowest outcome.
+    """
+    lowest = min(prefix)
+    if lowest <= 0:
+        return float("inf")
+    highest = max(prefix)
+    return min(
+        2.2 * (sum(prefix) - level * len(prefix) + (highest - level) / 10.0)
+        + level * 3.0
+        + (highest - level) ** 3 / 50
+        for level in range(1, lowest + 1)
+    )
+
+
+class _PartialShape(NamedTuple):
+    """
+    The positions of a shape's leading strings, along with the
+    barreless difficulty terms accumulated for them so far.
+    """
+
+    prefix: tuple[int, ...] = ()
+    cost: float = 0.0
+    last_fretted: int = 0
+    highest: int = 0
+
+    def extend(self, position: int, strings: int) -> "_PartialShape":
+        """Return this partial shape with the next string played at position"""
+        cost = self.cost
+        if position > 0:
+            if self.last_fretted:
+                cost += (position - self.last_fretted - 1) ** 2 / 1.5
+        elif self.last_fretted:
+            cost += 1
+        cost += _string_cost(len(self.prefix), strings, position)
+        last_fretted = position if position > 0 else self.last_fretted
+        return _PartialShape(
+            self.prefix + (position,), cost, last_fretted, max(self.highest, position)
+        )
+
+    def unbarred_bound(self, remaining_cost: float) -> float:
+        """Return a lower bound on the barreless difficulty of any completion of this shape"""
+        return self.highest / 10.0 + self.cost + remaining_cost
+
+    def difficulty_bound(self, remaining_cost: float) -> float:
+        """Return a lower bound on the difficulty of any completion of this shape"""
+        unbarred = self.unbarred_bound(remaining_cost)
+        return min(unbarred, _barre_difficulty_lower_bound(self.prefix)) - _BOUND_TOLERANCE
+
+
+def _string_cost(string: int, strings: int, position: int) -> float:
+    """Return the part of a shape's difficulty due to one string's own position"""
+    if position < 0:
+        return 5 if string in [0, strings - 1] else 7
+    return position
+
+
+def _get_remaining_costs(string_fret_options: list[list[int]]) -> list[float]:
+    """
+    For each string, return the least the positions of that string and
+    those after it can add to a shape's barreless difficulty.
+    """
+    strings = len(string_fret_options)
+    remaining_cost = [0.0] * (strings + 1)
+    for string in reversed(range(strings)):
+        options = string_fret_options[string]
+        cheapest = min((_string_cost(string, strings, pos) for pos in options), default=0.0)
+        remaining_cost[string] = remaining_cost[string + 1] + cheapest
+    return remaining_cost
+
+
+def _bounded_prefixes(
+    string_fret_options: list[list[int]], depth: int, max_difficulty: float
+) -> Iterable[tuple[int, ...]]:
+    """
+    Yield combinations of fret options for the first depth strings,
+    skipping any whose completed shapes can only be more difficult
+    than max_difficulty.
+
+    Every term in _barreless_shape_difficulty is non-negative, so the
+    terms for the strings so far (plus the cheapest fret/mute penalty
+    available to each remaining string) can only grow as strings are
+    added. A barre can lower a shape's difficulty below that, but only
+    as far as _barre_difficulty_lower_bound allows.
+    """
+    strings = len(string_fret_options)
+    remaining_cost = _get_remaining_costs(string_fret_options)
+    limit = max_difficulty + _BOUND_TOLERANCE
+
+    def extend(partial: _PartialShape) -> Iterable[tuple[int, ...]]:
+        string = len(partial.prefix)
+        if string == depth:
+            yield partial.prefix
+            return
+        for position in string_fret_options[string]:
+            child = partial.extend(position, strings)
+            bound = child.unbarred_bound(remaining_cost[string + 1])
+            if bound > limit and _barre_difficulty_lower_bound(child.prefix) > limit:
+                continue
+            yield from extend(child)
+
+    yield from extend(_PartialShape())
+
+
+def get_string_fret_options(
+    config: UkeConfig, max_fret: int, notes: tuple[str, ...] | None = None
+) -> list[list[int]]:
+    """
+    Return the positions (including muting, if configured) each string
+    could be played at, up to the specified fret.
+
+    if notes is specified, limit positions to those that play those notes
+    """
+    string_fret_options = []
+    fret_range = range(-1 if config.mute else 0, max_fret + 1)
+    notes_mask = notes_to_mask(notes) if notes else 0
+    for string_masks in _get_string_masks(config.tuning):
+        fret_options = []
+        for pos in fret_range:
+            if not notes or pos == -1 or string_masks[pos % 12] & notes_mask:
+                fret_options.append(pos)
+        string_fret_options.append(fret_options)
+    return string_fret_options
+
+
+def _get_unscanned_options(
+    string_fret_options: list[list[int]], scanned: tuple[int, float], max_difficulty: float
+) -> Iterable[list[list[int]]]:
+    """
+    Split the given per-string fret options into options covering the
+    shapes an earlier scan up to scanned's max_fret and max_difficulty
+    wouldn't have found, skipping as many of those it would have as
+    possible before they're enumerated.
+
+    Shapes fretted above the earlier max_fret are covered once each, by
+    options for each string with the strings before it fretted no
+    higher than that and it fretted above. The rest are only covered
+    (to be filtered by difficulty once scored) if max_difficulty is
+    higher than the earlier scan's.
+    """
+    scanned_fret, scanned_difficulty = scanned
+    lower = [
+        [position for position in options if position <= scanned_fret]
+        for options in string_fret_options
+    ]
+    for string, options in enumerate(string_fret_options):
+        higher = [position for position in options if position > scanned_fret]
+        split = lower[:string] + [higher] + string_fret_options[string + 1 :]
+        if all(split):
+            yield split
+    if max_difficulty > scanned_difficulty:
+        yield lower
+
+
+def _get_prefix_options(
+    config: UkeConfig,
+    max_fret: int,
+    notes: tuple[str, ...] | None = None,
+    prefixes: Iterable[tuple[int, ...]] | None = None,
+    scanned: tuple[int, float] | None = None,
+) -> Iterable[list[list[int]]]:
+    """
+    Yield the positions each string could be played at, as for
+    get_string_fret_options. If prefixes is specified, yield them
+    for each prefix in turn, with the leading strings fixed to it.
+
+    If scanned is specified, they're split to skip shapes an earlier
+    scan up to that max_fret and max_difficulty would have found, as
+    by _get_unscanned_options.
+    """
+    string_fret_options = get_string_fret_options(config, max_fret, notes)
+    prefix_options: Iterable[list[list[int]]] = [string_fret_options]
+    if prefixes is not None:
+        prefix_options = (
+            [[position] for position in prefix] + string_fret_options[len(prefix) :]
+            for prefix in prefixes
+        )
+    for options in prefix_options:
+        if scanned is None:
+            yield options
+        else:
+            yield from _get_unscanned_options(options, scanned, config.max_difficulty)
+
+
+def _get_block_heads(
+    string_fret_options: list[list[int]], max_difficulty: float
+) -> Iterable[tuple[int, ...]]:
+    """Return the leading strings' positions to evaluate blocks of shapes for with theory_numpy"""
+    assert theory_numpy
+    split = theory_numpy.get_block_split(string_fret_options)
+    return _bounded_prefixes(string_fret_options, split, max_difficulty)
+
+
+def _get_python_shapes(
+    string_fret_options: list[list[int]],
+    max_difficulty: float,
+    scanned: tuple[int, float] | None = None,
+) -> Iterable[tuple[tuple[int, ...], theory_basic.ShapeScores]]:
+    """
+    Yield the playable combinations of the given per-string fret
+    options, as for get_shapes, along with their scores
+    """
+    depth = len(string_fret_options)
+    enumerated = rejected = 0
+    for shape in _bounded_prefixes(string_fret_options, depth, max_difficulty):
+        enumerated += 1
+        if max(shape) < 0:
+            continue
+        scores = get_shape_scores(shape)
+        if scores[0] > max_difficulty:
+            rejected += 1
+            continue
+        if scanned is None or max(shape) > scanned[0] or scores[0] > scanned[1]:
+            yield shape, scores
+    add_count("shapes_enumerated", enumerated)
+    add_count("shapes_rejected_by_difficulty", rejected)
+
+
+def get_shapes(
+    config: UkeConfig,
+    max_fret: int = 1,
+    notes: tuple[str, ...] | None = None,
+    scanned: tuple[int, float] | None = None,
+    prefixes: Iterable[tuple[int, ...]] | None = None,
+) -> Iterable[tuple[int, ...]]:
+    """
+    Yield shapes playable on the fretboard, (optionally including
+    muted strings) up to the specified fret.
+
+    Shapes which are ranked as too-difficult based on the provided
+    configuration will be excluded, pruning partial shapes as soon as
+    they can only become too difficult.
+
+    if notes is specified, limit shapes to those that only use those notes
+
+    if scanned is specified, skip shapes an earlier scan up to that
+    max_fret and max_difficulty would have found
+
+    if prefixes is specified, limit shapes to those starting with one
+    of those positions for the leading strings
+    """
+    max_difficulty = config.max_difficulty
+    for options in _get_prefix_options(config, max_fret, notes, prefixes, scanned):
+        if theory_numpy:
+            heads = _get_block_heads(options, max_difficulty)
+            yield from theory_numpy.get_shapes(options, max_difficulty, heads, scanned)
+        else:
+            yield from (shape for shape, _ in _get_python_shapes(options, max_difficulty, scanned))
+
+
+def rank_shape_by_difficulty(shape: tuple[int, ...]) -> tuple[float, tuple[int, ...]]:
+    """Enable sorting a list of shapes by how hard they are to play"""
+    return get_shape_scores(shape)[0], shape[::-1]
+
+
+def rank_shape_by_high_fret(shape: tuple[int, ...]) -> tuple[int, ...]:
+    """Enable sorting a list of shapes by how high their fret usage.
+    This accomplishes finding chord shapes by "first position\""""
+    return tuple(sorted(shape, reverse=True))
+
+
+def _rank_bound_by_difficulty(
+    partial: _PartialShape, _: tuple[int, ...], remaining_cost: float
+) -> tuple[float, tuple[int, ...]]:
+    """A lower bound on rank_shape_by_difficulty for any completion of a partial shape"""
+    return partial.difficulty_bound(remaining_cost), ()
+
+
+def _rank_bound_by_high_fret(
+    partial: _PartialShape, lowest_remaining: tuple[int, ...], _: float
+) -> tuple[int, ...]:
+    """
+    A lower bound on rank_shape_by_high_fret for any completion of a
+    partial shape: raising any fret can only raise the sorted frets.
+    """
+    return tuple(sorted(partial.prefix + lowest_remaining, reverse=True))
+
+
+# Shape rankers which best-first searches can produce shapes in order
+# for, with a function to compute a lower bound on their rank for
+# partial shapes
+_rank_bounds: dict[Callable[[tuple[int, ...]], Any], Callable[..., Any]] = {
+    rank_shape_by_difficulty: _rank_bound_by_difficulty,
+    rank_shape_by_high_fret: _rank_bound_by_high_fret,
+}
+
+
+def can_search_best_first(ranker: Callable[[tuple[int, ...]], Any]) -> bool:
+    """Return whether best_first_shapes can yield shapes in order of ranker"""
+    return ranker in _rank_bounds
+
+
+def _rank_scored_by_difficulty(
+    shape: tuple[int, ...], scores: theory_basic.ShapeScores
+) -> tuple[float, tuple[int, ...]]:
+    """rank_shape_by_difficulty, for a shape with known scores"""
+    return scores[0], shape[::-1]
+
+
+# Shape rankers which can rank shapes by scores already worked out for
+# them (as kept by a ShapeList), with the function doing so
+_scored_rankers: dict[Callable[[tuple[int, ...]], Any], Callable[..., Any]] = {
+    rank_shape_by_difficulty: _rank_scored_by_difficulty,
+}
+
+
+def sort_shapes(
+    shapes: list[tuple[int, ...]] | theory_basic.ShapeList,
+    ranker: Callable[[tuple[int, ...]], Any],
+) -> None:
+    """
+    Sort shapes best first according to ranker, ranking them by the
+    scores kept with them (as by a ShapeList) where ranker can.
+    """
+    scored_ranker = _scored_rankers.get(ranker)
+    if scored_ranker and isinstance(shapes, theory_basic.ShapeList) and shapes.scores is not None:
+        shapes.sort_scored(key=scored_ranker)
+    else:
+        shapes.sort(key=ranker)
+
+
+def keep_best(
+    shapes: list[tuple[int, ...]] | theory_basic.ShapeList,
+    keep: int,
+    ranker: Callable[[tuple[int, ...]], Any],
+) -> None:
+    """
+    Trim shapes down to the keep best according to ranker, best first.
+    Shapes ranked equally stay in order, so the shapes kept are those a
+    full sort would rank first.
+    """
+    if len(shapes) > keep:
+        sort_shapes(shapes, ranker)
+        del shapes[keep:]
+
+
+def best_first_shapes(
+    config: UkeConfig, max_fret: int = 12, notes: tuple[str, ...] | None = None
+) -> Iterable[tuple[int, ...]]:
+    """
+    Yield the same shapes as get_shapes, but in increasing order of
+    config.shape_ranker (and then the shapes themselves), which must
+    be one of the rankers in _rank_bounds.
+
+    Partial shapes are expanded from a priority queue ordered by a
+    lower bound on the rank of any of their completions, so the best
+    shapes are found without visiting the rest of the fretboard.
+    """
+    rank_bound = _rank_bounds[config.shape_ranker]
+    string_fret_options = get_string_fret_options(config, max_fret, notes)
+    strings = len(string_fret_options)
+    remaining_cost = _get_remaining_costs(string_fret_options)
+    lowest = [min(options, default=0) for options in string_fret_options]
+    limit = config.max_difficulty + _BOUND_TOLERANCE
+    queue: list[tuple[Any, _PartialShape]] = [(None, _PartialShape())]
+    while queue:
+        _, partial = heapq.heappop(queue)
+        string = len(partial.prefix)
+        if string == strings:
+            yield partial.prefix
+            continue
+        for position in string_fret_options[string]:
+            child = partial.extend(position, strings)
+            if child.difficulty_bound(remaining_cost[string + 1]) > limit:
+                continue
+            if string + 1 < strings:
+                rank = rank_bound(child, tuple(lowest[string + 1 :]), remaining_cost[string + 1])
+            elif max(child.prefix) >= 0 and (
+                get_shape_scores(child.prefix)[0] <= config.max_difficulty
+            ):
+                rank = config.shape_ranker(child.prefix)
+            else:
+                continue
+            heapq.heappush(queue, (rank, child))
+
+
+class ShapeRecords(NamedTuple):
+    """
+    Shapes found by a scan, packed to be cheaply returned from a worker
+    process: the frets of each shape (as a signed byte per string) and
+    its scores (as three native doubles), grouped into runs of shapes
+    which play the same set of pitch classes.
+    """
+
+    frets: bytes
+    scores: bytes
+    runs: list[tuple[PitchClassSet, int]]  # The set played by each run, and its length
+    counts: dict[str, int]  # Counts (as collected by the stats module) for the scan
+
+
+def _pack_shape_records(
+    shapes: Iterable[tuple[tuple[int, ...], theory_basic.ShapeScores]],
+    tuning: tuple[str, ...],
+    chord_masks: bytes,
+    keep: int | None = None,
+    ranker: Callable[[tuple[int, ...]], Any] = sum,
+) -> tuple[bytes, bytes, list[tuple[PitchClassSet, int]]]:
+    """
+    Pack shapes (with their scores) into records, grouped by the set of
+    pitch classes they play in order of first appearance, and dropping
+    any which don't play a chord according to chord_masks. Return the
+    packed frets and scores, and the set of pitch classes played by
+    each run of shapes with its length.
+
+    If keep is specified, only the keep best shapes in each group
+    according to ranker are packed (best first), and no more than
+    twice that many are held at once.
+    """
+    scored_ranker = _scored_rankers.get(ranker)
+
+    def rank(item: tuple[tuple[int, ...], theory_basic.ShapeScores]) -> Any:
+        return scored_ranker(*item) if scored_ranker else ranker(item[0])
+
+    groups: dict[PitchClassSet, list[tuple[tuple[int, ...], theory_basic.ShapeScores]]] = {}
+    for shape, shape_scores in shapes:
+        if chord_masks[mask := get_shape_mask(shape, tuning)]:
+            group = groups.setdefault(mask, [])
+            group.append((shape, shape_scores))
+            if keep is not None and len(group) > 2 * keep:
+                group.sort(key=rank)
+                del group[keep:]
+    frets, scores = array("b"), array("d")
+    for group in groups.values():
+        if keep is not None and len(group) > keep:
+            group.sort(key=rank)
+            del group[keep:]
+        for shape, shape_scores in group:
+            frets.extend(shape)
+            scores.extend(shape_scores)
+    runs = [(mask, len(group)) for mask, group in groups.items()]
+    return frets.tobytes(), scores.tobytes(), runs
+
+
+def unpack_runs(
+    frets: bytes, scores: bytes, runs: list[tuple[PitchClassSet, int]], strings: int
+) -> Iterable[tuple[PitchClassSet, theory_basic.ShapeList]]:
+    """Return each run of packed records, as the set of pitch classes it plays and its shapes"""
+    start = 0
+    for mask, count in runs:
+        stop = start + count
+        yield mask, theory_basic.ShapeList.frombytes(
+            strings, frets[start * strings : stop * strings], scores[start * 24 : stop * 24]
+        )
+        start = stop
+
+
+def _keep_best_records(
+    packed: tuple[bytes, bytes, list[tuple[PitchClassSet, int]]],
+    strings: int,
+    keep: int,
+    ranker: Callable[[tuple[int, ...]], Any],
+) -> tuple[bytes, bytes, list[tuple[PitchClassSet, int]]]:
+    """Trim each run of packed records down to its keep best shapes, as _pack_shape_records does"""
+    frets, scores = array("b"), array("d")
+    runs = []
+    for mask, shapes in unpack_runs(*packed, strings):
+        keep_best(shapes, keep, ranker)
+        frets.frombytes(shapes.frets())
+        scores.extend(shapes.scores or ())
+        runs.append((mask, len(shapes)))
+    return frets.tobytes(), scores.tobytes(), runs
+
+
+class ScanArgs(NamedTuple):
+    """
+    The settings shared by each chunk of a scan, as passed to the
+    workers scanning them: the shapes to scan for (as for get_shapes),
+    whether each set of pitch classes (indexed by its mask) plays a
+    chord, and how many of the best shapes to keep for each chord, if
+    not all of them.
+
+    Worker processes may not have the parent's chord table (as with
+    the forkserver executor), so are given chord_masks instead. If
+    table is specified, difficulties are looked up from it when
+    scanning with theory_numpy.
+    """
+
+    config: UkeConfig
+    max_fret: int
+    chord_masks: bytes
+    notes: tuple[str, ...] | None = None
+    scanned: tuple[int, float] | None = None
+    keep: int | None = None
+    table: DifficultyTable | None = None
+
+
+def _scan_shape_scores(
+    args: ScanArgs, prefixes: Iterable[tuple[int, ...]] | None = None
+) -> Iterable[Any]:
+    """
+    Return the shapes get_shapes would yield along with their scores:
+    as a list of blocks (from theory_numpy.get_shape_blocks) when
+    scanning with theory_numpy, and otherwise lazily, one at a time.
+    """
+    max_difficulty = args.config.max_difficulty
+    prefix_options = _get_prefix_options(
+        args.config, args.max_fret, args.notes, prefixes, args.scanned
+    )
+    if not theory_numpy:
+        return (
+            shape
+            for options in prefix_options
+            for shape in _get_python_shapes(options, max_difficulty, args.scanned)
+        )
+    return [
+        block
+        for options in prefix_options
+        for block in theory_numpy.get_shape_blocks(
+            options,
+            max_difficulty,
+            _get_block_heads(options, max_difficulty),
+            args.scanned,
+            args.table,
+        )
+    ]
+
+
+def _pack_scanned_shapes(
+    args: ScanArgs, shapes: Iterable[Any], tuning: tuple[str, ...]
+) -> tuple[bytes, bytes, list[tuple[PitchClassSet, int]]]:
+    """Pack shapes from _scan_shape_scores into records, as _pack_shape_records does"""
+    ranker = args.config.shape_ranker
+    if not theory_numpy:
+        return _pack_shape_records(shapes, tuning, args.chord_masks, args.keep, ranker)
+    packed = theory_numpy.pack_records(list(shapes), _get_string_masks(tuning), args.chord_masks)
+    if args.keep is not None:
+        packed = _keep_best_records(packed, len(tuning), args.keep, ranker)
+    return packed
+
+
+def get_shape_records(
+    args: ScanArgs, prefixes: Iterable[tuple[int, ...]] | None = None
+) -> ShapeRecords:
+    """
+    Return the shapes get_shapes would yield which play a chord, packed
+    into records, along with counts of the work done to find them. If
+    args.keep is specified, only the keep best shapes for each chord
+    (according to config.shape_ranker) are returned.
+    """
+    with collect_stats() as stats:
+        shapes = _scan_shape_scores(args, prefixes)
+        packed = _pack_scanned_shapes(args, shapes, args.config.tuning)
+    return ShapeRecords(*packed, stats["counts"])
+
+
+def get_tunings_shape_records(
+    args: ScanArgs,
+    tunings: Sequence[tuple[str, ...]],
+    prefixes: Iterable[tuple[int, ...]] | None = None,
+) -> list[ShapeRecords]:
+    """
+    Return records of the shapes playing a chord under each of tunings
+    (each with as many strings as args.config.tuning), as
+    get_shape_records would for each, but enumerating and scoring
+    shapes only once.
+
+    Counts of the work done are only returned with the first tuning's
+    records, as they cover every tuning.
+    """
+    with collect_stats() as stats:
+        shapes = _scan_shape_scores(args, prefixes)
+        if not theory_numpy:
+            shapes = list(shapes)
+        packed = [_pack_scanned_shapes(args, shapes, tuning) for tuning in tunings]
+    return [
+        ShapeRecords(*records, stats["counts"] if index == 0 else {})
+        for index, records in enumerate(packed)
+    ]
+
+
+# How many chunks of work to split a scan into for each CPU, so that
+# workers finishing quick chunks can take on others while slower ones
+# are still running
+CHUNKS_PER_CPU = 4
+
+
+def get_scan_chunks(
+    config: UkeConfig, max_fret: int, notes: tuple[str, ...] | None, chunks: int
+) -> list[list[tuple[int, ...]]]:
+    """
+    Split a scan into (at least, where possible) the specified number
+    of chunks, each a run of positions for the leading strings.
+
+    As few leading strings are used as give enough chunks, skipping
+    positions which can only lead to too-difficult shapes so that
+    chunks hold similar amounts of work. There are no chunks if every
+    position is skipped.
+    """
+    string_fret_options = get_string_fret_options(config, max_fret, notes)
+    prefixes: list[tuple[int, ...]] = [()]
+    for depth in range(1, len(string_fret_options)):
+        if len(prefixes) >= chunks:
+            break
+        prefixes = list(_bounded_prefixes(string_fret_options, depth, config.max_difficulty))
+    if not prefixes:
+        return []
+    count = min(chunks, len(prefixes))
+    bounds = [len(prefixes) * chunk // count for chunk in range(count + 1)]
+    return [prefixes[start:stop] for start, stop in pairwise(bounds)]
+
+
+def get_difficulty_table(
+    config: UkeConfig, max_fret: int, notes: tuple[str, ...] | None
+) -> DifficultyTable | None:
+    """
+    Return a difficulty table holding every shape a scan could find,
+    for scanning with theory_numpy. If there isn't one yet, an empty
+    one is created for scans of every note (which work out the
+    difficulties of much of the table anyway), unless it would be too
+    big. The scan fills in the difficulties it works out.
+    """
+    if not theory_numpy or config.no_cache:
+        return None
+    if (table := find_difficulty_table(config, max_fret)) is not None or notes:
+        return table
+    table = new_difficulty_table(config, max_fret)
+    if table.size > theory_numpy.MAX_TABLE_SIZE:
+        return None
+    with phase("difficulty_table"):
+        theory_numpy.create_difficulty_table(table)
+    return table
@@ -0,0 +1,82 @@
+"""Opt-in timing of the phases of ukechords' work, and counts of what that work did"""
+
+import time
+from collections.abc import Callable, Iterator, Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .types import Stats
+
+# The stats being collected by collect_stats() (in this thread or
+# task), along with the time spent in phases nested in each phase that
+# is currently running. Nothing is recorded while this is None.
+_collecting: ContextVar[tuple[Stats, list[float]] | None] = ContextVar(
+    "ukechords_stats", default=None
+)
+
+
+def is_collecting() -> bool:
+    """Return whether stats are being collected, for counts that are costly to work out"""
+    return _collecting.get() is not None
+
+
+@contextmanager
+def collect_stats(callback: Callable[[Stats], None] | None = None) -> Iterator[Stats]:
+    """
+    Within this context, record the time spent in each phase of
+    ukechords' work, and count what it did, into the Stats dict
+    provided. When the context exits (even with an exception), the
+    total time is recorded and callback (if specified) is called with
+    the stats.
+
+    Stats are only collected in the current thread (or task). Work
+    done in worker processes or threads returns its counts to be
+    merged in with merge_counts.
+    """
+    stats: Stats = {"time": 0.0, "phases": {}, "counts": {}}
+    token = _collecting.set((stats, []))
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats["time"] = time.perf_counter() - start
+        _collecting.reset(token)
+        if callback is not None:
+            callback(stats)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """
+    Within this context, add the time taken to that of the named
+    phase. Time spent in phases nested within it is only added to those
+    phases, so that the times of all phases add up to (at most) the
+    total time.
+    """
+    if (collecting := _collecting.get()) is None:
+        yield
+        return
+    stats, nested = collecting
+    nested.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        own = elapsed - nested.pop()
+        stats["phases"][name] = stats["phases"].get(name, 0.0) + own
+        if nested:
+            nested[-1] += elapsed
+
+
+def add_count(name: str, amount: int = 1) -> None:
+    """Add amount to the named count"""
+    if (collecting := _collecting.get()) is not None:
+        counts = collecting[0]["counts"]
+        counts[name] = counts.get(name, 0) + amount
+
+
+def merge_counts(counts: Mapping[str, int]) -> None:
+    """Add counts (as collected elsewhere, such as by a worker) to those being collected"""
+    for name, amount in counts.items():
+        add_count(name, amount)
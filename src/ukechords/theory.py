@@ -1,20 +1,63 @@
 """Logic related to music-theory, mostly for stringed instruments"""
 
-import multiprocessing as mp
+import hashlib
+import math
 import os
-from collections.abc import Iterable
+from collections.abc import Callable, Iterable
+from dataclasses import replace
 from functools import cache
-from itertools import permutations, product
-from typing import NoReturn
+from itertools import islice, repeat
+from math import prod
+from typing import Any
 
 from pychord import Chord, QualityManager
-from pychord.analyzer import notes_to_positions
 
 from . import theory_basic
-from .cache import load_scanned_chords, save_scanned_chords
+from .cache import (
+    load_cached_chord,
+    load_chord_table,
+    load_extendable_chords,
+    load_scanned_chords,
+    save_chord_table,
+    save_scanned_chords,
+)
 from .config import UkeConfig
 from .errors import ChordNotFoundException, UnknownTuningException, UnslidableEmptyShapeException
-from .types import BarreData, ChordsByShape, ChordShapes, KeyInfo, Shape
+from .pool import map_chunks, resolve_executor
+from .profiling import memory_checkpoint
+from .scan import (  # pylint: disable=unused-import,useless-import-alias
+    CHUNKS_PER_CPU,
+    ScanArgs,
+    ShapeRecords,
+    best_first_shapes,
+    can_search_best_first,
+    get_difficulty_table,
+    get_scan_chunks,
+    get_shape_mask,
+    get_shape_records,
+    get_shape_scores,
+    get_shapes,
+    get_string_fret_options,
+    get_tunings_shape_records,
+    keep_best,
+    # The shape rankers are defined with the scan but remain part of this module's API
+    rank_shape_by_difficulty as rank_shape_by_difficulty,
+    rank_shape_by_high_fret as rank_shape_by_high_fret,
+    sort_shapes,
+    unpack_runs,
+)
+from .stats import add_count, merge_counts, phase
+from .theory_basic import PitchClassSet, notes_to_mask
+from .types import (
+    BarreData,
+    ChordsByShape,
+    ChordShape,
+    ChordShapes,
+    ChordTable,
+    KeyInfo,
+    Shape,
+    TuningComparison,
+)
 
 
 def add_no5_quality() -> None:
@@ -48,49 +91,121 @@ def _get_quality_map() -> dict[tuple[int, ...], str]:
     return quality_map
 
 
-@cache
+def _stack_positions(intervals: Iterable[int]) -> tuple[int, ...]:
+    """
+    Stack intervals upwards from the first one, the way
+    pychord.analyzer.notes_to_positions stacks notes.
+    """
+    positions: list[int] = []
+    for interval in intervals:
+        if positions:
+            interval += 12 * ((positions[-1] - interval) // 12 + 1)
+        positions.append(interval)
+    return tuple(positions)
+
+
+def _get_qualities_fingerprint() -> str:
+    """Return a fingerprint identifying the current set of known chord qualities"""
+    qualities = sorted((components, name) for components, name in _get_quality_map().items())
+    return hashlib.sha256(repr(qualities).encode()).hexdigest()
+
+
+def _build_chord_table() -> ChordTable:
+    """
+    Build a table of the chords played by each of the 4096 possible
+    sets of pitch classes, by placing each known quality on each root.
+
+    This matches trying every ordering of a set's notes as a stack of
+    intervals over its first note: a quality is only reachable if its
+    components are distinct pitch classes stacked less than an octave
+    apart.
+    """
+    scale_length = len(theory_basic.chromatic_scale)
+    chords: list[list[tuple[int, str]]] = [[] for _ in range(1 << scale_length)]
+    for components, quality in _get_quality_map().items():
+        intervals = [component % scale_length for component in components]
+        if len(set(intervals)) != len(intervals) or _stack_positions(intervals) != components:
+            continue
+        for root in range(scale_length):
+            mask = theory_basic.notes_to_mask(
+                theory_basic.chromatic_scale[root + interval] for interval in intervals
+            )
+            chords[mask].append((root, quality))
+
+    def names(scale: list[str]) -> list[list[str]]:
+        return [
+            sorted(
+                (f"{scale[root]}{quality}" for root, quality in mask_chords), key=_rank_chord_name
+            )
+            for mask_chords in chords
+        ]
+
+    return {
+        "qualities": _get_qualities_fingerprint(),
+        "sharp": names(theory_basic.chromatic_scale),
+        "flat": names(theory_basic.flat_scale),
+    }
+
+
+_chord_tables: dict[str, ChordTable] = {}
+
+
+def _get_chord_table() -> ChordTable:
+    """Return the chord table for the current qualities, building it if needed"""
+    if (table := _chord_tables.get("current")) is None:
+        table = _chord_tables["current"] = _build_chord_table()
+    return table
+
+
+def prepare_chord_table(config: UkeConfig) -> None:
+    """
+    Load the chord table for the currently known chord qualities from
+    the cache, or build it (and cache it) if no matching one is
+    available.
+
+    This should be called after any custom qualities have been added.
+    """
+    fingerprint = _get_qualities_fingerprint()
+    if (current := _chord_tables.get("current")) and current["qualities"] == fingerprint:
+        return
+    with phase("chord_table"):
+        table = None if config.no_cache else load_chord_table(config, fingerprint)
+        if table is None:
+            table = _build_chord_table()
+            if config.cache_dir:
+                save_chord_table(config, table)
+    _chord_tables["current"] = table
+
+
+def _get_chords_from_mask(mask: PitchClassSet, force_flat: bool = False) -> list[str]:
+    """
+    Return a list of chords the specified set of pitch classes will
+    generate. Returns flat versions of those chords if force_flat is
+    True.
+    """
+    add_count("chord_table_lookups")
+    return _get_chord_table()["flat" if force_flat else "sharp"][mask]
+
+
 def _get_chords_from_notes(notes: Iterable[str], force_flat: bool = False) -> list[str]:
     """
     Return a list of chords the specified notes will generate, with no
-    consideration to the order of those notes. Returns flat versions
-    of those chords if force_flat is True.
+    consideration to the order of those notes. Chord roots are spelled
+    the same way as the provided notes, or as flats if force_flat is
+    True.
     """
-    if not notes:
-        return []
+    notes = frozenset(notes)
+    mask = notes_to_mask(notes)
+    if force_flat or all(note in theory_basic.chromatic_scale for note in notes):
+        return _get_chords_from_mask(mask, force_flat)
+    spellings = {theory_basic.note_intervals[note]: note for note in notes}
     chords = []
-    for seq in permutations(notes):
-        root = seq[0]
-        positions: tuple[int, ...] = tuple(notes_to_positions(list(seq), root))
-        if (quality := _get_quality_map().get(positions)) is None:
-            continue
-        if force_flat:
-            chord = f"{theory_basic.flatify(root)}{quality}"
-        else:
-            chord = f"{root}{quality}"
-        chords.append(chord)
+    for chord in _get_chords_from_mask(mask):
+        root = chord[:2] if chord[1:2] == "#" else chord[:1]
+        chords.append(f"{spellings[theory_basic.note_intervals[root]]}{chord[len(root) :]}")
     return sorted(chords, key=_rank_chord_name)
 
 
-def _barreless_shape_difficulty(shape: tuple[int, ...]) -> float:
-    difficulty: float = 0.0 + max(shape) / 10.0
-    last_fretted_position = None
-    for string, position in enumerate(shape):
-        if position > 0:
-            if last_fretted_position:
-                difficulty += (position - last_fretted_position - 1) ** 2 / 1.5
-            last_fretted_position = position
-        elif last_fretted_position:
-            difficulty += 1
-        if position < 0:
-            if string in [0, len(shape) - 1]:
-                difficulty += 5
-            else:
-                difficulty += 7
-        else:
-            difficulty += position
-    return difficulty
-
-
 def _get_tuned_barre_details(
     shape: tuple[int, ...],
     tuning: tuple[str, ...] | None,
@@ -100,8 +215,7 @@ def _get_tuned_barre_details(
     if not tuning:
         return None
     barre_shape = tuple(x - min(shape) for x in shape)
-    chords = sorted(_get_chords_from_notes(frozenset(_get_shape_notes(barre_shape, tuning=tuning))))
-    chords.sort(key=_rank_chord_name)
+    chords = _get_chords_from_mask(get_shape_mask(barre_shape, tuning))
     chord = chords[0] if len(chords) > 0 else None
     barre_data: BarreData = {
         "fret": min(shape),
@@ -116,25 +230,16 @@ def _get_tuned_barre_details(
     return barre_data
 
 
-def _barre_difficulty_details(
-    shape: tuple[int, ...], unbarred_difficulty: float, tuning: tuple[str, ...] | None
+def _get_difficulty_details(
+    shape: tuple[int, ...], scores: theory_basic.ShapeScores, tuning: tuple[str, ...] | None
 ) -> tuple[float, BarreData | None]:
     """
-    Return information on how using a barre to play the given shape
-    (if possible) affects the shape's difficulty.
+    Return a shape's difficulty from its scores, along with information
+    on how barreing the shape (if possible) affects that difficulty.
     """
-    barre_level = min(shape)
-    barrable = len([1 for pos in shape if pos == barre_level])
-    if not (barrable > 1 and barre_level > 0):
-        return unbarred_difficulty, None
-
-    barre_shape = tuple(x - barre_level for x in shape)
-    barre_difficulty = _get_shape_difficulty(barre_shape, tuning=tuning)[0] * 2.2
-    barre_difficulty += barre_level * 3.0
-    barre_difficulty += max(barre_shape) ** 3 / 50
-
-    barred = barre_difficulty < unbarred_difficulty
-    difficulty = barre_difficulty if barred else unbarred_difficulty
+    difficulty, unbarred_difficulty, barre_difficulty = scores
+    if math.isnan(barre_difficulty):
+        return difficulty, None
     details = _get_tuned_barre_details(shape, tuning, barre_difficulty, unbarred_difficulty)
     return difficulty, details
 
@@ -147,9 +252,24 @@ def _get_shape_difficulty(
     information on how barreing the shape affects that difficulty
     where appropriate.
     """
-    difficulty = _barreless_shape_difficulty(shape)
-    difficulty, barre_data = _barre_difficulty_details(shape, difficulty, tuning)
-    return difficulty, barre_data
+    return _get_difficulty_details(shape, get_shape_scores(shape), tuning)
+
+
+def _with_difficulties(
+    shapes: Iterable[tuple[int, ...]], tuning: tuple[str, ...]
+) -> Iterable[tuple[tuple[int, ...], float, BarreData | None]]:
+    """
+    Return each shape with its difficulty and barre details, as from
+    _get_shape_difficulty, using the scores kept with the shapes (as
+    by a ShapeList) where they are.
+    """
+    scores = shapes.iter_scores() if isinstance(shapes, theory_basic.PackedShapes) else None
+    if scores is not None:
+        for shape, shape_scores in zip(shapes, scores):
+            yield shape, *_get_difficulty_details(shape, shape_scores, tuning)
+        return
+    for shape in shapes:
+        yield shape, *_get_shape_difficulty(shape, tuning)
 
 
 def _get_shape_notes(
@@ -174,109 +294,200 @@ def _get_shape_notes(
     return notes
 
 
-def _get_shapes(
-    config: UkeConfig,
-    max_fret: int = 1,
-    notes: tuple[str, ...] | None = None,
-    partition: int = 0,
-    partitions: int = 1,
-) -> Iterable[tuple[int, ...]]:
-    """
-    Yield shapes playable on the fretboard, (optionally including
-    muted strings) up to the specified fret.
-
-    Shapes which are ranked as too-difficult based on the provided
-    configuration will be excluded.
-
-    if notes is specified, limit shapes to those that only use those notes
-    """
-    string_fret_options = []
-    fret_range = range(-1 if config.mute else 0, max_fret + 1)
-    notes_set: set[str] = set()
-    if notes:
-        notes_set = set(theory_basic.flatify(list(notes)))
-    for i, string_note in enumerate(config.tuning):
-        fret_options = []
-        for pos in fret_range:
-            if i == 0 and pos % partitions != partition:
-                continue
-            note = theory_basic.flat_scale[theory_basic.note_intervals[string_note] + pos]
-            if not notes or pos == -1 or note in notes_set:
-                fret_options.append(pos)
-        string_fret_options.append(fret_options)
-    for shape in product(*string_fret_options):
-        if max(shape) >= 0 and _get_shape_difficulty(shape)[0] <= config.max_difficulty:
-            yield tuple(shape)
+def _get_chord_masks() -> bytes:
+    """Return whether each set of pitch classes (indexed by its mask) plays any chord"""
+    return bytes(map(bool, _get_chord_table()["sharp"]))
 
 
-def _get_chord_shapes_map(
-    config: UkeConfig,
-    max_fret: int,
-    allowed_notes: tuple[str, ...] | None = None,
-    partition: int = 0,
-    partitions: int = 1,
-) -> theory_basic.ChordCollection:
-    my_shapes = theory_basic.ChordCollection()
-    for shape in _get_shapes(config, max_fret, allowed_notes, partition, partitions):
-        notes = frozenset(_get_shape_notes(shape, tuning=config.tuning))
-        for chord in _get_chords_from_notes(notes):
-            if chord not in my_shapes:
-                my_shapes[chord] = []
-            my_shapes[chord].append(shape)
-    return my_shapes
+def _merge_shape_records(
+    chord_shapes: theory_basic.ChordCollection,
+    records: ShapeRecords,
+    strings: int,
+    keep: int | None = None,
+    ranker: Callable[[tuple[int, ...]], Any] = sum,
+) -> None:
+    """
+    Add the shapes in records to chord_shapes, in ShapeLists keeping
+    their scores, without decoding them. If keep is specified,
+    only the keep best shapes for each chord according to ranker are
+    kept (best first).
+    """
+    for mask, run in unpack_runs(records.frets, records.scores, records.runs, strings):
+        for chord in _get_chords_from_mask(mask):
+            if chord not in chord_shapes:
+                chord_shapes[chord] = theory_basic.ShapeList(strings, scores=())
+            chord_shapes[chord].extend(run)
+            if keep is not None:
+                keep_best(chord_shapes[chord], keep, ranker)
 
 
-def _scan_chords(
+def _get_notes_filter(
+    tuning: tuple[str, ...], notes: tuple[str, ...]
+) -> Callable[[tuple[int, ...]], bool]:
+    """Return a function identifying shapes which only play the specified notes"""
+    notes_mask = notes_to_mask(notes)
+
+    def shape_filter(shape: tuple[int, ...]) -> bool:
+        return get_shape_mask(shape, tuning) & ~notes_mask == 0
+
+    return shape_filter
+
+
+def scan_chords(
     config: UkeConfig,
     chord_shapes: theory_basic.ChordCollection,
     max_fret: int = 12,
     notes: tuple[str, ...] | None = None,
+    keep: int | None = None,
 ) -> None:
     """
     Based on the provided configuration, scan for possible ways to
     play chords. Store discovered shapes in a theory_basic.ChordCollection that
     maps chords to a list of shapes that will generate the notes of
     that chord.
-    """
-    if not (notes or config.no_cache):
-        if load_scanned_chords(config, chord_shapes, max_fret):
-            return
-
-    def mp_merge_shapes(mp_shapes: theory_basic.ChordCollection) -> None:
-        for chord, shapes in mp_shapes.items():
-            if chord not in chord_shapes:
-                chord_shapes[chord] = []
-            chord_shapes[chord].extend(shapes)
 
-    partitions = cpu_count * 2 if (cpu_count := os.cpu_count()) is not None else 1
-    with mp.get_context("fork").Pool() as pool:
+    If keep is specified, a scan only keeps (at least) the keep best
+    shapes for each chord according to config.shape_ranker, and isn't
+    cached.
 
-        def mp_error(e: BaseException) -> NoReturn:
-            pool.terminate()
-            raise e
+    Shapes are loaded from a cache instead, if one covering this scan
+    exists. When notes are specified, cached shapes are limited to
+    those only playing those notes. Otherwise, if a cache of a
+    narrower scan exists, only the shapes it's missing are scanned
+    for, and the cache is replaced with one extended by them.
 
-        for partition in range(0, partitions):
-            args = (config, max_fret, notes, partition, partitions)
-            pool.apply_async(
-                _get_chord_shapes_map, args=args, callback=mp_merge_shapes, error_callback=mp_error
+    Scans limited to notes are cached separately, keyed by the set of
+    pitch classes in those notes.
+    """
+    scanned = None
+    notes_mask = notes_to_mask(notes) if notes else None
+    if not config.no_cache:
+        shape_filter = _get_notes_filter(config.tuning, notes) if notes else None
+        with phase("cache_load"):
+            if load_scanned_chords(config, chord_shapes, max_fret, notes_mask, shape_filter):
+                return
+            if not notes:
+                scanned = load_extendable_chords(config, chord_shapes, max_fret)
+
+    def mp_merge_shapes(records: ShapeRecords) -> None:
+        merge_counts(records.counts)
+        with phase("identify"):
+            _merge_shape_records(
+                chord_shapes, records, len(config.tuning), keep, config.shape_ranker
             )
-        pool.close()
-        pool.join()
-
-    if notes:
+        memory_checkpoint()
+
+    with phase("scan"):
+        scan_size = prod(map(len, get_string_fret_options(config, max_fret, notes)))
+        executor = resolve_executor(config.executor, scan_size)
+        chunks = 1 if executor == "serial" else CHUNKS_PER_CPU * (os.cpu_count() or 1)
+        scan_chunks = get_scan_chunks(config, max_fret, notes, chunks)
+        table = get_difficulty_table(config, max_fret, notes)
+        args = ScanArgs(config, max_fret, _get_chord_masks(), notes, scanned, keep, table)
+        map_chunks(executor, get_shape_records, (args,), scan_chunks, mp_merge_shapes)
+
+    if keep is not None:
         return
-    save_scanned_chords(config, max_fret=max_fret, chord_shapes=chord_shapes)
+    with phase("cache_save"):
+        # Shape scores are only worked out for shapes held another way
+        # (such as in lists) before the scan
+        save_scanned_chords(config, chord_shapes, max_fret, get_shape_scores, scanned, notes_mask)
 
 
-def rank_shape_by_difficulty(shape: tuple[int, ...]) -> tuple[float, tuple[int, ...]]:
-    """Enable sorting a list of shapes by how hard they are to play"""
-    return _get_shape_difficulty(shape)[0], shape[::-1]
+def _scan_tunings_together(
+    config: UkeConfig,
+    tunings: list[tuple[str, ...]],
+    collections: dict[tuple[str, ...], theory_basic.ChordCollection],
+    keep: int | None = None,
+) -> None:
+    """
+    Scan for the shapes playing each chord under each of tunings (all
+    with the same number of strings) in a single pass, storing them in
+    that tuning's collection in collections, as scan_chords would.
+    """
+    scan_config = replace(config, tuning=tunings[0])
+    max_fret = config.max_fret
+
+    def mp_merge_shapes(records: list[ShapeRecords]) -> None:
+        for tuning, tuning_records in zip(tunings, records):
+            merge_counts(tuning_records.counts)
+            with phase("identify"):
+                _merge_shape_records(
+                    collections[tuning], tuning_records, len(tuning), keep, config.shape_ranker
+                )
+        memory_checkpoint()
+
+    with phase("scan"):
+        scan_size = prod(map(len, get_string_fret_options(scan_config, max_fret, None)))
+        executor = resolve_executor(config.executor, scan_size)
+        chunks = 1 if executor == "serial" else CHUNKS_PER_CPU * (os.cpu_count() or 1)
+        scan_chunks = get_scan_chunks(scan_config, max_fret, None, chunks)
+        table = get_difficulty_table(scan_config, max_fret, None)
+        args = ScanArgs(scan_config, max_fret, _get_chord_masks(), keep=keep, table=table)
+        map_chunks(
+            executor, get_tunings_shape_records, (args, tunings), scan_chunks, mp_merge_shapes
+        )
+
+    if keep is not None:
+        return
+    with phase("cache_save"):
+        for tuning in tunings:
+            save_scanned_chords(replace(config, tuning=tuning), collections[tuning], max_fret)
 
 
-def rank_shape_by_high_fret(shape: tuple[int, ...]) -> tuple[int, ...]:
-    """Enable sorting a list of shapes by how high their fret usage.
-    This accomplishes finding chord shapes by "first position\""""
-    return tuple(sorted(shape, reverse=True))
+def scan_tunings(
+    config: UkeConfig, tunings: Iterable[tuple[str, ...]], keep: int | None = None
+) -> dict[tuple[str, ...], theory_basic.ChordCollection]:
+    """
+    Return the shapes playing each chord under each of tunings (with
+    the rest of config's settings), as a ChordCollection for each, as
+    scan_chords would find them up to config.max_fret.
+
+    Rather than scanning each tuning in turn, shapes are enumerated
+    (and their difficulties worked out) once for every tuning with the
+    same number of strings, and the notes they play are then worked
+    out under each tuning. Tunings which are transpositions of each
+    other play the same shapes as differently named chords, so only
+    one of them is scanned, the rest sharing its ShapeLists.
+
+    Tunings are loaded from caches covering their scan where possible,
+    and are cached once scanned, as with scan_chords.
+    """
+    collections = {tuning: theory_basic.ChordCollection() for tuning in tunings}
+    # The tunings left to scan, by number of strings and then by their normalized tuning
+    unscanned: dict[int, dict[tuple[str, ...], list[tuple[str, ...]]]] = {}
+    for tuning, chord_shapes in collections.items():
+        if not config.no_cache:
+            with phase("cache_load"):
+                tuning_config = replace(config, tuning=tuning)
+                if load_scanned_chords(tuning_config, chord_shapes, config.max_fret):
+                    continue
+        transpositions = unscanned.setdefault(len(tuning), {})
+        transpositions.setdefault(theory_basic.normalize_tuning(tuning)[0], []).append(tuning)
+    for transpositions in unscanned.values():
+        scanned = [tuning for tuning, *_ in transpositions.values()]
+        _scan_tunings_together(config, scanned, collections, keep)
+        for tuning, *others in transpositions.values():
+            for other in others:
+                collections[other] = _transpose_chord_shapes(collections[tuning], tuning, other)
+    return collections
+
+
+def _transpose_chord_shapes(
+    chord_shapes: theory_basic.ChordCollection, tuning: tuple[str, ...], other: tuple[str, ...]
+) -> theory_basic.ChordCollection:
+    """
+    Return the shapes playing each chord under other (a transposition
+    of tuning), from those for tuning in chord_shapes, sharing its
+    ShapeLists.
+    """
+    semitones = theory_basic.normalize_tuning(other)[1] - theory_basic.normalize_tuning(tuning)[1]
+    return theory_basic.ChordCollection(
+        {
+            theory_basic.transpose_chord(chord, semitones): shapes
+            for chord, shapes in chord_shapes.items()
+        }
+    )
 
 
 def _rank_chord_name(name: str) -> tuple[bool, bool, int, str]:
@@ -305,7 +516,12 @@ def lookup_tuning(tuning_spec: str) -> tuple[str, ...]:
 def _get_other_names(
     shape: tuple[int, ...], chord_name: str, tuning: tuple[str, ...]
 ) -> Iterable[str]:
-    for chord in _get_chords_from_notes(_get_shape_notes(shape, tuning)):
+    mask = get_shape_mask(shape, tuning)
+    # Other names are identified from every note the shape plays, not
+    # just the set of them, so shapes that double up a note have none
+    if mask.bit_count() != sum(1 for position in shape if position >= 0):
+        return
+    for chord in _get_chords_from_mask(mask):
         if theory_basic.normalize_chord(chord) != theory_basic.normalize_chord(chord_name):
             yield chord
 
@@ -320,13 +536,71 @@ def _sanitize_notes(notes: list[str]) -> tuple[str, ...]:
     return tuple(map(sanitizer, notes))
 
 
-def show_chord(config: UkeConfig, chord: str) -> ChordShapes:
+def _find_chord_shapes(
+    config: UkeConfig,
+    chord: str,
+    notes: tuple[str, ...],
+    chord_shapes: theory_basic.ChordCollection | None = None,
+) -> list[tuple[int, ...]] | theory_basic.ShapeList:
+    """
+    Return the shapes which play a chord (made of the specified notes),
+    best first according to config.shape_ranker, and limited to
+    config.num shapes if set.
+
+    If chord_shapes (from an earlier scan) is specified, the shapes are
+    taken from it. Otherwise, when only a few shapes are needed and the
+    ranker supports it, find them with a best-first search rather than
+    scanning every shape. Failing that, read just this chord's shapes
+    from a cache covering it, or scan for shapes playing only its
+    notes.
+    """
+    if chord_shapes is None and config.num and can_search_best_first(config.shape_ranker):
+        name = theory_basic.normalize_chord(chord)
+        matches: dict[PitchClassSet, bool] = {}
+
+        def plays_chord(shape: tuple[int, ...]) -> bool:
+            mask = get_shape_mask(shape, config.tuning)
+            if mask not in matches:
+                chords = _get_chords_from_mask(mask)
+                matches[mask] = any(theory_basic.normalize_chord(c) == name for c in chords)
+            return matches[mask]
+
+        best_shapes = filter(plays_chord, best_first_shapes(config, config.max_fret, notes))
+        with phase("search"):
+            return list(islice(best_shapes, config.num))
+    shapes: list[tuple[int, ...]] | theory_basic.ShapeList | None = None
+    if chord_shapes is not None:
+        # Shapes ranked equally are ordered as a best-first search would
+        shapes = chord_shapes[chord].copy() if chord in chord_shapes else []
+        shapes.sort()
+    elif not config.no_cache:
+        with phase("cache_load"):
+            shapes = load_cached_chord(config, chord, config.max_fret, notes_to_mask(notes))
+    if shapes is None:
+        chord_shapes = theory_basic.ChordCollection()
+        scan_chords(config, chord_shapes, config.max_fret, notes)
+        if chord not in chord_shapes:
+            return []
+        shapes = chord_shapes[chord]
+    with phase("sort"):
+        sort_shapes(shapes, config.shape_ranker)
+    del shapes[config.num or len(shapes) :]
+    return shapes
+
+
+def show_chord(
+    config: UkeConfig, chord: str, chord_shapes: theory_basic.ChordCollection | None = None
+) -> ChordShapes:
     """Return information on how to play a given chord, including:
 
     - Shape options for playing it, including their difficulty and
       barre instructions
     - Other names
     - Optionally the notes in the chord, if config.show_notes is set
+
+    If chord_shapes is specified, shapes are taken from it rather than
+    scanned for (or loaded from cache), so it must hold the result of
+    a full scan with the same configuration.
     """
     output: ChordShapes = {"shapes": []}
     try:
@@ -336,18 +610,13 @@ def show_chord(config: UkeConfig, chord: str) -> ChordShapes:
     notes = _sanitize_notes(p_chord.components(visible=True))
     if config.show_notes:
         output["notes"] = notes
-    chord_shapes = theory_basic.ChordCollection()
-    _scan_chords(config, chord_shapes, notes=notes)
-    if chord not in chord_shapes:
+    if not (shapes := _find_chord_shapes(config, chord, notes, chord_shapes)):
         output["chord"] = chord
         return output
-    shapes = chord_shapes[chord]
-    shapes.sort(key=config.shape_ranker)
     other_names = None
-    for shape in shapes[: config.num or len(shapes)]:
+    for shape, difficulty, barre_data in _with_difficulties(shapes, config.tuning):
         if not other_names:
             other_names = list(_get_other_names(shape, chord, config.tuning))
-        difficulty, barre_data = _get_shape_difficulty(shape, tuning=config.tuning)
         output["shapes"].append(
             {
                 "shape": shape,
@@ -360,28 +629,39 @@ def show_chord(config: UkeConfig, chord: str) -> ChordShapes:
 
 
 def _chord_built_from_notes(chord: str, notes: tuple[str, ...]) -> bool:
-    for note in theory_basic.sharpify(Chord(chord).components(visible=True)):
-        if note not in theory_basic.sharpify(list(notes)):
-            return False
-    return True
+    chord_mask = notes_to_mask(Chord(chord).components(visible=True))
+    return chord_mask & ~notes_to_mask(notes) == 0
 
 
-def show_all(config: UkeConfig) -> ChordShapes:
+def show_all(
+    config: UkeConfig, chord_shapes: theory_basic.ChordCollection | None = None
+) -> ChordShapes:
     """Return one way to play each known/specified chord
 
     If config.{key,qualities,allowed_chords} are set, they will
     restrict which chords are returned accordingly
+
+    If chord_shapes is specified, shapes are taken from it rather than
+    scanned for, as with show_chord. Otherwise, when config.num is set,
+    a scan only keeps that many shapes for each chord, and isn't cached
+    unless config.full_scan is set.
     """
     notes: list[str] = []
-    chord_shapes = theory_basic.ChordCollection()
     for key in config.keys or []:
         notes.extend(theory_basic.get_key_notes(key))
     for chord in config.allowed_chords or []:
         notes.extend(Chord(chord).components(visible=True))
     if notes and any(map(theory_basic.is_flat, notes)):
         config.force_flat = True
-    _scan_chords(config, chord_shapes, notes=tuple(notes))
-    ichords = list(chord_shapes.keys())
+    if chord_shapes is None:
+        chord_shapes = theory_basic.ChordCollection()
+        keep = None if config.full_scan else config.num
+        scan_chords(config, chord_shapes, config.max_fret, tuple(notes), keep)
+        ichords = list(chord_shapes.keys())
+    else:
+        # Keep only the chords a scan limited to the notes would find
+        notes_filter = _get_notes_filter(config.tuning, tuple(notes))
+        ichords = [c for c in chord_shapes if not notes or notes_filter(chord_shapes[c][0])]
     sort_offset = 0
     if config.keys:
         sort_offset = theory_basic.note_intervals[theory_basic.get_key_notes(config.keys[0])[0]]
@@ -393,15 +673,19 @@ def show_all(config: UkeConfig) -> ChordShapes:
     ichords.sort(key=chord_sorter)
     output: ChordShapes = {"shapes": []}
     for chord in ichords:
-        chord_shapes[chord].sort(key=config.shape_ranker)
+        # Sort a copy, leaving any chord_shapes passed in as they were
+        shapes = chord_shapes[chord].copy()
+        with phase("sort"):
+            sort_shapes(shapes, config.shape_ranker)
         if config.force_flat:
             chord = theory_basic.flatify(Chord(chord).root) + Chord(chord).quality.quality
         if config.qualities and Chord(chord).quality.quality not in config.qualities:
             continue
         if notes and not _chord_built_from_notes(chord, tuple(notes)):
             continue
-        for shape in chord_shapes[chord][0 : config.num]:
-            difficulty, barre_data = _get_shape_difficulty(shape, tuning=config.tuning)
+        for shape, difficulty, barre_data in islice(
+            _with_difficulties(shapes, config.tuning), config.num
+        ):
             if difficulty > config.max_difficulty:
                 continue
             output["shapes"].append(
@@ -415,6 +699,56 @@ def show_all(config: UkeConfig) -> ChordShapes:
     return output
 
 
+def _get_easiest_shape(
+    config: UkeConfig, chord: str, chord_shapes: theory_basic.ChordCollection
+) -> ChordShape | None:
+    """Return the easiest shape in chord_shapes playing chord, or None if there isn't one"""
+    shapes = _find_chord_shapes(replace(config, num=1), chord, (), chord_shapes)
+    for shape, difficulty, barre_data in _with_difficulties(shapes, config.tuning):
+        return {
+            "shape": shape,
+            "difficulty": difficulty,
+            "barre_data": barre_data,
+            "chord_names": [chord],
+        }
+    return None
+
+
+def compare_tunings(
+    config: UkeConfig, tunings: Iterable[tuple[str, ...]], chords: Iterable[str]
+) -> TuningComparison:
+    """Return how easily each of tunings plays the given chords,
+    including the easiest shape for each chord under each tuning.
+
+    Tunings are scanned together, as by scan_tunings, and ranked best
+    first: those playing the most chords, and then those with the
+    lowest total difficulty. When config.num is set, scans only keep
+    that many shapes for each chord, and aren't cached unless
+    config.full_scan is set.
+    """
+    output: TuningComparison = {"chords": list(chords), "tunings": []}
+    for chord in output["chords"]:
+        try:
+            Chord(chord)
+        except ValueError as exc:
+            raise ChordNotFoundException(f'Error looking up chord "{chord}"') from exc
+    keep = None if config.full_scan else config.num
+    for tuning, chord_shapes in scan_tunings(config, tunings, keep).items():
+        tuning_config = replace(config, tuning=tuning)
+        easiest = [_get_easiest_shape(tuning_config, c, chord_shapes) for c in output["chords"]]
+        playable = [shape["difficulty"] for shape in easiest if shape]
+        output["tunings"].append(
+            {
+                "tuning": tuning,
+                "shapes": easiest,
+                "playable": len(playable),
+                "difficulty": sum(playable),
+            }
+        )
+    output["tunings"].sort(key=lambda summary: (-summary["playable"], summary["difficulty"]))
+    return output
+
+
 def _slide_shape(shape: tuple[int, ...]) -> Iterable[tuple[int, ...]]:
     if not any(fret > 0 for fret in shape):
         raise UnslidableEmptyShapeException("Sliding an empty shape doesn't make sense")
@@ -433,7 +767,7 @@ def _get_chords_by_shape(
         shapes.extend(_slide_shape(pshape))
     for shape in shapes:
         notes = _get_shape_notes(shape, tuning=config.tuning, force_flat=config.force_flat)
-        chords = _get_chords_from_notes(frozenset(notes), config.force_flat)
+        chords = _get_chords_from_mask(get_shape_mask(shape, config.tuning), config.force_flat)
         if config.qualities:
             chords = [c for c in chords if Chord(c).quality.quality in config.qualities]
         if chords:
@@ -445,8 +779,9 @@ def show_chords_by_shape(config: UkeConfig, input_shape: tuple[str, ...]) -> Cho
     pshape = tuple(-1 if pos == "x" else int(pos) for pos in input_shape)
     shapes: list[Shape] = []
 
-    for shape, chords, notes in _get_chords_by_shape(config, pshape):
-        shapes.append({"shape": shape, "chords": chords, "notes": tuple(notes)})
+    with phase("identify"):
+        for shape, chords, notes in _get_chords_by_shape(config, pshape):
+            shapes.append({"shape": shape, "chords": chords, "notes": tuple(notes)})
     if not shapes:
         notes = set(_get_shape_notes(pshape, tuning=config.tuning, force_flat=config.force_flat))
         shapes.append({"shape": pshape, "chords": [], "notes": tuple(notes)})
@@ -457,21 +792,38 @@ def show_chords_by_shape(config: UkeConfig, input_shape: tuple[str, ...]) -> Cho
     return {"shapes": shapes}
 
 
-def show_chords_by_notes(config: UkeConfig, notes: set[str]) -> ChordShapes:
-    """Return information on what chords are played by the specified notes"""
+def show_chords_by_notes(
+    config: UkeConfig, notes: set[str], chord_shapes: theory_basic.ChordCollection | None = None
+) -> ChordShapes:
+    """Return information on what chords are played by the specified notes
+
+    If chord_shapes is specified, shapes are taken from it rather than
+    scanned for, as with show_chord, as long as the notes make up a
+    chord
+    """
     normalizer = theory_basic.sharpify
     if config.force_flat or any(note[-1] == "b" for note in notes):
         normalizer = theory_basic.flatify
     output: ChordShapes = {"notes": normalizer(tuple(notes)), "shapes": []}
-    shapes = []
-    for shape in _get_shapes(config, 12, notes=tuple(notes)):
-        shape_notes = set(normalizer(_get_shape_notes(shape, tuning=config.tuning)))
-        if shape_notes == normalizer(notes):
-            shapes.append(shape)
-    shapes.sort(key=config.shape_ranker)
-    chords = _get_chords_from_notes(frozenset(notes))
-    for shape in shapes[: config.num or len(shapes)]:
-        difficulty, barre_data = _get_shape_difficulty(shape, tuning=config.tuning)
+    notes_mask = notes_to_mask(notes)
+    chords = _get_chords_from_notes(notes)
+    candidates: Iterable[tuple[int, ...]] = []
+    if chord_shapes is None or not chords:
+        candidates = get_shapes(config, config.max_fret, notes=tuple(notes))
+    elif chords[0] in chord_shapes:
+        candidates = chord_shapes[chords[0]]
+    shapes = theory_basic.ShapeList(len(config.tuning), scores=())
+    with phase("scan"):
+        scores: Iterable[theory_basic.ShapeScores | None] = repeat(None)
+        if isinstance(candidates, theory_basic.PackedShapes):
+            scores = candidates.iter_scores() or scores
+        for shape, shape_scores in zip(candidates, scores):
+            if get_shape_mask(shape, config.tuning) == notes_mask:
+                shapes.append(shape, shape_scores or get_shape_scores(shape))
+    with phase("sort"):
+        sort_shapes(shapes, config.shape_ranker)
+    del shapes[config.num or len(shapes) :]
+    for shape, difficulty, barre_data in _with_difficulties(shapes, config.tuning):
         output["shapes"].append(
             {
                 "shape": shape,
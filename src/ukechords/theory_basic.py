@@ -1,11 +1,204 @@
 """Basic music theory elements, not necessarily including stringed instruments or chord qualities"""
 
 import re
-from collections.abc import Iterable
-from typing import Any, TypeVar
+import struct
+from abc import abstractmethod
+from array import array
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from functools import cache
+from itertools import chain
+from typing import Any, TypeVar, overload
 
 from .errors import ChordNotFoundException, UnknownKeyException
 
+# How hard a shape is to play: its difficulty, along with its
+# difficulty when played without and with a barre (NaN if it can't be
+# barred), from which the details of barreing it are worked out
+ShapeScores = tuple[float, float, float]
+
+
+class PackedShapes(Sequence[tuple[int, ...]]):
+    """
+    Shapes packed as one signed byte per string, along with the scores
+    of each shape where known. Shapes are only decoded into tuples as
+    they're accessed.
+    """
+
+    def __init__(self, strings: int) -> None:
+        self.strings = strings
+
+    @abstractmethod
+    def frets(self, start: int = 0, stop: int | None = None) -> memoryview:
+        """Return the packed frets of the shapes from start up to stop (or the end)"""
+
+    @property
+    @abstractmethod
+    def scores(self) -> Sequence[float] | None:
+        """The ShapeScores of each shape (three values per shape), if known"""
+
+    @property
+    def difficulties(self) -> Sequence[float] | None:
+        """The difficulty of each shape, if known"""
+        return None if (scores := self.scores) is None else scores[::3]
+
+    def iter_scores(self) -> Iterator[ShapeScores] | None:
+        """Return an iterator over the ShapeScores of each shape, if known"""
+        if (scores := self.scores) is None:
+            return None
+        values = iter(scores)
+        return zip(values, values, values)
+
+    def __iter__(self) -> Iterator[tuple[int, ...]]:
+        return struct.iter_unpack(f"{self.strings}b", self.frets())
+
+    @overload
+    def __getitem__(self, index: int) -> tuple[int, ...]: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[tuple[int, ...]]: ...
+
+    def __getitem__(self, index: int | slice) -> tuple[int, ...] | list[tuple[int, ...]]:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1 or stop <= start:
+                return list(self)[index]
+            return list(struct.iter_unpack(f"{self.strings}b", self.frets(start, stop)))
+        if not -len(self) <= index < len(self):
+            raise IndexError("shape index out of range")
+        index %= len(self)
+        return tuple(self.frets(index, index + 1).cast("b"))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (PackedShapes, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self)!r})"
+
+
+class ShapeList(PackedShapes):
+    """
+    A list of shapes which can be added to and sorted, compactly held
+    in arrays rather than as a tuple object for each shape.
+
+    If scores is specified (even if empty), the ShapeScores of every
+    shape are kept, and must be given for any shapes added.
+    """
+
+    def __init__(
+        self,
+        strings: int,
+        shapes: Iterable[tuple[int, ...]] = (),
+        scores: Iterable[ShapeScores] | None = None,
+    ) -> None:
+        super().__init__(strings)
+        self._frets = array("b")
+        self._scores = None if scores is None else array("d")
+        self.extend(shapes, scores)
+
+    @classmethod
+    def from_packed(cls, shapes: PackedShapes) -> "ShapeList":
+        """Return a ShapeList of packed shapes (and their scores, if known)"""
+        copied = cls(shapes.strings, scores=None if shapes.scores is None else ())
+        copied.extend(shapes)
+        return copied
+
+    @classmethod
+    def frombytes(cls, strings: int, frets: bytes, scores: bytes | None = None) -> "ShapeList":
+        """
+        Return a ShapeList of shapes packed as by frets, along with
+        their scores if specified (packed as three native doubles per
+        shape).
+        """
+        shapes = cls(strings)
+        shapes._frets.frombytes(frets)
+        if scores is not None:
+            shapes._scores = array("d", scores)
+            if len(shapes._scores) != len(shapes) * 3:
+                raise ValueError("Scores are needed for every shape in a ShapeList")
+        return shapes
+
+    def copy(self) -> "ShapeList":
+        """Return a copy of this ShapeList, as list.copy does"""
+        return ShapeList.from_packed(self)
+
+    def frets(self, start: int = 0, stop: int | None = None) -> memoryview:
+        stop = len(self) if stop is None else stop
+        return memoryview(self._frets)[start * self.strings : stop * self.strings]
+
+    @property
+    def scores(self) -> Sequence[float] | None:
+        return self._scores
+
+    def __len__(self) -> int:
+        return len(self._frets) // self.strings
+
+    def extend(
+        self, shapes: Iterable[tuple[int, ...]], scores: Iterable[ShapeScores] | None = None
+    ) -> None:
+        """
+        Add shapes, along with their scores if they're kept (which are
+        taken from shapes, if packed, when not specified).
+        """
+        packed_scores = None
+        if scores is None and isinstance(shapes, PackedShapes):
+            packed_scores = shapes.scores
+        if self._scores is not None and scores is None and packed_scores is None:
+            raise ValueError("Scores are needed for shapes added to this ShapeList")
+        count = len(self)
+        if isinstance(shapes, PackedShapes) and shapes.strings == self.strings:
+            self._frets.frombytes(shapes.frets())
+        else:
+            self._frets.extend(chain.from_iterable(shapes))
+        if self._scores is None:
+            return
+        if scores is not None:
+            self._scores.extend(chain.from_iterable(scores))
+        elif packed_scores is not None:
+            self._scores.extend(packed_scores)
+        if len(self._scores) != len(self) * 3:
+            del self._frets[count * self.strings :], self._scores[count * 3 :]
+            raise ValueError("Scores are needed for every shape added to this ShapeList")
+
+    def append(self, shape: tuple[int, ...], scores: ShapeScores | None = None) -> None:
+        """Add a shape, along with its scores if they're kept"""
+        self.extend([shape], None if scores is None else [scores])
+
+    def __delitem__(self, index: slice) -> None:
+        start, stop, step = index.indices(len(self))
+        if step != 1:
+            raise ValueError("Only contiguous runs of shapes can be removed from a ShapeList")
+        stop = max(start, stop)
+        del self._frets[start * self.strings : stop * self.strings]
+        if self._scores is not None:
+            del self._scores[start * 3 : stop * 3]
+
+    def sort(
+        self, *, key: Callable[[tuple[int, ...]], Any] | None = None, reverse: bool = False
+    ) -> None:
+        """Sort the shapes in place as list.sort does, working out each shape's key only once"""
+        shapes = list(self)
+        self._reorder(shapes, shapes if key is None else list(map(key, shapes)), reverse)
+
+    def sort_scored(
+        self, *, key: Callable[[tuple[int, ...], ShapeScores], Any], reverse: bool = False
+    ) -> None:
+        """Sort the shapes in place as sort does, by a key of each shape and its scores"""
+        if (scores := self.iter_scores()) is None:
+            raise ValueError("This ShapeList doesn't keep the scores of its shapes")
+        shapes = list(self)
+        self._reorder(shapes, list(map(key, shapes, scores)), reverse)
+
+    def _reorder(self, shapes: list[tuple[int, ...]], keys: list[Any], reverse: bool) -> None:
+        order = sorted(range(len(shapes)), key=keys.__getitem__, reverse=reverse)
+        self._frets = array("b", chain.from_iterable(map(shapes.__getitem__, order)))
+        if self._scores is not None:
+            scores = self._scores
+            self._scores = array("d", chain.from_iterable(scores[i * 3 : i * 3 + 3] for i in order))
+
 
 class ChordCollection(dict[str, Any]):
     """A specialization of a dictionary, which normalizes chord names
@@ -23,8 +216,14 @@ class ChordCollection(dict[str, Any]):
     def __setitem__(self, chord: str, /, *args: Any, **kwargs: Any) -> None:
         super().__setitem__(normalize_chord(str(chord)), *args, **kwargs)
 
-    def __getitem__(self, chord: str) -> list[tuple[int, ...]]:
-        shapes: list[tuple[int, ...]] = super().__getitem__(normalize_chord(str(chord)))
+    def __getitem__(self, chord: str) -> list[tuple[int, ...]] | ShapeList:
+        chord = normalize_chord(str(chord))
+        shapes = super().__getitem__(chord)
+        if isinstance(shapes, (list, ShapeList)):
+            return shapes
+        # Lazily loaded shapes (eg from a cache) are read on first use
+        shapes = ShapeList.from_packed(shapes) if isinstance(shapes, PackedShapes) else list(shapes)
+        super().__setitem__(chord, shapes)
         return shapes
 
 
@@ -47,6 +246,24 @@ note_intervals |= {note: index for index, note in enumerate(flat_scale)}
 
 note_intervals |= {weird: note_intervals[normal] for weird, normal in _weird_notes.items()}
 
+# A set of pitch classes, as a 12-bit integer with bit N set when
+# chromatic_scale[N] is included
+PitchClassSet = int
+
+
+def notes_to_mask(notes: Iterable[str]) -> PitchClassSet:
+    """Return the set of pitch classes played by the specified notes"""
+    mask = 0
+    for note in notes:
+        mask |= 1 << note_intervals[note]
+    return mask
+
+
+def mask_to_notes(mask: PitchClassSet, force_flat: bool = False) -> tuple[str, ...]:
+    """Return the notes in a set of pitch classes, in the flat versions if force_flat is True"""
+    scale = flat_scale if force_flat else chromatic_scale
+    return tuple(scale[interval] for interval in range(len(scale)) if mask >> interval & 1)
+
 
 def normalize_chord(chord: str) -> str:
     """For duplicate and match detection, convert to a canonical
@@ -59,6 +276,30 @@ def normalize_chord(chord: str) -> str:
     return f"{sharpify(root)}{quality}"
 
 
+def transpose_chord(chord: str, semitones: int) -> str:
+    """Return the canonical sharp version of a chord, transposed up by semitones"""
+    chord = normalize_chord(chord)
+    root = chord[:2] if chord[1:2] == "#" else chord[:1]
+    return f"{chromatic_scale[note_intervals[root] + semitones]}{chord[len(root) :]}"
+
+
+def transpose_mask(mask: PitchClassSet, semitones: int) -> PitchClassSet:
+    """Return a set of pitch classes, transposed up by semitones"""
+    semitones %= len(chromatic_scale)
+    rotated = mask << semitones | mask >> len(chromatic_scale) - semitones
+    return rotated & (1 << len(chromatic_scale)) - 1
+
+
+def normalize_tuning(tuning: tuple[str, ...]) -> tuple[tuple[str, ...], int]:
+    """
+    Return a tuning transposed so that its first string is tuned to C,
+    along with how many semitones the tuning is above that. Tunings
+    which are transpositions of each other normalize to the same one.
+    """
+    offset = note_intervals[tuning[0]] if tuning else 0
+    return tuple(chromatic_scale[note_intervals[note] - offset] for note in tuning), offset
+
+
 Normalizable = TypeVar("Normalizable", str, list[str], tuple[str, ...], set[str])
 
 
@@ -126,16 +367,22 @@ def _get_all_keys() -> dict[str, set[str]]:
     return dict(_get_all_key_pairs())
 
 
+@cache
+def _get_all_key_masks() -> dict[str, PitchClassSet]:
+    return {key: notes_to_mask(notes) for key, notes in _get_all_keys().items()}
+
+
 def get_dupe_scales_from_notes(notes: tuple[str, ...]) -> tuple[set[str], set[str]]:
     """Given a set of notes, return a list of scales those notes fit in"""
     matching_keys: list[str] = []
     partial_keys: list[str] = []
-    for key, key_notes in _get_all_keys().items():
+    notes_mask = notes_to_mask(notes)
+    for key, key_mask in _get_all_key_masks().items():
         if "chromatic" in key:
             continue
-        if set(sharpify(notes)) == set(sharpify(key_notes)):
+        if notes_mask == key_mask:
             matching_keys.append(key)
-        if set(sharpify(notes)) < sharpify(key_notes):
+        elif notes_mask & ~key_mask == 0:
             partial_keys.append(key)
     return set(matching_keys), set(partial_keys)
 
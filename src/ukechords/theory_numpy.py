@@ -0,0 +1,274 @@
+"""Optional NumPy-backed engine to enumerate and score shapes in bulk
+
+This module mirrors the shape enumeration and difficulty heuristics
+in the scan module, but evaluates whole blocks of shapes as integer
+matrices. It produces exactly the same shapes (in the same order) and
+scores as the pure-python implementation, and is only used when NumPy
+is installed.
+
+Difficulties only depend on the frets of a shape, so scans can look
+them up from a DifficultyTable (shared by every tuning with the same
+number of strings) rather than working them out again. Tables start
+out empty, and are filled in by the scans looking difficulties up.
+"""
+
+import os
+from collections.abc import Callable, Iterable, Sequence
+from functools import partial
+from itertools import product
+
+import numpy as np
+import numpy.typing as npt
+
+from .cache import DifficultyTable
+from .stats import add_count, is_collecting
+
+IntArray = npt.NDArray[np.int64]
+FloatArray = npt.NDArray[np.float64]
+
+# The largest number of shapes to evaluate as a single block. Leading
+# strings are pruned before blocks are built, so smaller blocks waste
+# less work on shapes that could never be playable.
+BLOCK_SIZE = 1 << 12
+
+# The most shapes to build a difficulty table for, each taking 8 bytes
+# on disk. Tables for more strings than this allows aren't used.
+MAX_TABLE_SIZE = 1 << 24
+
+# Difficulty tables memory mapped by this process, by filename, along
+# with the inode of the file they were mapped from
+_mapped_tables: dict[str, tuple[int, FloatArray]] = {}
+
+
+def barreless_difficulties(shapes: IntArray) -> FloatArray:
+    """Vectorized equivalent of scan._barreless_shape_difficulty,
+    for a 2-dimensional array with one shape per row"""
+    count, strings = shapes.shape
+    difficulty: FloatArray = shapes.max(axis=1) / 10.0
+    last_fretted = np.zeros(count, dtype=np.int64)
+    for string in range(strings):
+        position = shapes[:, string]
+        fretted = position > 0
+        after_fretted = last_fretted > 0
+        gaps = (position - last_fretted - 1) ** 2 / 1.5
+        difficulty += np.where(fretted & after_fretted, gaps, 0.0)
+        difficulty += np.where(~fretted & after_fretted, 1.0, 0.0)
+        last_fretted = np.where(fretted, position, last_fretted)
+        mute_penalty = 5.0 if string in [0, strings - 1] else 7.0
+        difficulty += np.where(position < 0, mute_penalty, position)
+    return difficulty
+
+
+def create_difficulty_table(table: DifficultyTable) -> None:
+    """
+    Create the file for table, with no difficulties worked out yet (as
+    NaN). Scans looking difficulties up from it fill them in as they
+    work them out.
+    """
+    filename = f"{table.filename}.{os.getpid()}.tmp"
+    values = np.lib.format.open_memmap(filename, "w+", np.float64, (table.size,))
+    values.fill(np.nan)
+    values.flush()
+    del values
+    os.replace(filename, table.filename)
+
+
+def _map_difficulty_table(table: DifficultyTable) -> FloatArray | None:
+    """
+    Memory map the difficulties in table (to be filled in), if it can
+    be read and written. The mapping is reused until the file is
+    replaced (which filling it in doesn't do, unlike creating it).
+    """
+    try:
+        inode = os.stat(table.filename).st_ino
+    except OSError:
+        _mapped_tables.pop(table.filename, None)
+        return None
+    if (mapped := _mapped_tables.get(table.filename)) is not None and mapped[0] == inode:
+        return mapped[1]
+    _mapped_tables.pop(table.filename, None)
+    try:
+        values: FloatArray = np.load(table.filename, mmap_mode="r+")
+    except (OSError, ValueError):
+        return None
+    if values.dtype != np.float64 or values.shape != (table.size,):
+        return None
+    _mapped_tables[table.filename] = inode, values
+    return values
+
+
+def _table_difficulties(table: DifficultyTable, values: FloatArray, shapes: IntArray) -> FloatArray:
+    """
+    Look up the barreless difficulties of shapes (one per row) in a
+    difficulty table, working out any it doesn't hold yet and filling
+    them in.
+    """
+    radix = table.max_fret + 1 + table.mute
+    powers = radix ** np.arange(table.strings - 1, -1, -1, dtype=np.int64)
+    indices = (shapes + table.mute) @ powers
+    difficulties: FloatArray = np.asarray(values[indices])
+    if (missing := np.isnan(difficulties)).any():
+        difficulties[missing] = barreless_difficulties(shapes[missing])
+        values[indices[missing]] = difficulties[missing]
+    return difficulties
+
+
+def get_barreless_difficulties(
+    table: DifficultyTable | None,
+) -> Callable[[IntArray], FloatArray]:
+    """
+    Return a function working out the barreless difficulties of shapes
+    (one per row), looking them up in table if it's specified (and
+    holds every shape passed) and can be read.
+    """
+    if table is None or (values := _map_difficulty_table(table)) is None:
+        return barreless_difficulties
+    return partial(_table_difficulties, table, values)
+
+
+def shape_scores(
+    shapes: IntArray, barreless: Callable[[IntArray], FloatArray] = barreless_difficulties
+) -> FloatArray:
+    """Vectorized equivalent of scan.get_shape_scores, for a
+    2-dimensional array with one shape per row, returning a row of
+    scores for each. The barreless difficulties of shapes are worked
+    out by barreless."""
+    scores = np.empty((len(shapes), 3))
+    scores[:, 1] = barreless(shapes)
+    scores[:, 2] = np.nan
+    barre_level = shapes.min(axis=1)
+    barrable = (barre_level > 0) & ((shapes == barre_level[:, None]).sum(axis=1) > 1)
+    if barrable.any():
+        barre_level = barre_level[barrable]
+        barre_shapes = shapes[barrable] - barre_level[:, None]
+        barre_difficulty = barreless(barre_shapes) * 2.2
+        barre_difficulty += barre_level * 3.0
+        barre_difficulty += barre_shapes.max(axis=1) ** 3 / 50
+        scores[barrable, 2] = barre_difficulty
+    barred = scores[:, 2] < scores[:, 1]
+    scores[:, 0] = np.where(barred, scores[:, 2], scores[:, 1])
+    return scores
+
+
+def _grid(string_fret_options: Sequence[Sequence[int]]) -> IntArray:
+    """Return every combination of the given fret options as rows, in
+    the same order itertools.product would produce them"""
+    if not string_fret_options:
+        return np.zeros((1, 0), dtype=np.int64)
+    axes = [np.array(options, dtype=np.int64) for options in string_fret_options]
+    columns = np.meshgrid(*axes, indexing="ij")
+    return np.stack(columns, axis=-1).reshape(-1, len(axes))
+
+
+def get_block_split(string_fret_options: Sequence[Sequence[int]]) -> int:
+    """
+    Return how many leading strings should be enumerated one
+    combination at a time, so that the fret options of the rest fit in
+    a single block.
+    """
+    split = len(string_fret_options)
+    block_size = 1
+    while split > 0 and block_size * len(string_fret_options[split - 1]) <= BLOCK_SIZE:
+        split -= 1
+        block_size *= len(string_fret_options[split])
+    return split
+
+
+def get_shape_blocks(
+    string_fret_options: Sequence[Sequence[int]],
+    max_difficulty: float,
+    heads: Iterable[tuple[int, ...]] | None = None,
+    scanned: tuple[int, float] | None = None,
+    table: DifficultyTable | None = None,
+) -> Iterable[tuple[IntArray, FloatArray]]:
+    """
+    Yield the shapes get_shapes would, as blocks with one shape per
+    row, along with the scores of each shape (as from shape_scores).
+
+    If table is specified, it must hold every shape of these fret
+    options, and their barreless difficulties are looked up from it.
+    """
+    if not all(string_fret_options):
+        return
+    split = get_block_split(string_fret_options)
+    if heads is None:
+        heads = product(*string_fret_options[:split])
+    tail = _grid(string_fret_options[split:])
+    block = np.empty((len(tail), len(string_fret_options)), dtype=np.int64)
+    block[:, split:] = tail
+    barreless = get_barreless_difficulties(table)
+    for head in heads:
+        block[:, :split] = head
+        highest = block.max(axis=1)
+        scores = shape_scores(block, barreless)
+        difficulties = scores[:, 0]
+        playable = (highest >= 0) & (difficulties <= max_difficulty)
+        if is_collecting():
+            add_count("shapes_enumerated", len(block))
+            rejected = (highest >= 0) & (difficulties > max_difficulty)
+            add_count("shapes_rejected_by_difficulty", int(np.count_nonzero(rejected)))
+        if scanned is not None:
+            playable &= (highest > scanned[0]) | (difficulties > scanned[1])
+        yield block[playable], scores[playable]
+
+
+def get_shapes(
+    string_fret_options: Sequence[Sequence[int]],
+    max_difficulty: float,
+    heads: Iterable[tuple[int, ...]] | None = None,
+    scanned: tuple[int, float] | None = None,
+) -> Iterable[tuple[int, ...]]:
+    """
+    Yield every combination of the given per-string fret options that
+    frets or opens at least one string, and isn't more difficult than
+    max_difficulty.
+
+    If heads is specified, only the given combinations of fret options
+    for the leading strings (as split by get_block_split) are used.
+
+    If scanned is specified, shapes an earlier scan up to that
+    max_fret and max_difficulty would have found are skipped.
+    """
+    for shapes, _ in get_shape_blocks(string_fret_options, max_difficulty, heads, scanned):
+        yield from map(tuple, shapes.tolist())
+
+
+def pack_records(
+    blocks: Sequence[tuple[IntArray, FloatArray]],
+    string_masks: Sequence[Sequence[int]],
+    chord_masks: bytes,
+) -> tuple[bytes, bytes, list[tuple[int, int]]]:
+    """
+    Vectorized equivalent of scan._pack_shape_records, for blocks of
+    shapes (one per row) and their scores, as from get_shape_blocks.
+    Return the packed frets and scores, and the set of pitch classes
+    played by each run of shapes with its length.
+    """
+    if not blocks:
+        return b"", b"", []
+    shapes = np.concatenate([shapes for shapes, _ in blocks])
+    scores = np.concatenate([scores for _, scores in blocks])
+    table = np.array(string_masks, dtype=np.int64)
+    masks = np.zeros(len(shapes), dtype=np.int64)
+    for string in range(shapes.shape[1]):
+        position = shapes[:, string]
+        masks |= np.where(position >= 0, table[string, position % table.shape[1]], 0)
+    keep = np.frombuffer(chord_masks, dtype=np.bool_)[masks]
+    order, runs = _group_masks(masks[keep])
+    frets = shapes[keep][order].astype(np.int8).tobytes()
+    return frets, scores[keep][order].tobytes(), runs
+
+
+def _group_masks(masks: IntArray) -> tuple[IntArray, list[tuple[int, int]]]:
+    """
+    Return an ordering which groups equal masks together (in order of
+    their first appearance, keeping the order within each group), and
+    each group's mask and length.
+    """
+    unique, first = np.unique(masks, return_index=True)
+    seen = np.argsort(first)
+    group_order = np.empty(len(unique), dtype=np.int64)
+    group_order[seen] = np.arange(len(unique))
+    groups = group_order[np.searchsorted(unique, masks)]
+    counts = np.bincount(groups, minlength=len(unique))
+    return np.argsort(groups, kind="stable"), list(zip(unique[seen].tolist(), counts.tolist()))
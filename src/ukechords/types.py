@@ -55,3 +55,68 @@ class ChordShapes(TypedDict):
     shapes: list[ChordShape]
     notes: NotRequired[tuple[str, ...]]
     chord: NotRequired[str]
+
+
+class TuningSummary(TypedDict):
+    """How easily one tuning plays the chords compared by compare_tunings"""
+
+    tuning: tuple[str, ...]
+    shapes: list[ChordShape | None]  # The easiest shape for each chord, or None if unplayable
+    playable: int  # How many of the chords can be played
+    difficulty: float  # The total difficulty of the easiest shapes for the playable chords
+
+
+class TuningComparison(TypedDict):
+    """Return value of compare_tunings"""
+
+    chords: list[str]
+    tunings: list[TuningSummary]  # Best first
+
+
+class ChordTable(TypedDict):
+    """Ranked names of the chords played by every set of pitch classes, indexed by its mask"""
+
+    qualities: str  # A fingerprint of the chord qualities the table was built from
+    sharp: list[list[str]]
+    flat: list[list[str]]
+
+
+class CacheEntry(TypedDict):
+    """A scanned chords cache file, as listed in the cache manifest"""
+
+    file: str
+    tuning: list[str]  # Transposed to start on C, as by theory_basic.normalize_tuning
+    mute: bool
+    max_fret: int
+    max_difficulty: float
+    notes: int | None  # The set of notes a scan was limited to, transposed as the tuning is
+    format: int
+    shapes: int
+
+
+class Stats(TypedDict):
+    """Timings and counts of ukechords' work, as collected by stats.collect_stats"""
+
+    time: float  # The total time (in seconds) stats were collected for
+    phases: dict[str, float]  # The time (in seconds) spent in each phase of work
+    counts: dict[str, int]
+
+
+class BenchCase(TypedDict):
+    """The settings of one benchmark, as run by the bench cli tool"""
+
+    operation: str
+    tuning: str
+    mute: bool
+    max_difficulty: float
+    cache: str | None  # cold, warm, or None for benchmarks not using the cache
+
+
+class BenchResult(BenchCase):
+    """The measurements of one benchmark, as reported by the bench cli tool"""
+
+    wall_time: float  # In seconds
+    shapes: int  # How many shapes were scanned for, looked up, loaded or saved
+    shapes_per_second: float
+    peak_rss: int  # In bytes, of the process running the benchmark
+    peak_rss_workers: int  # In bytes, of the largest of that process's workers
@@ -1,22 +1,95 @@
 """Test the cache module"""
 
-from ukechords.cache import _cached_filename, load_scanned_chords, save_scanned_chords
+import json
+import math
+import os
+from pathlib import Path
+
+import pytest
+
+from ukechords import cache
+from ukechords.cache import (
+    MappedShapes,
+    _cached_filename,
+    _mapped_caches,
+    find_difficulty_table,
+    load_cached_chord,
+    load_chord_table,
+    load_scanned_chords,
+    new_difficulty_table,
+    save_chord_table,
+    save_scanned_chords,
+)
 from ukechords.config import UkeConfig
-from ukechords.theory_basic import ChordCollection
+from ukechords.theory_basic import ChordCollection, ShapeList, ShapeScores, notes_to_mask
+from ukechords.types import ChordTable
 
 from .uketestconfig import uke_config
 
 
+def _sum_scores(shape: tuple[int, ...]) -> ShapeScores:
+    """Score shapes simply (and barre none of them), for test caches"""
+    return float(sum(shape)), float(sum(shape)), math.nan
+
+
 def test_save_load_cache(uke_config: UkeConfig) -> None:
     """Verify our ability to save and load chord information to disk"""
     shapes: ChordCollection = ChordCollection({"CNotReal": [(1, 2, 3)]})
-    save_scanned_chords(uke_config, shapes, max_fret=4)
+    save_scanned_chords(uke_config, shapes, max_fret=4, shape_scores=_sum_scores)
     shapes = ChordCollection()
     res = load_scanned_chords(uke_config, shapes, max_fret=4)
     assert res
     assert shapes["CNotReal"] == [(1, 2, 3)]
 
 
+def test_load_cache_lazily(uke_config: UkeConfig) -> None:
+    """Verify that cached shapes are only decoded when their chord is looked up"""
+    shapes = ChordCollection()
+    shapes["C"] = [(0, 0, 0), (-1, 5, 12)]
+    shapes["Dm"] = [(2, 1, 0)]
+    save_scanned_chords(uke_config, shapes, max_fret=12, shape_scores=_sum_scores)
+    loaded = ChordCollection()
+    assert load_scanned_chords(uke_config, loaded, max_fret=12)
+    mapped = dict.__getitem__(loaded, "C")
+    assert isinstance(mapped, MappedShapes)
+    assert len(mapped) == 2
+    assert mapped[-1] == (-1, 5, 12)
+    assert list(mapped.difficulties or []) == [0.0, 16.0]
+    assert all(math.isnan(barre) for _, _, barre in mapped.iter_scores() or ())
+    assert loaded["C"] == [(0, 0, 0), (-1, 5, 12)]
+    copied = dict.__getitem__(loaded, "C")
+    assert isinstance(copied, ShapeList)
+    assert list(copied.difficulties or []) == [0.0, 16.0]
+    assert loaded["Dm"] == [(2, 1, 0)]
+
+
+def test_legacy_cache(uke_config: UkeConfig) -> None:
+    """Verify that pickled caches from older versions are ignored, and replaced on save"""
+    legacy_filename = _cached_filename(uke_config, 4, 20).replace(".ukc", ".pcl")
+    with open(legacy_filename, "wb") as legacy_cache:
+        legacy_cache.write(b"not a current cache")
+    assert not load_scanned_chords(uke_config, ChordCollection(), max_fret=4)
+    save_scanned_chords(uke_config, ChordCollection(), max_fret=4, shape_scores=_sum_scores)
+    assert not os.path.exists(legacy_filename)
+
+
+def test_corrupt_cache(uke_config: UkeConfig) -> None:
+    """Verify that corrupt or truncated cache files are treated as cache misses"""
+    shapes = ChordCollection({"C": [(0, 0, 0), (-1, 5, 12)], "Dm": [(2, 1, 0)]})
+    save_scanned_chords(uke_config, shapes, max_fret=4, shape_scores=_sum_scores)
+    filename = _cached_filename(uke_config, 4, 20)
+    contents = Path(filename).read_bytes()
+    index_start = contents.index(b"[[")
+    for corrupt in [
+        contents[:-1],
+        contents[:index_start] + b"\xff" * 4 + contents[index_start + 4 :],
+        contents[:index_start] + b"[[1" + contents[index_start + 3 :],
+    ]:
+        Path(filename).write_bytes(corrupt)
+        assert not load_scanned_chords(uke_config, ChordCollection(), max_fret=4)
+        assert load_cached_chord(uke_config, "C", 4, notes_to_mask(["C", "E", "G"])) is None
+
+
 def test_load_empty_cache(uke_config: UkeConfig) -> None:
     """Verify behavior of loading an empty cache"""
     shapes: ChordCollection = ChordCollection()
@@ -28,6 +101,157 @@ def test_load_empty_cache(uke_config: UkeConfig) -> None:
 def test_cached_filename(uke_config: UkeConfig) -> None:
     """Verify generation of a cached filename"""
     uke_config.mute = True
-    uke_config.tuning = ("A",)
+    uke_config.tuning = ("A", "D")
     fn_str = _cached_filename(uke_config, 4, 50)
-    assert fn_str.endswith("/cache_mTrue_4_A_50.pcl")
+    assert fn_str.endswith("/cache_mTrue_4_CF_50.ukc")
+    fn_str = _cached_filename(uke_config, 4, 50, notes_to_mask(["A", "C#", "E"]))
+    assert fn_str.endswith("/cache_mTrue_4_CF_50_n091.ukc")
+    assert _cached_filename(uke_config, 4, 29.5).endswith("/cache_mTrue_4_CF_29.5.ukc")
+    assert _cached_filename(uke_config, 4, 29.0) != _cached_filename(uke_config, 4, 29.5)
+
+
+def test_save_load_chord_table(uke_config: UkeConfig) -> None:
+    """Verify that a chord table is only loaded for matching qualities"""
+    assert load_chord_table(uke_config, "fingerprint") is None
+    table: ChordTable = {"qualities": "fingerprint", "sharp": [["C#"]], "flat": [["Db"]]}
+    save_chord_table(uke_config, table)
+    assert load_chord_table(uke_config, "fingerprint") == table
+    assert load_chord_table(uke_config, "other fingerprint") is None
+    assert os.listdir(uke_config.cache_dir) == ["chord_table.json"]
+    for data in ["[1, 2]", '"fingerprint"', "{"]:
+        (Path(uke_config.cache_dir) / "chord_table.json").write_text(data)
+        assert load_chord_table(uke_config, "fingerprint") is None
+
+
+def test_load_superset_cache(uke_config: UkeConfig) -> None:
+    """Verify that a broader cache is filtered down to the requested scan"""
+    shapes = ChordCollection()
+    shapes["C"] = [(0, 0, 0), (-1, 0, 3), (0, 0, 7), (5, 5, 5)]
+    shapes["Dm"] = [(7, 7, 7)]
+    uke_config.mute = True
+    uke_config.max_difficulty = 30
+    save_scanned_chords(uke_config, shapes, max_fret=12, shape_scores=_sum_scores)
+    uke_config.mute = False
+    uke_config.max_difficulty = 10
+    loaded = ChordCollection()
+    assert load_scanned_chords(uke_config, loaded, max_fret=5)
+    assert loaded["C"] == [(0, 0, 0)]
+    assert "Dm" not in loaded
+    uke_config.tuning = ("G", "C", "E", "A")
+    assert not load_scanned_chords(uke_config, ChordCollection(), max_fret=5)
+
+
+def test_load_cheapest_cache(uke_config: UkeConfig) -> None:
+    """Verify that the smallest suitable cache listed in the manifest is used"""
+    save_scanned_chords(
+        uke_config, ChordCollection({"C": [(0, 0, 0), (1, 1, 1)]}), 12, shape_scores=_sum_scores
+    )
+    save_scanned_chords(
+        uke_config, ChordCollection({"C": [(0, 0, 0)]}), 8, shape_scores=_sum_scores
+    )
+    loaded = ChordCollection()
+    assert load_scanned_chords(uke_config, loaded, max_fret=4)
+    assert loaded["C"] == [(0, 0, 0)]
+    os.remove(_cached_filename(uke_config, 8, uke_config.max_difficulty))
+    loaded = ChordCollection()
+    assert load_scanned_chords(uke_config, loaded, max_fret=4)
+    assert loaded["C"] == [(0, 0, 0), (1, 1, 1)]
+    assert not load_scanned_chords(uke_config, ChordCollection(), max_fret=13)
+
+
+def test_load_cached_chord(uke_config: UkeConfig) -> None:
+    """Verify loading a single chord from caches of scans limited to notes"""
+    c_e_g, c_e_g_a = notes_to_mask(["C", "E", "G"]), notes_to_mask(["C", "E", "G", "A"])
+    assert load_cached_chord(uke_config, "C", 4, c_e_g) is None
+    shapes = ChordCollection({"C": [(0, 0, 0), (0, 4, 3)], "Am": [(2, 0, 0)]})
+    save_scanned_chords(uke_config, shapes, max_fret=4, shape_scores=_sum_scores, notes=c_e_g_a)
+    assert load_cached_chord(uke_config, "C", 4, c_e_g) == [(0, 0, 0), (0, 4, 3)]
+    assert load_cached_chord(uke_config, "C", 3, c_e_g) == [(0, 0, 0)]
+    assert load_cached_chord(uke_config, "Bbm", 4, c_e_g) == []
+    assert load_cached_chord(uke_config, "C", 4, notes_to_mask(["C", "E", "G", "B"])) is None
+    assert not load_scanned_chords(uke_config, ChordCollection(), max_fret=4)
+
+
+def test_evict_notes_caches(uke_config: UkeConfig, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Verify that only the most recently saved caches of scans limited to notes are kept"""
+    monkeypatch.setattr(cache, "MAX_NOTES_CACHES", 2)
+    shapes = ChordCollection({"C": [(0, 0, 0)]})
+    save_scanned_chords(uke_config, shapes, max_fret=4, shape_scores=_sum_scores)
+    masks = [notes_to_mask(["C", "E", "G", note]) for note in ["A", "B", "D"]]
+    for mask in masks:
+        save_scanned_chords(uke_config, shapes, max_fret=4, shape_scores=_sum_scores, notes=mask)
+    assert not os.path.exists(_cached_filename(uke_config, 4, 20, masks[0]))
+    for mask in masks[1:]:
+        assert load_cached_chord(uke_config, "C", 3, mask) == [(0, 0, 0)]
+        assert os.path.exists(_cached_filename(uke_config, 4, 20, mask))
+    assert load_scanned_chords(uke_config, ChordCollection(), max_fret=4)
+    manifest = json.loads((Path(uke_config.cache_dir) / "manifest.json").read_text())
+    assert len(manifest["caches"]) == 3
+
+
+def test_drop_evicted_mappings(uke_config: UkeConfig, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Verify that mappings of evicted cache files aren't kept"""
+    monkeypatch.setattr(cache, "MAX_NOTES_CACHES", 1)
+    shapes = ChordCollection({"C": [(0, 0, 0)]})
+    masks = [notes_to_mask(["C", "E", "G", note]) for note in ["A", "B"]]
+    save_scanned_chords(uke_config, shapes, max_fret=4, shape_scores=_sum_scores, notes=masks[0])
+    assert load_cached_chord(uke_config, "C", 4, masks[0]) == [(0, 0, 0)]
+    evicted = _cached_filename(uke_config, 4, 20, masks[0])
+    assert evicted in _mapped_caches
+    save_scanned_chords(uke_config, shapes, max_fret=4, shape_scores=_sum_scores, notes=masks[1])
+    assert load_cached_chord(uke_config, "C", 4, masks[1]) == [(0, 0, 0)]
+    assert evicted not in _mapped_caches
+
+
+def test_reload_changed_cache(uke_config: UkeConfig) -> None:
+    """Verify that a cache already loaded is read again once it changes"""
+    save_scanned_chords(
+        uke_config, ChordCollection({"C": [(0, 0, 0)]}), 4, shape_scores=_sum_scores
+    )
+    loaded = ChordCollection()
+    assert load_scanned_chords(uke_config, loaded, max_fret=4)
+    assert loaded["C"] == [(0, 0, 0)]
+    save_scanned_chords(
+        uke_config, ChordCollection({"C": [(5, 4, 3)]}), 4, shape_scores=_sum_scores
+    )
+    loaded = ChordCollection()
+    assert load_scanned_chords(uke_config, loaded, max_fret=4)
+    assert loaded["C"] == [(5, 4, 3)]
+
+
+def test_find_difficulty_table(uke_config: UkeConfig) -> None:
+    """Verify that the smallest difficulty table holding every shape of a scan is found"""
+    assert find_difficulty_table(uke_config, 12) is None
+    for mute, max_fret in [(True, 12), (False, 15), (False, 8)]:
+        uke_config.mute = mute
+        Path(new_difficulty_table(uke_config, max_fret).filename).touch()
+    uke_config.mute = False
+    table = find_difficulty_table(uke_config, 12)
+    assert table is not None
+    assert (table.strings, table.mute, table.max_fret, table.size) == (3, True, 12, 14**3)
+    assert os.path.basename(table.filename) == "difficulties_s3_mTrue_12.npy"
+    table = find_difficulty_table(uke_config, 8)
+    assert table is not None and (table.mute, table.max_fret) == (False, 8)
+    uke_config.mute = True
+    assert find_difficulty_table(uke_config, 13) is None
+    uke_config.tuning = ("G", "C", "E", "A")
+    assert find_difficulty_table(uke_config, 8) is None
+
+
+def test_load_transposed_cache(uke_config: UkeConfig) -> None:
+    """Verify that tunings which are transpositions of each other share caches"""
+    uke_config.tuning = ("G", "C", "E", "A")
+    shapes = ChordCollection({"C": [(0, 0, 0, 3)], "Am": [(2, 0, 0, 0)]})
+    save_scanned_chords(uke_config, shapes, max_fret=12, shape_scores=_sum_scores)
+    c_e_g = notes_to_mask(["C", "E", "G"])
+    shapes = ChordCollection({"C": [(0, 0, 0, 3)]})
+    save_scanned_chords(uke_config, shapes, max_fret=12, shape_scores=_sum_scores, notes=c_e_g)
+    uke_config.tuning = ("D", "G", "B", "E")
+    loaded = ChordCollection()
+    assert load_scanned_chords(uke_config, loaded, max_fret=12)
+    assert dict(loaded) == {"G": [(0, 0, 0, 3)], "Em": [(2, 0, 0, 0)]}
+    g_b_d = notes_to_mask(["G", "B", "D"])
+    assert load_cached_chord(uke_config, "G", 12, g_b_d) == [(0, 0, 0, 3)]
+    assert load_cached_chord(uke_config, "C", 12, g_b_d) == []
+    uke_config.tuning = ("G", "D", "A", "E")
+    assert not load_scanned_chords(uke_config, ChordCollection(), max_fret=12)
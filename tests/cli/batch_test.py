@@ -0,0 +1,68 @@
+"""Test the cli's batch module"""
+
+import io
+import json
+from typing import Any
+
+from pytest_mock import MockFixture
+
+from ukechords import theory
+from ukechords.cli.batch import run_batch
+from ukechords.config import UkeConfig
+
+from ..uketestconfig import uke_config
+
+
+def _run_batch(config: UkeConfig, *requests: str) -> list[dict[str, Any]]:
+    output = io.StringIO()
+    run_batch(config, requests, output)
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_batch(uke_config: UkeConfig) -> None:
+    """Verify that each kind of request is answered, with per-request settings"""
+    responses = _run_batch(
+        uke_config,
+        '{"chord": "C", "num": 1}',
+        '{"shape": "0,0,0,3", "tuning": "ukulele"}',
+        '{"notes": ["C", "E", "G"], "tuning": "G,C,E,A", "num": 1}',
+        "",
+        '{"show_key": "C,E,G"}',
+    )
+    assert [response["request"] for response in responses] == [
+        {"chord": "C", "num": 1},
+        {"shape": "0,0,0,3", "tuning": "ukulele"},
+        {"notes": ["C", "E", "G"], "tuning": "G,C,E,A", "num": 1},
+        {"show_key": "C,E,G"},
+    ]
+    results = [response["result"] for response in responses]
+    assert [shape["shape"] for shape in results[0]["shapes"]] == [[0, 0, 0]]
+    assert results[1]["shapes"][0]["chords"] == ["C"]
+    assert results[2]["shapes"][0]["shape"] == [0, 0, 0, 3]
+    assert "C" in results[3]["partial_keys"]
+
+
+def test_batch_errors(uke_config: UkeConfig) -> None:
+    """Verify that invalid requests get an error, without stopping the batch"""
+    responses = _run_batch(
+        uke_config,
+        "not json",
+        '{"chord": "Zz"}',
+        '{"chord": "C", "shape": "0,0,0"}',
+        '{"chord": "C", "colour": "blue"}',
+        '{"chord": "C", "tuning": "kazoo"}',
+        '["chord", "C"]',
+        '{"chord": "C", "num": 1}',
+    )
+    assert all("error" in response for response in responses[:-1])
+    assert "result" in responses[-1]
+
+
+def test_batch_duplicates(uke_config: UkeConfig, mocker: MockFixture) -> None:
+    """Verify that repeated requests are only answered once"""
+    find = mocker.spy(theory, "_find_chord_shapes")
+    responses = _run_batch(
+        uke_config, '{"chord": "C", "num": 2}', '{"num": 2, "chord": "C"}', '{"chord": "C"}'
+    )
+    assert find.call_count == 2
+    assert responses[0]["result"] == responses[1]["result"]
@@ -0,0 +1,48 @@
+"""Test the cli's bench module"""
+
+import json
+import pathlib
+
+from pytest_mock import MockFixture
+
+from ukechords.cli import bench
+from ukechords.cli.bench import get_cases, run, run_cases
+
+
+def test_bench_cases() -> None:
+    """Verify that every benchmark runs, in each of its cache states, and is measured"""
+    cases = list(get_cases(["scan", "cache_save", "slide"], ["ukulele"], [False], [10.0]))
+    assert [(case["operation"], case["cache"]) for case in cases] == [
+        ("scan", "cold"),
+        ("scan", "warm"),
+        ("cache_save", "warm"),
+        ("slide", None),
+    ]
+    operations = ["scan", "chord", "all", "slide", "notes", "cache_load", "cache_save"]
+    cases = list(get_cases(operations, ["ukulele", "7-string"], [True, False], [10.0]))
+    results = list(run_cases(cases[:11], "serial", in_process=True))
+    assert [result["operation"] for result in results] == [case["operation"] for case in cases[:11]]
+    for result in results:
+        assert result["tuning"] == "ukulele"
+        assert result["shapes"] > 0
+        assert result["wall_time"] > 0
+        assert result["peak_rss"] > 0
+    full_scans = {"scan", "cache_load", "cache_save"}
+    assert len({result["shapes"] for result in results if result["operation"] in full_scans}) == 1
+
+
+def test_bench_cli(tmp_path: pathlib.Path, mocker: MockFixture) -> None:
+    """Verify that the bench tool runs benchmarks in new processes, reporting them as JSON"""
+    mocker.patch.object(bench, "add_no5_quality")
+    mocker.patch.object(bench, "add_7sus2_quality")
+    output = tmp_path / "bench.json"
+    assert (
+        run(["-o", "slide", "-t", "baritone", "-d", "10", "--mute", "--output", str(output)]) == 0
+    )
+    report = json.loads(output.read_text())
+    assert report["version"]
+    [result] = report["results"]
+    assert result["operation"] == "slide"
+    assert result["tuning"] == "baritone"
+    assert result["mute"] is True
+    assert result["shapes_per_second"] > 0
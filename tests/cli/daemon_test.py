@@ -0,0 +1,124 @@
+"""Test the ident daemon and its client side"""
+
+import io
+import json
+import os
+import pathlib
+import sys
+import threading
+import time
+from collections.abc import Iterable
+
+import pytest
+
+from ukechords.cli import client, ident
+from ukechords.cli.daemon import forward, serve
+from ukechords.errors import InvalidCommandException
+
+
+def _fake_run(argv: list[str]) -> int:
+    if argv == ["read-stdin"]:
+        sys.stdin.read()
+    if argv == ["read-lines"]:
+        for _ in sys.stdin:
+            pass
+    if argv == ["exit"]:
+        sys.exit(3)
+    if argv == ["fail"]:
+        raise RuntimeError("failed")
+    if argv[:1] == ["chdir"]:
+        os.chdir(argv[1])
+    if argv == ["cwd"]:
+        print(os.getcwd())
+        return 0
+    print(",".join(argv), sys.stdout.isatty())
+    print("warning", file=sys.stderr)
+    return len(argv)
+
+
+@pytest.fixture
+def socket_path(tmp_path: pathlib.Path) -> Iterable[str]:
+    """Pytest fixture to run a daemon with a short idle timeout, providing its socket path"""
+    path = str(tmp_path / "ident.sock")
+    daemon = threading.Thread(target=serve, args=(_fake_run, path, 0.5))
+    daemon.start()
+    deadline = time.monotonic() + 10
+    while forward(path, []) is None:
+        assert time.monotonic() < deadline, "The daemon didn't start"
+        time.sleep(0.01)
+    yield path
+    daemon.join()
+
+
+def test_forward(socket_path: str, capsys: pytest.CaptureFixture[str]) -> None:
+    """Verify that requests are run by the daemon, with their output and status returned"""
+    capsys.readouterr()
+    assert forward(socket_path, ["-c", "C"]) == 2
+    assert capsys.readouterr() == ("-c,C False\n", "warning\n")
+    assert forward(socket_path, ["exit"]) == 3
+    assert forward(socket_path, ["read-stdin"]) is None
+    assert forward(socket_path, ["read-lines"]) is None
+
+
+def test_forward_failure(socket_path: str, capsys: pytest.CaptureFixture[str]) -> None:
+    """Verify that a request raising an exception fails, without stopping the daemon"""
+    capsys.readouterr()
+    assert forward(socket_path, ["fail"]) == 1
+    assert "RuntimeError: failed" in capsys.readouterr().err
+    assert forward(socket_path, ["-c", "C"]) == 2
+
+
+def test_forward_cwd(
+    socket_path: str, tmp_path: pathlib.Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    """Verify that requests run in the client's working directory, which doesn't persist"""
+    cwd = os.getcwd()
+    assert forward(socket_path, ["chdir", str(tmp_path)]) == 2
+    assert os.getcwd() == cwd
+    capsys.readouterr()
+    assert forward(socket_path, ["cwd"]) == 0
+    assert capsys.readouterr().out == f"{cwd}\n"
+
+
+def test_daemon_already_running(socket_path: str) -> None:
+    """Verify that only one daemon can listen on a socket"""
+    with pytest.raises(InvalidCommandException):
+        serve(_fake_run, socket_path, 0.5)
+
+
+def test_no_daemon(tmp_path: pathlib.Path) -> None:
+    """Verify that requests aren't forwarded when no daemon is listening"""
+    assert forward(str(tmp_path / "ident.sock"), ["-c", "C"]) is None
+
+
+def test_forward_batch(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+) -> None:
+    """Verify that --batch requests read from the client's stdin while a daemon is running"""
+    path = str(tmp_path / "ident.sock")
+    daemon = threading.Thread(target=serve, args=(ident.run, path, 0.5))
+    daemon.start()
+    deadline = time.monotonic() + 10
+    while not os.path.exists(path):
+        assert time.monotonic() < deadline, "The daemon didn't start"
+        time.sleep(0.01)
+    argv = [
+        "--batch",
+        "--socket",
+        path,
+        "--cache-dir",
+        str(tmp_path),
+        "-t",
+        "C,E,G",
+        "--executor",
+        "thread",
+    ]
+    monkeypatch.setattr(sys, "argv", ["ident", *argv])
+    monkeypatch.setattr(sys, "stdin", io.StringIO('{"chord": "C", "num": 1}\n'))
+    # Run the cli locally without adding extra chord qualities for the rest of the tests
+    monkeypatch.setattr(ident, "main", lambda: ident.run(sys.argv[1:]))
+    assert client.main() == 0
+    daemon.join()
+    response = json.loads(capsys.readouterr().out)
+    assert response["request"] == {"chord": "C", "num": 1}
+    assert response["result"]["shapes"][0]["shape"] == [0, 0, 0]
@@ -1,8 +1,11 @@
 """Test for the ident (cli) module"""
 
+import json
+import pathlib
+
 import pytest
 
-from ukechords.cli.ident import _get_config, _get_parser
+from ukechords.cli.ident import _get_config, _get_parser, run
 from ukechords.errors import InvalidCommandException, error
 
 
@@ -21,3 +24,55 @@ def test_no_args() -> None:
     parsed_args = _get_parser().parse_args([])
     with pytest.raises(InvalidCommandException):
         _get_config(parsed_args)
+
+
+def test_stats(tmp_path: pathlib.Path, capsys: pytest.CaptureFixture[str]) -> None:
+    """Verify that --stats writes timings and counts to stderr as JSON"""
+    assert run(["-c", "C", "-t", "C,E,G", "--cache-dir", str(tmp_path), "--stats"]) == 0
+    out, err = capsys.readouterr()
+    assert "C" in out
+    stats = json.loads(err)
+    assert stats["phases"]["render"] > 0
+    assert stats["counts"]["chord_table_lookups"] > 0
+
+
+def test_profile(tmp_path: pathlib.Path, capsys: pytest.CaptureFixture[str]) -> None:
+    """Verify that --profile writes a profile of the command"""
+    profile_dir = tmp_path / "profile"
+    args = ["-c", "C", "-t", "C,E,G", "--cache-dir", str(tmp_path), "--profile", str(profile_dir)]
+    assert run(args) == 0
+    assert "C" in capsys.readouterr().out
+    assert (profile_dir / "ident.pstats").exists()
+    assert (profile_dir / "scan-peak.txt").exists()
+
+
+def test_full_scan(tmp_path: pathlib.Path, capsys: pytest.CaptureFixture[str]) -> None:
+    """Verify that scans for all chords only keep (and cache) every shape with --full-scan"""
+    args = ["-a", "-t", "C,E,G", "-d", "15", "--cache-dir", str(tmp_path)]
+    assert run(args) == 0
+    best, _ = capsys.readouterr()
+    assert not list(tmp_path.glob("*.ukc"))
+    assert run([*args, "--full-scan"]) == 0
+    full, _ = capsys.readouterr()
+    assert len(list(tmp_path.glob("*.ukc"))) == 1
+    assert best == full
+
+
+def test_compare(tmp_path: pathlib.Path, capsys: pytest.CaptureFixture[str]) -> None:
+    """Verify that --compare ranks the configured tuning and each --compare-tuning"""
+    args = ["--compare", "C,G7", "-t", "C,E,G", "--compare-tuning", "ukulele"]
+    assert run([*args, "--cache-dir", str(tmp_path)]) == 0
+    lines = capsys.readouterr().out.split("\n")
+    assert lines[0].split() == ["Tuning", "C", "G7", "Total"]
+    assert lines[1].startswith("G,C,E,A ")
+    assert lines[2].startswith("C,E,G ") and lines[2].endswith("(1/2 playable)")
+    assert run([*args, "--cache-dir", str(tmp_path), "-j"]) == 0
+    data = json.loads(capsys.readouterr().out)
+    assert [summary["tuning"] for summary in data["tunings"]] == [list("GCEA"), list("CEG")]
+
+
+def test_compare_tuning_requires_compare() -> None:
+    """Verify that --compare-tuning is only accepted along with --compare"""
+    parsed_args = _get_parser().parse_args(["-c", "C", "--compare-tuning", "ukulele"])
+    with pytest.raises(InvalidCommandException):
+        _get_config(parsed_args)
@@ -9,9 +9,10 @@ from ukechords.cli.render import (
     render_chord_list,
     render_chords_from_shape,
     render_key,
+    render_tuning_comparison,
 )
 from ukechords.config import UkeConfig
-from ukechords.types import BarreData, ChordsByShape, ChordShapes, KeyInfo
+from ukechords.types import BarreData, ChordsByShape, ChordShapes, KeyInfo, TuningComparison
 
 from ..uketestconfig import uke_config
 
@@ -73,6 +74,36 @@ def test_render_chord_list(capsys: pytest.CaptureFixture[str], uke_config: UkeCo
             assert diff_parts[1] == expected_diff_desc
 
 
+def test_render_tuning_comparison(capsys: pytest.CaptureFixture[str]) -> None:
+    """Verify rendering a comparison of tunings as a table, marking unplayable chords"""
+    data: TuningComparison = {
+        "chords": ["C", "G7"],
+        "tunings": [
+            {
+                "tuning": ("G", "C", "E", "A"),
+                "shapes": [
+                    {"shape": (0, 0, 0, 3), "difficulty": 3.3, "chord_names": ["C"]},
+                    {"shape": (0, 2, 1, 2), "difficulty": 8.5, "chord_names": ["G7"]},
+                ],
+                "playable": 2,
+                "difficulty": 11.8,
+            },
+            {
+                "tuning": ("C", "E", "G"),
+                "shapes": [{"shape": (0, 0, 0), "difficulty": 0.0, "chord_names": ["C"]}, None],
+                "playable": 1,
+                "difficulty": 0.0,
+            },
+        ],
+    }
+    render_tuning_comparison(None, data)
+    assert _get_capsys_lines(capsys) == [
+        "Tuning   C    G7   Total",
+        "G,C,E,A  3.3  8.5  11.8",
+        "C,E,G    0.0  -    0.0 (1/2 playable)",
+    ]
+
+
 def test_render_chords_from_shape(
     capsys: pytest.CaptureFixture[str], uke_config: UkeConfig
 ) -> None:
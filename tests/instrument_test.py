@@ -0,0 +1,53 @@
+"""Test the instrument module"""
+
+from dataclasses import replace
+
+import pytest
+from pytest_mock import MockFixture
+
+from ukechords import instrument
+from ukechords.config import UkeConfig
+from ukechords.errors import InvalidCommandException
+from ukechords.instrument import Instrument
+from ukechords.theory import (
+    rank_shape_by_difficulty,
+    show_all,
+    show_chord,
+    show_chords_by_notes,
+    show_chords_by_shape,
+)
+
+from .uketestconfig import uke_config
+
+
+def test_instrument(uke_config: UkeConfig, mocker: MockFixture) -> None:
+    """Verify that an instrument answers as the show_* functions do, scanning only once"""
+    uke_config.shape_ranker = rank_shape_by_difficulty
+    scan = mocker.spy(instrument, "scan_chords")
+    uke = Instrument(uke_config)
+    assert uke.chord("C", num=2) == show_chord(replace(uke_config, num=2), "C")
+    assert uke.chord("Bb") == show_chord(uke_config, "Bb")
+    assert uke.chord("C#9") == show_chord(uke_config, "C#9")
+    for notes in ({"C", "E", "G"}, {"Eb", "G", "Bb"}, {"C", "D"}):
+        assert uke.notes(notes, num=3) == show_chords_by_notes(replace(uke_config, num=3), notes)
+    assert uke.all(keys=["F"]) == show_all(replace(uke_config, keys=["F"]))
+    assert uke.shape(("0", "4", "7"), slide=True) == show_chords_by_shape(
+        replace(uke_config, slide=True), ("0", "4", "7")
+    )
+    assert scan.call_count == 1
+
+
+def test_instrument_max_fret(uke_config: UkeConfig) -> None:
+    """Verify that an instrument only finds shapes up to its max_fret"""
+    uke = Instrument(replace(uke_config, max_fret=4))
+    shapes = [shape["shape"] for shape in uke.chord("D")["shapes"]]
+    assert shapes
+    assert max(map(max, shapes)) <= 4
+
+
+def test_instrument_settings(uke_config: UkeConfig) -> None:
+    """Verify that an instrument's own settings can't be overridden for one question"""
+    uke = Instrument(uke_config)
+    with pytest.raises(InvalidCommandException):
+        uke.chord("C", tuning=("G", "C", "E", "A"))
+    assert uke.config == uke_config
@@ -0,0 +1,43 @@
+"""Test the pool module"""
+
+from multiprocessing.pool import Pool
+
+import pytest
+from pytest_mock import MockFixture
+
+from ukechords import pool
+from ukechords.errors import InvalidCommandException
+from ukechords.pool import map_chunks, resolve_executor
+
+
+@pytest.mark.parametrize("free_threaded", [False, True])
+def test_resolve_executor(monkeypatch: pytest.MonkeyPatch, free_threaded: bool) -> None:
+    """Verify that scans are run serially when small, and otherwise in parallel"""
+    monkeypatch.setattr(pool, "_is_free_threaded", lambda: free_threaded)
+    assert resolve_executor("auto", 100) == "serial"
+    assert resolve_executor("auto", 10**6) == ("thread" if free_threaded else "fork")
+    assert resolve_executor("auto") == resolve_executor("auto", 10**6)
+    assert resolve_executor("forkserver", 100) == "forkserver"
+
+
+def test_unknown_executor() -> None:
+    """Verify that an unknown executor is rejected"""
+    with pytest.raises(InvalidCommandException):
+        resolve_executor("gpu")
+
+
+def _failing_scan(chunk: int) -> int:
+    if chunk == 2:
+        raise ValueError(f"Failed to scan chunk {chunk}")
+    return chunk
+
+
+@pytest.mark.parametrize("executor", ["fork", "thread"])
+def test_map_chunks_exception(mocker: MockFixture, executor: str) -> None:
+    """Verify that an exception raised by a worker is raised from map_chunks, ending the pool"""
+    terminate = mocker.spy(Pool, "terminate")
+    results: list[int] = []
+    with pytest.raises(ValueError, match="chunk 2"):
+        map_chunks(executor, _failing_scan, (), [0, 1, 2, 3], results.append)
+    assert results == [0, 1]
+    terminate.assert_called_once()
@@ -0,0 +1,39 @@
+"""Test the profiling module"""
+
+import pathlib
+import pstats
+
+import pytest
+
+from ukechords.config import UkeConfig
+from ukechords.profiling import get_profile_dir, profile
+from ukechords.theory import prepare_chord_table, scan_chords
+from ukechords.theory_basic import ChordCollection
+
+from .uketestconfig import uke_config
+
+
+def _get_functions(filename: pathlib.Path) -> set[str]:
+    return set(pstats.Stats(str(filename)).get_stats_profile().func_profiles)
+
+
+@pytest.mark.parametrize("executor,workers", [("fork", True), ("thread", False)])
+def test_profile(
+    uke_config: UkeConfig, tmp_path: pathlib.Path, executor: str, workers: bool
+) -> None:
+    """Verify that profiles are written for this process, and any worker processes"""
+    uke_config.executor = executor
+    prepare_chord_table(uke_config)
+    profile_dir = tmp_path / "profile"
+    with profile(str(profile_dir)):
+        assert get_profile_dir() == str(profile_dir)
+        scan_chords(uke_config, ChordCollection(), 5)
+    assert get_profile_dir() is None
+    assert "scan_chords" in _get_functions(profile_dir / "ident.pstats")
+    worker_profiles = list(profile_dir.glob("worker-*.pstats"))
+    assert bool(worker_profiles) == workers
+    for worker_profile in worker_profiles:
+        assert "get_shape_records" in _get_functions(worker_profile)
+    report = (profile_dir / "scan-peak.txt").read_text().splitlines()
+    assert report[0].startswith("Peak memory traced during scans")
+    assert len(report) > 2
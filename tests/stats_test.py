@@ -0,0 +1,61 @@
+"""Test the stats module"""
+
+import time
+from dataclasses import replace
+
+import pytest
+
+from ukechords.config import UkeConfig
+from ukechords.stats import add_count, collect_stats, is_collecting, merge_counts, phase
+from ukechords.theory import prepare_chord_table, show_chord
+from ukechords.types import Stats
+
+from .uketestconfig import uke_config
+
+
+def test_collect_stats() -> None:
+    """Verify that phases are timed without the phases nested in them, and counts are added"""
+    add_count("ignored")
+    reported: list[Stats] = []
+    with collect_stats(reported.append) as stats:
+        assert is_collecting()
+        with phase("outer"):
+            time.sleep(0.02)
+            with phase("inner"):
+                time.sleep(0.05)
+        with phase("inner"):
+            time.sleep(0.01)
+        add_count("things")
+        merge_counts({"things": 2, "others": 3})
+    assert not is_collecting()
+    assert reported == [stats]
+    assert stats["counts"] == {"things": 3, "others": 3}
+    assert 0.02 <= stats["phases"]["outer"] < 0.05
+    assert stats["phases"]["inner"] >= 0.06
+    assert stats["time"] >= sum(stats["phases"].values())
+
+
+def test_collect_stats_exception() -> None:
+    """Verify that stats are still reported when the work fails"""
+    reported: list[Stats] = []
+    with pytest.raises(ValueError), collect_stats(reported.append), phase("failing"):
+        raise ValueError()
+    assert "failing" in reported[0]["phases"]
+
+
+@pytest.mark.parametrize("executor", ["serial", "thread"])
+def test_scan_stats(uke_config: UkeConfig, executor: str) -> None:
+    """Verify that scans count the work done by their workers, and cache use"""
+    uke_config.executor = executor
+    prepare_chord_table(uke_config)
+    with collect_stats() as stats:
+        show_chord(uke_config, "C")
+    counts = stats["counts"]
+    assert counts["shapes_enumerated"] > counts["shapes_rejected_by_difficulty"] > 0
+    assert counts["cache_misses"] == 2
+    assert {"scan", "identify", "cache_save", "sort"} <= stats["phases"].keys()
+    with collect_stats() as stats:
+        show_chord(replace(uke_config, num=None), "C")
+    assert stats["counts"]["cache_hits"] == 1
+    assert stats["counts"]["cache_bytes_read"] > 0
+    assert "shapes_enumerated" not in stats["counts"]
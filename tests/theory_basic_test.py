@@ -1,13 +1,21 @@
 """Test the theory_basic module"""
 
+import math
+
 import pytest
 
 from ukechords.theory_basic import (
+    ShapeList,
     _get_dupe_scales_from_key,
     flatify,
     get_key_notes,
+    mask_to_notes,
+    normalize_tuning,
     note_intervals,
+    notes_to_mask,
     sharpify,
+    transpose_chord,
+    transpose_mask,
 )
 
 
@@ -22,6 +30,28 @@ def test_sharpify_flatify() -> None:
     assert all(x == y for x, y in zip(flatify(["Bb", "A#"]), ["Bb", "Bb"]))
 
 
+def test_pitch_class_masks() -> None:
+    """Verify conversion between notes and sets of pitch classes"""
+    assert notes_to_mask(["C", "E", "G"]) == 0b10010001
+    assert notes_to_mask(["A#", "Bb", "B#"]) == notes_to_mask(["C", "Bb"])
+    assert mask_to_notes(notes_to_mask(["G", "Eb", "C"])) == ("C", "D#", "G")
+    assert mask_to_notes(notes_to_mask(["G", "D#", "C"]), force_flat=True) == ("C", "Eb", "G")
+    assert not mask_to_notes(0)
+
+
+def test_transpose() -> None:
+    """Verify transposition of chords, sets of pitch classes and tunings"""
+    assert transpose_chord("Bbm7", 2) == "Cm7"
+    assert transpose_chord("C#(no5)", -2) == "B(no5)"
+    assert transpose_chord("Cmaj7", 12) == "CM7"
+    assert transpose_mask(notes_to_mask(["C", "E", "G"]), 7) == notes_to_mask(["G", "B", "D"])
+    assert transpose_mask(notes_to_mask(["A", "B"]), -10) == notes_to_mask(["B", "C#"])
+    assert normalize_tuning(("G", "C", "E", "A")) == (("C", "F", "A", "D"), 7)
+    assert normalize_tuning(("D", "G", "B", "E")) == (("C", "F", "A", "D"), 2)
+    assert normalize_tuning(("Eb", "Ab")) == (("C", "F"), 3)
+    assert normalize_tuning(()) == ((), 0)
+
+
 def test_scale() -> None:
     """Verify that 2 keys with the same notes are identified as related"""
     key1 = "C"
@@ -34,6 +64,44 @@ def test_scale() -> None:
     assert "Am" in dupes
 
 
+def test_shape_list() -> None:
+    """Verify that shapes held in a ShapeList behave as a list of them would"""
+    scores = [(3.0, 3.0, math.nan), (1.5, 4.0, 1.5)]
+    shapes = ShapeList(3, [(0, 0, 3), (-1, 2, 12)], scores=scores)
+    shapes.append((2, 1, 0), (2.0, 2.0, math.nan))
+    assert len(shapes) == 3
+    assert shapes == [(0, 0, 3), (-1, 2, 12), (2, 1, 0)]
+    assert shapes[-1] == (2, 1, 0)
+    assert shapes[1:] == [(-1, 2, 12), (2, 1, 0)]
+    assert shapes[::-1] == [(2, 1, 0), (-1, 2, 12), (0, 0, 3)]
+    with pytest.raises(IndexError):
+        _ = shapes[3]
+    shapes.sort(key=sum)
+    assert shapes == [(0, 0, 3), (2, 1, 0), (-1, 2, 12)]
+    assert list(shapes.difficulties or []) == [3.0, 2.0, 1.5]
+    shapes.sort(reverse=True)
+    assert shapes == [(2, 1, 0), (0, 0, 3), (-1, 2, 12)]
+    assert list(shapes.difficulties or []) == [2.0, 3.0, 1.5]
+    shapes.sort_scored(key=lambda shape, scores: scores[0])
+    assert shapes == [(-1, 2, 12), (2, 1, 0), (0, 0, 3)]
+    assert [scores[1] for scores in shapes.iter_scores() or ()] == [4.0, 2.0, 3.0]
+    copied = ShapeList.from_packed(shapes)
+    copied.extend(ShapeList.frombytes(3, bytes([1, 1, 1]), bytes(24)))
+    assert copied[3:] == [(1, 1, 1)]
+    assert list(copied.difficulties or []) == [1.5, 2.0, 3.0, 0.0]
+    with pytest.raises(ValueError):
+        copied.extend([(3, 3, 3)])
+    with pytest.raises(ValueError):
+        ShapeList.frombytes(3, bytes([1, 1, 1]), bytes(8))
+    assert len(copied) == 4
+    del copied[2:]
+    assert copied == shapes.copy()[:2]
+    assert list(copied.difficulties or []) == [1.5, 2.0]
+    untracked = ShapeList(3, copied)
+    assert untracked == copied
+    assert untracked.scores is None
+
+
 def get_weird_offset(note: str) -> int:
     """Determine the interval offset caused by a weird note"""
     match note[1:]:
@@ -0,0 +1,169 @@
+"""Test the optional numpy-backed theory engine"""
+
+import os
+from dataclasses import replace
+from itertools import product
+
+import pytest
+from pytest_mock import MockFixture
+
+from ukechords import scan
+from ukechords.cache import new_difficulty_table
+from ukechords.config import UkeConfig
+from ukechords.scan import (
+    ScanArgs,
+    get_shape_records,
+    get_shape_scores,
+    get_shapes,
+    get_tunings_shape_records,
+)
+from ukechords.theory import (
+    _get_chord_masks,
+    _get_shape_difficulty,
+    scan_chords,
+)
+from ukechords.theory_basic import ChordCollection
+
+from .uketestconfig import uke_config
+
+np = pytest.importorskip("numpy")
+theory_numpy = pytest.importorskip("ukechords.theory_numpy")
+
+
+def test_shape_scores() -> None:
+    """Verify that bulk difficulty scoring exactly matches the per-shape heuristic"""
+    shapes = list(product(range(-1, 8), repeat=4))
+    scores = theory_numpy.shape_scores(np.array(shapes, dtype=np.int64))
+    expected = [get_shape_scores(shape) for shape in shapes]
+    assert scores.tobytes() == np.array(expected).tobytes()
+    assert scores[:, 0].tolist() == [_get_shape_difficulty(shape)[0] for shape in shapes]
+
+
+@pytest.mark.parametrize("mute", [False, True])
+def test_difficulty_table(uke_config: UkeConfig, mute: bool) -> None:
+    """Verify that scores worked out from a difficulty table exactly match those without one"""
+    uke_config.tuning = ("G", "C", "E", "A")
+    uke_config.mute = mute
+    table = new_difficulty_table(uke_config, 7)
+    theory_numpy.create_difficulty_table(table)
+    shapes = np.array(list(product(range(-1 if mute else 0, 8), repeat=4)), dtype=np.int64)
+    barreless = theory_numpy.get_barreless_difficulties(table)
+    assert barreless is not theory_numpy.barreless_difficulties
+    expected = theory_numpy.shape_scores(shapes)
+    assert theory_numpy.shape_scores(shapes[:100], barreless).tobytes() == expected[:100].tobytes()
+    assert np.isnan(np.load(table.filename)).any()
+    assert theory_numpy.shape_scores(shapes, barreless).tobytes() == expected.tobytes()
+    assert not np.isnan(np.load(table.filename)).any()
+    assert theory_numpy.shape_scores(shapes[::-1], barreless).tobytes() == expected[::-1].tobytes()
+    unreadable = table._replace(filename=os.path.join(uke_config.cache_dir, "unreadable.npy"))
+    with open(unreadable.filename, "wb") as unreadable_file:
+        unreadable_file.write(b"not a table")
+    assert (
+        theory_numpy.get_barreless_difficulties(unreadable) is theory_numpy.barreless_difficulties
+    )
+    # Tables which couldn't be read are tried again once they can be
+    theory_numpy.create_difficulty_table(unreadable)
+    barreless = theory_numpy.get_barreless_difficulties(unreadable)
+    assert barreless is not theory_numpy.barreless_difficulties
+    assert theory_numpy.shape_scores(shapes, barreless).tobytes() == expected.tobytes()
+
+
+def test_replaced_difficulty_table(uke_config: UkeConfig) -> None:
+    """Verify that a difficulty table replaced since it was mapped is mapped again"""
+    uke_config.tuning = ("G", "C", "E", "A")
+    table = new_difficulty_table(uke_config, 7)
+    theory_numpy.create_difficulty_table(table)
+    shapes = np.array(list(product(range(8), repeat=4)), dtype=np.int64)
+    theory_numpy.shape_scores(shapes, theory_numpy.get_barreless_difficulties(table))
+    theory_numpy.create_difficulty_table(table)
+    assert np.isnan(np.load(table.filename)).all()
+    theory_numpy.shape_scores(shapes, theory_numpy.get_barreless_difficulties(table))
+    assert not np.isnan(np.load(table.filename)).all()
+
+
+@pytest.mark.parametrize("mute", [False, True])
+@pytest.mark.parametrize("scanned", [None, (5, 15.0)])
+def test_get_shapes_matches_python(
+    uke_config: UkeConfig,
+    mocker: MockFixture,
+    mute: bool,
+    scanned: tuple[int, float] | None,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Verify that numpy-backed enumeration yields the same shapes in the same order"""
+    uke_config.tuning = ("G", "C", "E", "A")
+    uke_config.mute = mute
+    notes = ("C", "E", "G", "Bb")
+    monkeypatch.setattr(theory_numpy, "BLOCK_SIZE", 64)
+    spy = mocker.spy(theory_numpy, "get_shapes")
+    fast = list(get_shapes(uke_config, 7, notes=notes, scanned=scanned))
+    spy.assert_called()
+    monkeypatch.setattr(scan, "theory_numpy", None)
+    slow = list(get_shapes(uke_config, 7, notes=notes, scanned=scanned))
+    assert fast
+    assert fast == slow
+
+
+@pytest.mark.parametrize("mute", [False, True])
+@pytest.mark.parametrize("keep", [None, 2])
+def test_shape_records_match_python(
+    uke_config: UkeConfig, mute: bool, keep: int | None, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Verify that numpy-backed packing of shape records matches the pure-python version"""
+    uke_config.tuning = ("G", "C", "E", "A")
+    uke_config.mute = mute
+    prefixes = [(0,), (2, 1), (-1, 3)]
+    monkeypatch.setattr(theory_numpy, "BLOCK_SIZE", 64)
+    fast = get_shape_records(ScanArgs(uke_config, 7, _get_chord_masks(), keep=keep), prefixes)
+    monkeypatch.setattr(scan, "theory_numpy", None)
+    slow = get_shape_records(ScanArgs(uke_config, 7, _get_chord_masks(), keep=keep), prefixes)
+    assert fast.runs
+    # Counts differ, as numpy evaluates whole blocks of shapes at a time
+    assert fast._replace(counts={}) == slow._replace(counts={})
+
+
+@pytest.mark.parametrize("keep", [None, 2])
+def test_tunings_shape_records_match_python(
+    uke_config: UkeConfig, keep: int | None, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Verify that records for tunings scanned together match those scanned one at a time"""
+    tunings = [("G", "C", "E", "A"), ("G", "D", "A", "E")]
+    uke_config.tuning = tunings[0]
+    prefixes = [(0,), (2, 1), (-1, 3)]
+    args = ScanArgs(uke_config, 7, _get_chord_masks(), keep=keep)
+    monkeypatch.setattr(theory_numpy, "BLOCK_SIZE", 64)
+    fast = get_tunings_shape_records(args, tunings, prefixes)
+    assert not fast[1].counts
+    monkeypatch.setattr(scan, "theory_numpy", None)
+    slow = get_tunings_shape_records(args, tunings, prefixes)
+    for tuning, fast_records, slow_records in zip(tunings, fast, slow):
+        config = replace(uke_config, tuning=tuning)
+        expected = get_shape_records(ScanArgs(config, 7, _get_chord_masks(), keep=keep), prefixes)
+        assert fast_records.runs
+        assert fast_records._replace(counts={}) == slow_records._replace(counts={})
+        assert slow_records._replace(counts={}) == expected._replace(counts={})
+
+
+def _scan_with_scores(config: UkeConfig) -> dict[str, tuple[list[tuple[int, ...]], bytes]]:
+    chord_shapes = ChordCollection()
+    scan_chords(config, chord_shapes, 8)
+    return {chord: (list(shapes), bytes(shapes.scores)) for chord, shapes in chord_shapes.items()}
+
+
+def test_shared_difficulty_table(uke_config: UkeConfig, mocker: MockFixture) -> None:
+    """Verify that scans for every tuning with as many strings share a difficulty table"""
+    uke_config.mute = True
+    create = mocker.spy(theory_numpy, "create_difficulty_table")
+    expected = {}
+    for tuning in ["GCEA", "DGBE"]:
+        cache_dir = os.path.join(uke_config.cache_dir, tuning)
+        config = replace(uke_config, tuning=tuple(tuning), no_cache=True, cache_dir=cache_dir)
+        expected[tuning] = _scan_with_scores(config)
+    create.assert_not_called()
+    uke_config.tuning = ("E", "A", "D", "G", "B")
+    scan_chords(uke_config, ChordCollection(), 8, notes=("C", "E", "G"))
+    create.assert_not_called()
+    for tuning in ["GCEA", "DGBE"]:
+        uke_config.tuning = tuple(tuning)
+        assert _scan_with_scores(uke_config) == expected[tuning]
+    create.assert_called_once()
@@ -1,28 +1,53 @@
 """Test the theory module"""
 
+import os
+import pathlib
 from collections.abc import Callable, Iterable
+from dataclasses import replace
+from itertools import product
 from typing import Any
 
 import pytest
 from pychord import Chord, QualityManager
 from pytest_mock import MockFixture
 
+from ukechords import pool, scan, theory
+from ukechords.cache import _cached_filename
 from ukechords.config import UkeConfig
 from ukechords.errors import ChordNotFoundException, UnslidableEmptyShapeException
+from ukechords.pool import shared_pool
+from ukechords.scan import (
+    ScanArgs,
+    best_first_shapes,
+    get_scan_chunks,
+    get_shape_mask,
+    get_shape_records,
+    get_shapes,
+)
+from ukechords.stats import collect_stats
 from ukechords.theory import (
-    _scan_chords,
+    _build_chord_table,
+    _get_chord_masks,
+    _get_chords_from_mask,
+    _get_shape_difficulty,
+    _merge_shape_records,
     add_7sus2_quality,
     add_no5_quality,
+    compare_tunings,
     lookup_tuning,
+    prepare_chord_table,
+    rank_shape_by_difficulty,
+    rank_shape_by_high_fret,
+    scan_chords,
+    scan_tunings,
     show_all,
     show_chord,
     show_chords_by_notes,
     show_chords_by_shape,
     show_key,
 )
-from ukechords.theory_basic import ChordCollection
+from ukechords.theory_basic import ChordCollection, ShapeList, notes_to_mask
 
-from .fake_pool import fake_pool  # pylint: disable=unused-import
 from .uketestconfig import uke_config
 
 
@@ -73,21 +98,283 @@ def test_basic_scan(uke_config: UkeConfig) -> None:
     """Verify the ability to scan for shapes"""
     uke_config.tuning = ("G", "C", "E", "A")
     chord_shapes = ChordCollection()
-    _scan_chords(uke_config, chord_shapes, max_fret=3)
+    scan_chords(uke_config, chord_shapes, max_fret=3)
     assert "C" in chord_shapes
     assert "Cmaj7" in chord_shapes
     with pytest.raises(KeyError):
         _ = chord_shapes["C9"]
 
 
-def test_threaded_scan_exception(uke_config: UkeConfig, mocker: MockFixture) -> None:
-    """Verify that an exception raised from a threaded scan triggers termination of the pool"""
-    mocker.patch("ukechords.theory._get_chord_shapes_map", side_effect=ValueError())
-    mocked_pool_terminate = mocker.patch("tests.fake_pool.FakePool.terminate")
+@pytest.mark.parametrize("notes", [None, ("C", "E", "G", "A")])
+def test_scan_from_broader_cache(
+    uke_config: UkeConfig, mocker: MockFixture, notes: tuple[str, ...] | None
+) -> None:
+    """Verify that a scan is served by filtering a broader cache"""
+    uke_config.tuning = ("G", "C", "E", "A")
+    uke_config.mute = True
+    uke_config.max_difficulty = 30
+    scan_chords(uke_config, ChordCollection(), max_fret=7)
+    uke_config.mute = False
+    uke_config.max_difficulty = 15
+    uke_config.no_cache = True
+    expected = ChordCollection()
+    scan_chords(uke_config, expected, max_fret=5, notes=notes)
+    uke_config.no_cache = False
+    uke_config.save_derived = True
+    spy = mocker.spy(theory, "get_shape_records")
+    chord_shapes = ChordCollection()
+    scan_chords(uke_config, chord_shapes, max_fret=5, notes=notes)
+    spy.assert_not_called()
+    assert {chord: sorted(chord_shapes[chord]) for chord in chord_shapes} == {
+        chord: sorted(expected[chord]) for chord in expected
+    }
+    derived = os.path.exists(_cached_filename(uke_config, 5, 15))
+    assert derived == (notes is None)
+
+
+def test_extend_scan(uke_config: UkeConfig, mocker: MockFixture) -> None:
+    """Verify that a cached scan is extended by only scanning for the shapes it's missing"""
+    uke_config.tuning = ("G", "C", "E", "A")
+    uke_config.max_difficulty = 15
+    scan_chords(uke_config, ChordCollection(), max_fret=5)
+    uke_config.max_difficulty = 25
+    spy = mocker.spy(theory, "get_shape_records")
+    chord_shapes = ChordCollection()
+    scan_chords(uke_config, chord_shapes, max_fret=7)
+    assert spy.call_args.args[0].scanned == (5, 15)
+    assert not os.path.exists(_cached_filename(uke_config, 5, 15))
+    assert os.path.exists(_cached_filename(uke_config, 7, 25))
+    uke_config.no_cache = True
+    expected = ChordCollection()
+    scan_chords(uke_config, expected, max_fret=7)
+    assert {chord: sorted(chord_shapes[chord]) for chord in chord_shapes} == {
+        chord: sorted(expected[chord]) for chord in expected
+    }
+
+
+@pytest.mark.parametrize("numpy", [False, True])
+def test_extend_scan_skips_scanned(
+    uke_config: UkeConfig, numpy: bool, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Verify that extending a scan up the neck doesn't enumerate the shapes it already found"""
+    if numpy:
+        pytest.importorskip("ukechords.theory_numpy")
+    else:
+        monkeypatch.setattr(scan, "theory_numpy", None)
+    uke_config.tuning = ("G", "C", "E", "A")
+    enumerated = {}
+    for max_fret, scanned in [(5, None), (7, None), (7, (5, uke_config.max_difficulty))]:
+        with collect_stats() as stats:
+            shapes = list(get_shapes(uke_config, max_fret, scanned=scanned))
+        enumerated[max_fret, scanned] = shapes, stats["counts"]["shapes_enumerated"]
+    (lower, lower_count), (full, full_count) = enumerated[5, None], enumerated[7, None]
+    extended, extended_count = enumerated[7, (5, uke_config.max_difficulty)]
+    assert sorted(extended) == sorted(set(full) - set(lower))
+    assert extended_count <= full_count - lower_count
+
+
+@pytest.mark.parametrize("max_difficulty", [5.0, 12.5, 29.0, 60.0])
+def test_pruned_shapes(
+    uke_config: UkeConfig, max_difficulty: float, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Verify that pruning partial shapes by difficulty never drops a playable shape"""
+    monkeypatch.setattr(scan, "theory_numpy", None)
+    uke_config.tuning = ("G", "C", "E", "A")
+    uke_config.mute = True
+    uke_config.max_difficulty = max_difficulty
+    expected = [
+        shape
+        for shape in product(range(-1, 8), repeat=4)
+        if max(shape) >= 0 and _get_shape_difficulty(shape)[0] <= max_difficulty
+    ]
+    assert list(get_shapes(uke_config, 7)) == expected
+
+
+@pytest.mark.parametrize("chunks", [1, 6, 40])
+@pytest.mark.parametrize("notes", [None, ("C", "E", "G")])
+def test_scan_chunks(uke_config: UkeConfig, chunks: int, notes: tuple[str, ...] | None) -> None:
+    """Verify that splitting a scan into chunks covers every shape, in the same order"""
+    uke_config.tuning = ("G", "C", "E", "A")
+    uke_config.mute = True
+    uke_config.max_difficulty = 29.0
+    scan_chunks = get_scan_chunks(uke_config, 12, notes, chunks)
+    assert len(scan_chunks) == chunks
+    chunked = [
+        shape for c in scan_chunks for shape in get_shapes(uke_config, 12, notes, prefixes=c)
+    ]
+    assert chunked == list(get_shapes(uke_config, 12, notes))
+
+
+@pytest.mark.parametrize("executor", ["serial", "thread"])
+def test_scan_nothing(uke_config: UkeConfig, executor: str) -> None:
+    """Verify that a scan whose every position is too difficult finds no shapes"""
+    uke_config.max_difficulty = -1
+    uke_config.executor = executor
+    assert not get_scan_chunks(uke_config, 12, None, 6)
+    chord_shapes = ChordCollection()
+    scan_chords(uke_config, chord_shapes, max_fret=12)
+    assert not chord_shapes
+
+
+def test_shape_records(uke_config: UkeConfig) -> None:
+    """Verify that shapes packed into records merge back into chords, with their difficulties"""
     chord_shapes = ChordCollection()
+    records = get_shape_records(ScanArgs(uke_config, 5, _get_chord_masks()))
+    _merge_shape_records(chord_shapes, records, len(uke_config.tuning))
+    expected = ChordCollection()
+    for shape in get_shapes(uke_config, 5):
+        for chord in _get_chords_from_mask(get_shape_mask(shape, uke_config.tuning)):
+            if chord not in expected:
+                expected[chord] = []
+            expected[chord].append(shape)
+    assert chord_shapes == expected
+    for shapes in chord_shapes.values():
+        assert isinstance(shapes, ShapeList)
+        assert list(shapes.difficulties or []) == [_get_shape_difficulty(s)[0] for s in shapes]
+
+
+@pytest.mark.parametrize("ranker", [rank_shape_by_difficulty, rank_shape_by_high_fret])
+def test_scan_keeping_best_shapes(
+    uke_config: UkeConfig, ranker: Callable[[tuple[int, ...]], Any]
+) -> None:
+    """Verify that a scan keeping only the best shapes for each chord keeps those a sort would"""
+    uke_config.tuning = ("G", "C", "E", "A")
+    uke_config.mute = True
+    uke_config.shape_ranker = ranker
+    uke_config.executor = "thread"
+    best = ChordCollection()
+    scan_chords(uke_config, best, max_fret=7, keep=2)
+    assert not os.path.exists(_cached_filename(uke_config, 7, uke_config.max_difficulty))
+    expected = ChordCollection()
+    scan_chords(uke_config, expected, max_fret=7)
+    assert best.keys() == expected.keys()
+    for chord, shapes in best.items():
+        assert sorted(shapes, key=ranker) == sorted(expected[chord], key=ranker)[:2]
+    uke_config.num = 2
+    uke_config.max_fret = 7
+    uke_config.no_cache = True
+    unsorted = {chord: list(shapes) for chord, shapes in expected.items()}
+    assert show_all(uke_config) == show_all(uke_config, expected)
+    assert {chord: list(shapes) for chord, shapes in expected.items()} == unsorted
+
+
+@pytest.mark.parametrize("ranker", [rank_shape_by_difficulty, rank_shape_by_high_fret])
+def test_best_first_shapes(uke_config: UkeConfig, ranker: Callable[[tuple[int, ...]], Any]) -> None:
+    """Verify that a best-first search yields every shape, in order of rank"""
+    uke_config.tuning = ("G", "C", "E", "A")
+    uke_config.mute = True
+    uke_config.max_difficulty = 29.0
+    uke_config.shape_ranker = ranker
+    notes = ("C", "E", "G", "A#")
+    best_first = list(best_first_shapes(uke_config, 12, notes=notes))
+    scanned = list(get_shapes(uke_config, 12, notes=notes))
+    assert sorted(best_first) == sorted(scanned)
+    assert best_first == sorted(scanned, key=lambda shape: (ranker(shape), shape))
+
+
+@pytest.mark.parametrize("ranker", [rank_shape_by_difficulty, rank_shape_by_high_fret])
+def test_show_chord_best_first(
+    uke_config: UkeConfig, ranker: Callable[[tuple[int, ...]], Any], mocker: MockFixture
+) -> None:
+    """Verify that looking up the best few shapes for a chord avoids a full scan"""
+    uke_config.tuning = ("G", "C", "E", "A")
+    uke_config.max_difficulty = 40.0
+    uke_config.shape_ranker = ranker
+    all_shapes = show_chord(uke_config, "Bbm7")["shapes"]
+    assert len(all_shapes) > 3
+    scan_spy = mocker.spy(theory, "scan_chords")
+    uke_config.num = 3
+    best_shapes = show_chord(uke_config, "Bbm7")["shapes"]
+    scan_spy.assert_not_called()
+    assert len(best_shapes) == 3
+    assert [ranker(s["shape"]) for s in best_shapes] == [ranker(s["shape"]) for s in all_shapes[:3]]
+    assert best_shapes[0]["chord_names"][0] == "Bbm7"
+
+
+@pytest.mark.parametrize("executor", ["serial", "thread"])
+def test_scan_exception(uke_config: UkeConfig, mocker: MockFixture, executor: str) -> None:
+    """Verify that an exception raised while scanning is raised from the scan"""
+    uke_config.executor = executor
+    mocker.patch("ukechords.theory.get_shape_records", side_effect=ValueError())
     with pytest.raises(ValueError):
-        _scan_chords(uke_config, chord_shapes, max_fret=3)
-    mocked_pool_terminate.assert_called_once()
+        scan_chords(uke_config, ChordCollection(), max_fret=3)
+
+
+@pytest.mark.parametrize("executor", ["fork", "forkserver", "thread"])
+def test_scan_executors(uke_config: UkeConfig, executor: str) -> None:
+    """Verify that scans find the same shapes with each executor as serially"""
+    uke_config.no_cache = True
+    expected = ChordCollection()
+    scan_chords(uke_config, expected, max_fret=5)
+    uke_config.executor = executor
+    chord_shapes = ChordCollection()
+    scan_chords(uke_config, chord_shapes, max_fret=5)
+    assert chord_shapes == expected
+
+
+def test_shared_pool_scan(uke_config: UkeConfig, mocker: MockFixture) -> None:
+    """Verify that scans can share a long-running pool"""
+    uke_config.no_cache = True
+    expected = ChordCollection()
+    scan_chords(uke_config, expected, max_fret=5)
+    uke_config.executor = "thread"
+    create_pool = mocker.spy(pool, "_create_pool")
+    with shared_pool("thread"):
+        for _ in range(2):
+            chord_shapes = ChordCollection()
+            scan_chords(uke_config, chord_shapes, max_fret=5)
+            assert chord_shapes == expected
+    create_pool.assert_called_once()
+
+
+def _scanned_shapes(
+    chord_shapes: ChordCollection,
+) -> dict[str, tuple[list[tuple[int, ...]], bytes]]:
+    return {chord: (list(shapes), bytes(shapes.scores)) for chord, shapes in chord_shapes.items()}
+
+
+@pytest.mark.parametrize("keep", [None, 2])
+def test_scan_tunings(uke_config: UkeConfig, mocker: MockFixture, keep: int | None) -> None:
+    """Verify that scanning tunings together finds what scanning each would, in a pass per size"""
+    uke_config.max_fret = 7
+    tunings = [tuple("GCEA"), tuple("DGBE"), tuple("GDAE"), ("C", "E", "G")]
+    expected = {}
+    for tuning in tunings:
+        cache_dir = os.path.join(uke_config.cache_dir, "".join(tuning))
+        config = replace(uke_config, tuning=tuning, no_cache=True, cache_dir=cache_dir)
+        chord_shapes = ChordCollection()
+        scan_chords(config, chord_shapes, 7, keep=keep)
+        expected[tuning] = _scanned_shapes(chord_shapes)
+    spy = mocker.spy(scan, "_scan_shape_scores")
+    scanned = scan_tunings(uke_config, tunings, keep)
+    assert list(scanned) == tunings
+    assert {tuning: _scanned_shapes(shapes) for tuning, shapes in scanned.items()} == expected
+    assert spy.call_count == 2
+    assert len(list(pathlib.Path(uke_config.cache_dir).glob("*.ukc"))) == (3 if keep is None else 0)
+    spy.reset_mock()
+    scanned = scan_tunings(uke_config, tunings[::-1], keep)
+    assert {tuning: _scanned_shapes(shapes) for tuning, shapes in scanned.items()} == expected
+    assert spy.call_count == (0 if keep is None else 2)
+
+
+def test_compare_tunings(uke_config: UkeConfig) -> None:
+    """Verify that tunings are compared by the easiest shapes they play chords with"""
+    tunings = [tuple("DGBE"), tuple("GCEA"), ("C", "E", "G")]
+    output = compare_tunings(uke_config, tunings, ["C", "G", "Am", "G7"])
+    assert output["chords"] == ["C", "G", "Am", "G7"]
+    ranks = [(-summary["playable"], summary["difficulty"]) for summary in output["tunings"]]
+    assert ranks == sorted(ranks)
+    assert output["tunings"][-1]["tuning"] == ("C", "E", "G")
+    for summary in output["tunings"]:
+        config = replace(uke_config, tuning=summary["tuning"], num=1)
+        for chord, shape in zip(output["chords"], summary["shapes"]):
+            assert [shape] == show_chord(config, chord)["shapes"] or shape is None
+        playable = [shape for shape in summary["shapes"] if shape]
+        assert summary["playable"] == len(playable)
+        assert summary["difficulty"] == sum(shape["difficulty"] for shape in playable)
+    assert output["tunings"][-1]["playable"] < 4
+    with pytest.raises(ChordNotFoundException):
+        compare_tunings(uke_config, tunings, ["C", "Cfoo"])
 
 
 def test_show_chord(uke_config: UkeConfig) -> None:
@@ -102,6 +389,61 @@ def test_show_chord(uke_config: UkeConfig) -> None:
     assert output["notes"] == ("C#", "F", "G#")
 
 
+@pytest.mark.parametrize("full_scan", [False, True])
+def test_show_chord_cached(uke_config: UkeConfig, mocker: MockFixture, full_scan: bool) -> None:
+    """Verify that chord lookups are served from a full scan's cache, or their own"""
+    uke_config.tuning = ("G", "C", "E", "A")
+    if full_scan:
+        scan_chords(uke_config, ChordCollection())
+    expected = show_chord(uke_config, "Am7")
+    assert expected["shapes"]
+    chord_cache = _cached_filename(uke_config, 12, 20, notes_to_mask(["C", "E", "G", "A"]))
+    assert os.path.exists(chord_cache) != full_scan
+    spy = mocker.spy(theory, "get_shape_records")
+    assert show_chord(uke_config, "C6") == show_chord(uke_config, "C6")
+    assert show_chord(uke_config, "Am7") == expected
+    spy.assert_not_called()
+
+
+def test_show_transposed_cached(uke_config: UkeConfig, mocker: MockFixture) -> None:
+    """Verify that a tuning is answered from the cache of a transposition of it"""
+    uke_config.tuning = ("D", "G", "B", "E")
+    uke_config.keys = ["G"]
+    uke_config.num = 2
+    fresh = replace(uke_config, cache_dir=os.path.join(uke_config.cache_dir, "fresh"))
+    expected = show_chord(fresh, "Em7"), show_all(fresh)
+    uke_config.tuning = ("G", "C", "E", "A")
+    scan_chords(uke_config, ChordCollection())
+    uke_config.tuning = ("D", "G", "B", "E")
+    spy = mocker.spy(theory, "get_shape_records")
+    assert (show_chord(uke_config, "Em7"), show_all(uke_config)) == expected
+    spy.assert_not_called()
+
+
+def test_show_cached_scores(uke_config: UkeConfig, mocker: MockFixture) -> None:
+    """Verify that shapes shown from a cache reuse the difficulty and barre data saved with them"""
+    uke_config.tuning = ("G", "C", "E", "A")
+    uke_config.keys = ["F"]
+    uke_config.num = 3
+    scan_chords(uke_config, ChordCollection())
+    expected = show_chord(uke_config, "F"), show_all(uke_config)
+    assert any(shape["barre_data"] for shape in expected[1]["shapes"])
+    spy = mocker.spy(scan, "_barreless_shape_difficulty")
+    assert (show_chord(uke_config, "F"), show_all(uke_config)) == expected
+    spy.assert_not_called()
+
+
+def test_show_chord_other_names(uke_config: UkeConfig) -> None:
+    """Verify that other names are only reported for shapes that don't double up notes"""
+    uke_config.num = 1
+    uke_config.tuning = ("G", "C", "E", "A")
+    assert show_chord(uke_config, "C6")["shapes"][0]["chord_names"] == ["C6", "Am7"]
+    uke_config.tuning = ("E", "A", "D", "G", "B", "E")
+    output = show_chord(uke_config, "Am7")
+    assert output["shapes"][0]["shape"] == (0, 0, 2, 0, 1, 0)
+    assert output["shapes"][0]["chord_names"] == ["Am7"]
+
+
 def test_show_chord_by_sharp_notes(uke_config: UkeConfig) -> None:
     """Verify that looking up a chord by sharp notes works"""
     output = show_chords_by_notes(uke_config, {"C#", "F", "G#"})
@@ -317,3 +659,29 @@ def test_allowed_chords(uke_config: UkeConfig) -> None:
     assert not [shape for shape in c_data["shapes"] if extra_chord in shape["chord_names"]]
     assert not [shape for shape in g_data["shapes"] if extra_chord in shape["chord_names"]]
     assert [shape for shape in both_data["shapes"] if extra_chord in shape["chord_names"]]
+
+
+def test_chord_table() -> None:
+    """Verify that chords are identified by their set of pitch classes"""
+    table = _build_chord_table()
+    assert len(table["sharp"]) == len(table["flat"]) == 4096
+    assert table["sharp"][notes_to_mask(["C", "E", "G"])] == ["C"]
+    assert table["flat"][notes_to_mask(["C#", "F", "G#"])] == ["Db"]
+    assert "Am7" in table["sharp"][notes_to_mask(["C", "E", "G", "A"])]
+    assert not table["sharp"][0]
+
+
+def test_prepare_chord_table(
+    uke_config: UkeConfig, mocker: MockFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Verify that a chord table is built once, and then loaded from the cache"""
+    build = mocker.spy(theory, "_build_chord_table")
+    load = mocker.spy(theory, "load_chord_table")
+    monkeypatch.setattr(theory, "_chord_tables", {})
+    prepare_chord_table(uke_config)
+    monkeypatch.setattr(theory, "_chord_tables", {})
+    prepare_chord_table(uke_config)
+    prepare_chord_table(uke_config)
+    build.assert_called_once()
+    assert load.call_count == 2
+    assert _get_chords_from_mask(notes_to_mask(["C", "E", "G"])) == ["C"]
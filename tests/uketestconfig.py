@@ -11,5 +11,7 @@ from ukechords.config import UkeConfig
 @pytest.fixture
 def uke_config(tmp_path: pathlib.Path) -> Iterable[UkeConfig]:
     """Pytest fixture to provide a UkeConfig object"""
-    config_obj = UkeConfig(cache_dir=str(tmp_path), tuning=("C", "E", "G"), max_difficulty=20.0)
+    config_obj = UkeConfig(
+        cache_dir=str(tmp_path), tuning=("C", "E", "G"), max_difficulty=20.0, executor="serial"
+    )
     yield config_obj